@@ -63,7 +63,7 @@ class CartItemAdmin(admin.ModelAdmin):
 
 @admin.register(TasteProfile)
 class TasteProfileAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "preferred_product_types", "preferred_finish_types")
+    list_display = ("id", "user", "product_types_mask", "finish_types_mask")
     filter_horizontal = ("preferred_colors",)
 
 @admin.register(Payment)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SkinlyConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "skinly"
+
+    def ready(self):
+        from .inventory import signals as inventory_signals  # noqa: F401
+        from .recommendations import signals as recommendation_signals  # noqa: F401
+        from .search import signals  # noqa: F401
@@ -0,0 +1,23 @@
+"""
+Catalog snapshot package for Skinly application
+"""
+
+from .snapshot import (
+    CatalogSnapshot,
+    get_catalog_snapshot,
+    in_stock_products,
+    listing_ids,
+    read_catalog_columns,
+    snapshot_columns,
+    write_snapshot,
+)
+
+__all__ = [
+    'CatalogSnapshot',
+    'get_catalog_snapshot',
+    'in_stock_products',
+    'listing_ids',
+    'read_catalog_columns',
+    'snapshot_columns',
+    'write_snapshot',
+]
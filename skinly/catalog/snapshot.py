@@ -0,0 +1,304 @@
+"""
+Memory-mapped columnar snapshot of the product catalog
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from ..models.choices import FinishType, ProductType, SkinType
+
+# column -> (dtype, model field)
+COLUMNS = {
+    "id": (np.int64, "id"),
+    "price_cents": (np.int64, "price"),
+    "stock": (np.int32, "stock_quantity"),
+    "product_type": (np.int8, "product_type"),
+    "finish_type": (np.int8, "finish_type"),
+    "skin_type": (np.int8, "skin_type_compatibility"),
+    "brand_id": (np.int64, "brand_id"),
+    "color_id": (np.int64, "color_id"),
+    "rating": (np.float32, "rating"),
+}
+
+# Catalog sort fields the snapshot can order by -> column
+SORT_COLUMNS = {
+    "id": "id",
+    "price": "price_cents",
+    "rating": "rating",
+}
+
+# Choice columns are stored as small integer codes; 0 means empty / unknown
+CODES = {
+    "product_type": list(ProductType.values),
+    "finish_type": list(FinishType.values),
+    "skin_type": list(SkinType.values),
+}
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+
+def _encode(column, value):
+    if column in CODES:
+        try:
+            return CODES[column].index(value) + 1
+        except ValueError:
+            return 0
+    if column == "price_cents":
+        return int(round(value * 100))
+    return value
+
+
+class CatalogSnapshot:
+    """
+    One version of the catalog as read-only memory-mapped NumPy columns.
+    Every worker that maps the same version shares its pages through the
+    OS page cache; filters are vectorized masks over the columns.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_FILE) as manifest:
+            self.manifest = json.load(manifest)
+        self.version = self.manifest["version"]
+        self.codes = self.manifest["codes"]
+        self.columns = {
+            column: np.load(self.path / f"{column}.npy", mmap_mode="r")
+            for column in self.manifest["columns"]
+        }
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def code(self, column, value):
+        """Integer code of a choice value in this snapshot (0 if unknown)"""
+        try:
+            return self.codes[column].index(value) + 1
+        except ValueError:
+            return 0
+
+    def mask(self, in_stock=True, brand=None, product_type=None, finish_type=None,
+             skin_type=None, min_price=None, max_price=None, columns=None):
+        """
+        Boolean row mask for the same filters the catalog page offers, over
+        ``columns`` (this snapshot's by default). Products without a skin
+        type stay compatible with every skin type.
+        """
+        columns = self.columns if columns is None else columns
+        mask = np.ones(len(columns["id"]), dtype=bool)
+        if in_stock:
+            mask &= columns["stock"] > 0
+        if brand:
+            mask &= columns["brand_id"] == int(brand)
+        if product_type:
+            mask &= columns["product_type"] == self.code("product_type", product_type)
+        if finish_type:
+            mask &= columns["finish_type"] == self.code("finish_type", finish_type)
+        if skin_type:
+            skin_types = columns["skin_type"]
+            mask &= (skin_types == 0) | (skin_types == self.code("skin_type", skin_type))
+        if min_price is not None:
+            mask &= columns["price_cents"] >= int(round(float(min_price) * 100))
+        if max_price is not None:
+            mask &= columns["price_cents"] <= int(round(float(max_price) * 100))
+        return mask
+
+    def filter(self, limit=None, **filters):
+        """Product ids passing ``mask(**filters)``, in id order"""
+        ids = self.columns["id"][self.mask(**filters)]
+        if limit is not None:
+            ids = ids[:limit]
+        return ids.tolist()
+
+
+def snapshot_root():
+    return Path(getattr(settings, "CATALOG_SNAPSHOT_DIR", Path(settings.BASE_DIR) / "var" / "catalog"))
+
+
+def current_version(root=None):
+    try:
+        return (Path(root or snapshot_root()) / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_catalog_columns(after_id=None):
+    """Every product (with an id above ``after_id``, if given) as NumPy columns, ordered by id (one query)"""
+    from skinly.models import Product
+
+    fields = [field for _, field in COLUMNS.values()]
+    products = Product.objects.order_by("id")
+    if after_id is not None:
+        products = products.filter(id__gt=after_id)
+    rows = list(products.values_list(*fields))
+    columns = {}
+    for position, (column, (dtype, _)) in enumerate(COLUMNS.items()):
+        columns[column] = np.fromiter(
+            (_encode(column, row[position]) for row in rows), dtype=dtype, count=len(rows)
+        )
+    return columns
+
+
+def snapshot_columns(snapshot):
+    """The snapshot's columns plus the products added since it was written"""
+    columns = snapshot.columns
+    last_id = int(columns["id"][-1]) if len(columns["id"]) else 0
+    added = read_catalog_columns(after_id=last_id)
+    if not len(added["id"]):
+        return columns
+    return {column: np.concatenate([values, added[column]]) for column, values in columns.items()}
+
+
+def write_snapshot(root=None, columns=None, keep=3):
+    """
+    Write ``columns`` (the live catalog by default) as a new snapshot version
+    and atomically point CURRENT at it. Returns the new version, or None when
+    the catalog is unchanged since the current version.
+    """
+    root = Path(root or snapshot_root())
+    root.mkdir(parents=True, exist_ok=True)
+    if columns is None:
+        columns = read_catalog_columns()
+
+    previous = current_version(root)
+    if previous and _unchanged(root / previous, columns):
+        return None
+
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    staging = root / f".{version}"
+    staging.mkdir()
+    for column, values in columns.items():
+        np.save(staging / f"{column}.npy", values)
+    with open(staging / MANIFEST_FILE, "w") as manifest:
+        json.dump({
+            "version": version,
+            "created": time.time(),
+            "rows": len(columns["id"]),
+            "columns": list(columns),
+            "codes": CODES,
+        }, manifest)
+    os.rename(staging, root / version)
+
+    pointer = root / f".{CURRENT_FILE}.{version}"
+    pointer.write_text(version)
+    os.replace(pointer, root / CURRENT_FILE)
+
+    _prune(root, keep, version)
+    return version
+
+
+def _unchanged(path, columns):
+    try:
+        snapshot = CatalogSnapshot(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return False
+    if snapshot.codes != CODES or list(snapshot.columns) != list(columns):
+        return False
+    return all(np.array_equal(snapshot[column], values) for column, values in columns.items())
+
+
+def _prune(root, keep, current):
+    # Workers still mapping a removed version keep reading it until they
+    # swap; on POSIX the unlinked files stay valid while mapped
+    versions = sorted(
+        (path for path in root.iterdir()
+         if path.is_dir() and not path.name.startswith(".") and path.name != current),
+        key=lambda path: path.stat().st_mtime_ns,
+    )
+    for path in versions[:max(len(versions) - keep + 1, 0)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# Seconds between checks of the CURRENT pointer
+CHECK_INTERVAL = 1.0
+
+_snapshot = None
+_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_catalog_snapshot():
+    """
+    The current snapshot for this process, or None if none has been built.
+    The CURRENT pointer is re-read at most every CHECK_INTERVAL seconds and
+    a new version is mapped in place of the old one when it changes.
+    """
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CHECK_INTERVAL:
+        return _snapshot
+
+    with _snapshot_lock:
+        if now - _checked_at >= CHECK_INTERVAL:
+            root = snapshot_root()
+            version = current_version(root)
+            if version is None:
+                _snapshot = None
+            elif _snapshot is None or _snapshot.version != version:
+                try:
+                    _snapshot = CatalogSnapshot(root / version)
+                except FileNotFoundError:
+                    _snapshot = None
+            _checked_at = now
+        return _snapshot
+
+
+def listing_ids(ordering, **filters):
+    """
+    Ids of the in-stock products passing the catalog ``filters`` (blank
+    ones ignored), sorted by ``ordering`` (fields as in
+    CATALOG_ORDERINGS), from the mapped snapshot plus the products added
+    since it was written. Stock changes with every order, so it is read
+    from the database instead, as one id-only query. None when there is
+    no snapshot, it cannot sort by one of the fields or a filter value is
+    malformed, so the caller queries the database instead.
+    """
+    from skinly.models import Product
+
+    snapshot = get_catalog_snapshot()
+    if snapshot is None or any(field.lstrip("-") not in SORT_COLUMNS for field in ordering):
+        return None
+    columns = snapshot_columns(snapshot)
+    try:
+        mask = snapshot.mask(
+            in_stock=False, columns=columns, **{name: value for name, value in filters.items() if value}
+        )
+    except ValueError:
+        return None
+    in_stock = Product.objects.filter(stock_quantity__gt=0).values_list("id", flat=True)
+    mask &= np.isin(columns["id"], np.fromiter(in_stock.iterator(chunk_size=10000), dtype=np.int64))
+    # lexsort sorts by its last key first
+    keys = []
+    for field in reversed(ordering):
+        values = np.asarray(columns[SORT_COLUMNS[field.lstrip("-")]])[mask]
+        keys.append(-values if field.startswith("-") else values)
+    return np.asarray(columns["id"])[mask][np.lexsort(keys)]
+
+
+def in_stock_products(limit):
+    """
+    The first ``limit`` in-stock products by id. Ids come from the snapshot
+    when one is mapped and only those rows are fetched; stock is re-checked
+    on the fetched rows since the snapshot may lag behind orders.
+    """
+    from skinly.models import Product
+    from skinly.search import hydrate_products
+
+    snapshot = get_catalog_snapshot()
+    if snapshot is None:
+        return list(
+            Product.objects.filter(stock_quantity__gt=0).select_related("brand", "color").order_by("id")[:limit]
+        )
+
+    products = hydrate_products(snapshot.filter(limit=limit * 2))
+    return [product for product in products if product.stock_quantity > 0][:limit]
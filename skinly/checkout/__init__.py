@@ -0,0 +1,15 @@
+"""
+Checkout package for Skinly application
+"""
+
+from .service import (
+    EmptyCart,
+    order_totals,
+    place_order,
+)
+
+__all__ = [
+    'EmptyCart',
+    'order_totals',
+    'place_order',
+]
@@ -0,0 +1,67 @@
+"""
+Place an order from a cart in one transaction with a constant number of queries
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from ..inventory import decrement_stock, release, reserve
+from ..models.choices import OrderStatus
+
+FREE_SHIPPING_FROM = Decimal("50.00")
+SHIPPING_FEE = Decimal("5.99")
+TAX_RATE = Decimal("0.08")
+
+
+class EmptyCart(Exception):
+    """Raised when checking out a cart with no items"""
+
+
+def order_totals(cart_items):
+    """(subtotal, shipping, tax, total) for a list of cart items"""
+    subtotal = sum((item.product.price * item.quantity for item in cart_items), Decimal("0.00"))
+    shipping = Decimal("0.00") if subtotal >= FREE_SHIPPING_FROM else SHIPPING_FEE
+    tax = subtotal * TAX_RATE
+    return subtotal, shipping, tax, subtotal + shipping + tax
+
+
+def place_order(user, payment_method):
+    """
+    Turn the user's cart into an order: make sure the cart holds its items
+    (see skinly.inventory.reservations), decrement stock for every product
+    with one conditional UPDATE and release the holds, insert the order, its
+    payment and all its items, and empty the cart, all in one transaction
+    and in the same number of queries whatever the cart size. Raises
+    EmptyCart, or InsufficientStock without changing anything.
+    """
+    from skinly.models import Cart, CartItem, Order, OrderItem, Payment
+    from skinly.recommendations import record_event
+
+    with transaction.atomic():
+        cart_items = list(CartItem.objects.filter(cart__user=user).select_related("product"))
+        if not cart_items:
+            raise EmptyCart("Your cart is empty")
+
+        quantities = {}
+        for item in cart_items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        # Stock other checkouts hold is not ours to sell
+        cart = Cart(pk=cart_items[0].cart_id, user=user)
+        reserve(cart, quantities)
+        decrement_stock(quantities)
+        release(cart)
+
+        total = order_totals(cart_items)[3]
+        order = Order.objects.create(user=user, total_price=total, status=OrderStatus.PENDING)
+        Payment.objects.create(order=order, amount=total, payment_method=payment_method, status="PENDING")
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
+            for item in cart_items
+        ])
+        CartItem.objects.filter(id__in=[item.pk for item in cart_items]).delete()
+
+        # bulk_create sends no post_save, so count the order towards trending here
+        transaction.on_commit(lambda: [
+            record_event(product_id, "order", quantity) for product_id, quantity in quantities.items()
+        ])
+    return order
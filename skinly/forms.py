@@ -133,21 +133,19 @@ class TasteProfileForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.pk:
-            # Pre-populate the multiple choice fields
-            if self.instance.preferred_product_types:
-                self.initial['preferred_product_types'] = self.instance.preferred_product_types.split(',')
-            if self.instance.preferred_finish_types:
-                self.initial['preferred_finish_types'] = self.instance.preferred_finish_types.split(',')
+            # Pre-populate the multiple choice fields from the bitmasks
+            self.initial['preferred_product_types'] = self.instance.preferred_product_types
+            self.initial['preferred_finish_types'] = self.instance.preferred_finish_types
     
     def save(self, commit=True):
         instance = super().save(commit=False)
         
-        # Handle the comma-separated fields
+        # Stored as bitmasks
         if 'preferred_product_types' in self.cleaned_data:
-            instance.preferred_product_types = ','.join(self.cleaned_data['preferred_product_types'])
+            instance.preferred_product_types = self.cleaned_data['preferred_product_types']
         
         if 'preferred_finish_types' in self.cleaned_data:
-            instance.preferred_finish_types = ','.join(self.cleaned_data['preferred_finish_types'])
+            instance.preferred_finish_types = self.cleaned_data['preferred_finish_types']
         
         if commit:
             instance.save()
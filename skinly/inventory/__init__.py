@@ -0,0 +1,57 @@
+"""
+Inventory package for Skinly application
+"""
+
+from .stock import (
+    InsufficientStock,
+    decrement_stock,
+)
+from .reservations import (
+    HOLD_SECONDS,
+    available_to_sell,
+    release,
+    release_expired,
+    reserve,
+)
+from .ledger import (
+    compact_ledger,
+    ledger_levels,
+    reconcile,
+    record_movements,
+)
+from .shards import (
+    current_stock,
+    shard_stock,
+    sharded,
+    stock_levels,
+    sync_sharded_stock,
+    unshard_stock,
+)
+from .sync import (
+    InvalidFeed,
+    read_feed,
+    sync_inventory,
+)
+
+__all__ = [
+    'InsufficientStock',
+    'decrement_stock',
+    'HOLD_SECONDS',
+    'available_to_sell',
+    'release',
+    'release_expired',
+    'reserve',
+    'compact_ledger',
+    'ledger_levels',
+    'reconcile',
+    'record_movements',
+    'current_stock',
+    'shard_stock',
+    'sharded',
+    'stock_levels',
+    'sync_sharded_stock',
+    'unshard_stock',
+    'InvalidFeed',
+    'read_feed',
+    'sync_inventory',
+]
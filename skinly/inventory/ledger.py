@@ -0,0 +1,142 @@
+"""
+Append-only stock ledger, compacted into periodic snapshots
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .shards import current_stock
+
+# Movements per INSERT
+LEDGER_BATCH = 1000
+
+# Products snapshotted per transaction by the compaction job
+COMPACT_BATCH = 2000
+
+# Movements younger than this are left for the next compaction: ids are
+# handed out before commit, so a newer id can become visible before an
+# older one, but no transaction stays open this long
+COMPACT_LAG = 60
+
+
+def record_movements(changes, reason):
+    """
+    Append {product id: signed quantity} to the ledger with batched INSERTs.
+    Call it in the transaction that changes the stock counters, so the two
+    commit together.
+    """
+    from skinly.models import StockMovement
+
+    movements = [
+        StockMovement(product_id=product_id, quantity=quantity, reason=reason)
+        for product_id, quantity in changes.items() if quantity
+    ]
+    StockMovement.objects.bulk_create(movements, batch_size=LEDGER_BATCH)
+    return len(movements)
+
+
+def _latest_snapshot(field):
+    from skinly.models import StockSnapshot
+
+    return Subquery(
+        StockSnapshot.objects.filter(product_id=OuterRef("pk")).order_by("-movement_id").values(field)[:1]
+    )
+
+
+def _moved(after, upto=None, aggregate=Sum):
+    """Sum (or max id) of the product's movements with after < id <= upto"""
+    from skinly.models import StockMovement
+
+    movements = StockMovement.objects.filter(product_id=OuterRef("pk"), id__gt=after)
+    if upto is not None:
+        movements = movements.filter(id__lte=upto)
+    field = "quantity" if aggregate is Sum else "id"
+    return Subquery(movements.values("product_id").annotate(value=aggregate(field)).values("value")[:1])
+
+
+def ledger_levels(product_ids):
+    """
+    {product id: stock} from the ledger in one query: each product's latest
+    snapshot plus the movements after it, both read through an index.
+    Products never snapshotted are left out.
+    """
+    from skinly.models import Product
+
+    rows = Product.objects.filter(id__in=list(product_ids)).annotate(
+        snapshot=_latest_snapshot("quantity"),
+        since=_latest_snapshot("movement_id"),
+    ).annotate(
+        moved=Coalesce(_moved(OuterRef("since")), Value(0)),
+    ).values_list("id", "snapshot", "moved")
+    return {product_id: snapshot + moved for product_id, snapshot, moved in rows if snapshot is not None}
+
+
+def compact_ledger(lag=COMPACT_LAG, batch_size=COMPACT_BATCH, prune_before=None):
+    """
+    Roll movements older than ``lag`` seconds into a new snapshot for each
+    product that moved since its last one. A product without snapshots is
+    opened from its stock counter, less the movements still too young to
+    fold. Movements already folded and older than ``prune_before`` are
+    deleted. Returns (snapshots written, movements pruned).
+    """
+    from skinly.models import Product, StockMovement, StockSnapshot
+
+    upto = StockMovement.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=lag)
+    ).aggregate(upto=Max("id"))["upto"] or 0
+
+    written, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            # One statement per batch, so each counter is read together with its movements
+            rows = list(
+                Product.objects.filter(id__gt=last_id).order_by("id").annotate(
+                    snapshot=_latest_snapshot("quantity"),
+                    since=_latest_snapshot("movement_id"),
+                    stock=current_stock(),
+                    pending=Coalesce(_moved(upto), Value(0)),
+                ).annotate(
+                    moved=Coalesce(_moved(OuterRef("since"), upto), Value(0)),
+                    last_moved=_moved(OuterRef("since"), upto, Max),
+                ).values_list("id", "snapshot", "moved", "last_moved", "stock", "pending")[:batch_size]
+            )
+            snapshots = []
+            for product_id, snapshot, moved, last_moved, stock, pending in rows:
+                if snapshot is None:
+                    snapshots.append(StockSnapshot(product_id=product_id, quantity=stock - pending, movement_id=upto))
+                elif last_moved is not None:
+                    snapshots.append(StockSnapshot(product_id=product_id, quantity=snapshot + moved, movement_id=upto))
+            StockSnapshot.objects.bulk_create(snapshots, batch_size=LEDGER_BATCH)
+        written += len(snapshots)
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1][0]
+
+    pruned = 0
+    if prune_before is not None:
+        # Every product's latest snapshot is at ``upto`` or has no movement after its own
+        pruned, _ = StockMovement.objects.filter(id__lte=upto, created_at__lt=prune_before).delete()
+    return written, pruned
+
+
+def reconcile(product_ids=None):
+    """{product id: (ledger stock, counter stock)} for every product where the two disagree"""
+    from skinly.models import Product
+
+    from .shards import stock_levels
+
+    if product_ids is None:
+        product_ids = Product.objects.values_list("id", flat=True)
+    product_ids = list(product_ids)
+    drift = {}
+    for start in range(0, len(product_ids), COMPACT_BATCH):
+        batch = product_ids[start:start + COMPACT_BATCH]
+        ledger, counters = ledger_levels(batch), stock_levels(batch)
+        drift.update(
+            (product_id, (level, counters.get(product_id, 0)))
+            for product_id, level in ledger.items() if level != counters.get(product_id, 0)
+        )
+    return drift
@@ -0,0 +1,230 @@
+"""
+Checkout holds: stock set aside for a cart for a few minutes while it checks out
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .shards import current_stock, sharded
+from .stock import InsufficientStock, _per_product, _Shortfall
+
+# How long a cart's holds last after it opens the checkout page
+HOLD_SECONDS = 15 * 60
+
+# Expired holds released per transaction by the sweeper
+SWEEP_BATCH = 1000
+
+
+def held_units():
+    """
+    Expression for the units of a product held by checkouts: its reserved
+    counter, or for a sharded product, which has none, the sum of its holds
+    """
+    from skinly.models import StockHold, StockShard
+
+    holds = StockHold.objects.filter(product_id=OuterRef("pk")).values("product_id").annotate(
+        total=Sum("quantity")
+    ).values("total")[:1]
+    return Case(
+        When(Exists(StockShard.objects.filter(product_id=OuterRef("pk"), shard=0)), then=Coalesce(Subquery(holds), Value(0))),
+        default=Coalesce("reservation__reserved", Value(0)),
+    )
+
+
+def available_to_sell(product_ids, cart=None):
+    """
+    {product id: stock minus held units} in one query. Units held by
+    ``cart`` itself count as available to it.
+    """
+    from skinly.models import Product, StockHold
+
+    product_ids = list(product_ids)
+    rows = Product.objects.filter(id__in=product_ids).annotate(
+        stock=current_stock(), held=held_units()
+    ).values_list("id", "stock", "held")
+    own = {}
+    if cart is not None:
+        own = dict(StockHold.objects.filter(cart=cart, product_id__in=product_ids).values_list("product_id", "quantity"))
+    return {
+        product_id: max(stock - held + own.get(product_id, 0), 0)
+        for product_id, stock, held in rows
+    }
+
+
+def _hold_more(quantities):
+    """
+    Add ``quantities`` to the reserved counters with one conditional UPDATE:
+    reserved = reserved + q WHERE reserved + q <= stock. All or nothing.
+    """
+    from skinly.models import Product, StockReservation
+
+    wanted = _per_product(quantities, "product_id")
+    stock = current_stock(
+        "product_id", Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("stock_quantity")[:1])
+    )
+    with transaction.atomic():
+        updated = StockReservation.objects.filter(
+            product_id__in=list(quantities), reserved__lte=stock - wanted
+        ).update(reserved=F("reserved") + wanted)
+        if updated != len(quantities):
+            raise _Shortfall
+
+
+def _hold_less(quantities):
+    from skinly.models import StockReservation
+
+    if quantities:
+        released = _per_product(quantities, "product_id")
+        StockReservation.objects.filter(product_id__in=list(quantities)).update(
+            reserved=Greatest(F("reserved") - released, Value(0))
+        )
+
+
+def reserve(cart, quantities, seconds=HOLD_SECONDS):
+    """
+    Hold ``quantities`` ({product id: quantity}) for ``cart`` until
+    ``seconds`` from now, replacing the cart's current holds. Only the
+    difference to what the cart already holds touches the per-product
+    counters, in one conditional UPDATE, so concurrent checkouts of the
+    same product contend on one small row for one statement. Sharded
+    products have no counter, so their checkouts share no row: their holds
+    are checked against the sum of the other carts' holds, read without a
+    lock, so two checkouts racing for the last units may both
+    get them held and the shard decrement decides the sale. Either every
+    hold is taken or none is: InsufficientStock lists the products that
+    fell short. Returns the expiry time.
+    """
+    from skinly.models import Cart, StockHold, StockReservation
+
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    expires_at = timezone.now() + timedelta(seconds=seconds)
+    with transaction.atomic():
+        # One checkout per cart at a time; the sweeper skips locked holds
+        list(Cart.objects.select_for_update().filter(pk=cart.pk).values_list("pk"))
+        held = dict(
+            StockHold.objects.select_for_update().filter(cart=cart).values_list("product_id", "quantity")
+        )
+        more = {
+            product_id: quantity - held.get(product_id, 0)
+            for product_id, quantity in quantities.items() if quantity > held.get(product_id, 0)
+        }
+        less = {
+            product_id: quantity - quantities.get(product_id, 0)
+            for product_id, quantity in held.items() if quantity > quantities.get(product_id, 0)
+        }
+
+        in_shards = sharded(more) if more else set()
+        if in_shards:
+            if _short(in_shards, quantities, cart) and (
+                not release_expired(product_ids=list(in_shards)) or _short(in_shards, quantities, cart)
+            ):
+                _raise_shortage(quantities, cart)
+            more = {product_id: quantity for product_id, quantity in more.items() if product_id not in in_shards}
+        if more:
+            StockReservation.objects.bulk_create(
+                [StockReservation(product_id=product_id) for product_id in more], ignore_conflicts=True
+            )
+            try:
+                _hold_more(more)
+            except _Shortfall:
+                # Expired holds the sweeper has not reached yet may be in the way
+                if not release_expired(product_ids=list(more)):
+                    _raise_shortage(quantities, cart)
+                try:
+                    _hold_more(more)
+                except _Shortfall:
+                    _raise_shortage(quantities, cart)
+        # Sharded products have no counter row, so this leaves them alone
+        _hold_less(less)
+
+        StockHold.objects.filter(cart=cart).exclude(product_id__in=list(quantities)).delete()
+        StockHold.objects.bulk_create(
+            [
+                StockHold(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in quantities.items()
+            ],
+            update_conflicts=True, unique_fields=["cart", "product"], update_fields=["quantity", "expires_at"],
+        )
+    return expires_at
+
+
+def _short(product_ids, quantities, cart):
+    available = available_to_sell(product_ids, cart)
+    return any(available.get(product_id, 0) < quantities[product_id] for product_id in product_ids)
+
+
+def recount_reserved(product_ids):
+    """Set the reserved counters of ``product_ids`` to the sum of their holds, creating missing ones"""
+    from skinly.models import StockHold, StockReservation
+
+    held = dict(
+        StockHold.objects.filter(product_id__in=list(product_ids)).values("product_id").annotate(
+            total=Sum("quantity")
+        ).values_list("product_id", "total")
+    )
+    StockReservation.objects.bulk_create(
+        [StockReservation(product_id=product_id, reserved=held.get(product_id, 0)) for product_id in product_ids],
+        update_conflicts=True, unique_fields=["product"], update_fields=["reserved"],
+    )
+
+
+def _raise_shortage(quantities, cart):
+    available = available_to_sell(quantities, cart)
+    raise InsufficientStock({
+        product_id: (quantity, available.get(product_id, 0))
+        for product_id, quantity in quantities.items()
+        if available.get(product_id, 0) < quantity
+    })
+
+
+def release(cart):
+    """Drop every hold of ``cart``; returns the number of holds released"""
+    from skinly.models import StockHold
+
+    with transaction.atomic():
+        holds = list(
+            StockHold.objects.select_for_update().filter(cart=cart).values_list("id", "product_id", "quantity")
+        )
+        _drop(holds)
+    return len(holds)
+
+
+def _drop(holds):
+    from skinly.models import StockHold
+
+    if not holds:
+        return
+    released = {}
+    for _, product_id, quantity in holds:
+        released[product_id] = released.get(product_id, 0) + quantity
+    StockHold.objects.filter(id__in=[hold_id for hold_id, _, _ in holds]).delete()
+    _hold_less(released)
+
+
+def release_expired(now=None, product_ids=None, batch_size=SWEEP_BATCH):
+    """
+    Release holds that expired by ``now`` (of ``product_ids`` only, if
+    given), ``batch_size`` at a time: each batch is one DELETE and one
+    UPDATE of the counters it touches. Holds locked by a checkout in
+    progress are left for the next sweep. Returns the number released.
+    """
+    from skinly.models import StockHold
+
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = StockHold.objects.filter(expires_at__lte=now)
+            if product_ids is not None:
+                expired = expired.filter(product_id__in=product_ids)
+            holds = list(
+                expired.select_for_update(skip_locked=True).order_by("expires_at")
+                .values_list("id", "product_id", "quantity")[:batch_size]
+            )
+            _drop(holds)
+        released += len(holds)
+        if len(holds) < batch_size:
+            return released
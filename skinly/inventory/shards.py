@@ -0,0 +1,196 @@
+"""
+Sharded stock counters for products that sell too fast for one row
+"""
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .stock import _per_product, _Shortfall
+
+# Sub-counters per product when sharding is switched on for it, unless
+# settings.STOCK_SHARDS says otherwise
+STOCK_SHARDS = 8
+
+# Times a decrement spread over several shards is re-planned when another
+# sale emptied one of them first
+DECREMENT_ATTEMPTS = 3
+
+
+# Shards of each sharded product as last seen by this process. A stale
+# count only costs the fast path of decrement_shards, whose fallback reads
+# the shards and corrects it
+_shard_counts = {}
+
+
+def shard_count():
+    return getattr(settings, "STOCK_SHARDS", STOCK_SHARDS)
+
+
+def _shards_of(product_ids):
+    """{product id: number of shards}, from this process' counts or one query"""
+    from skinly.models import StockShard
+
+    missing = [product_id for product_id in product_ids if product_id not in _shard_counts]
+    if missing:
+        _shard_counts.update(
+            StockShard.objects.filter(product_id__in=missing).values("product_id").annotate(
+                count=Count("id")
+            ).values_list("product_id", "count")
+        )
+    return {product_id: _shard_counts.get(product_id, 0) for product_id in product_ids}
+
+
+def current_stock(ref="pk", fallback=None):
+    """
+    Expression for the stock of the product ``ref`` points at: the sum of
+    its shards if it has any, else ``fallback`` (its stock_quantity)
+    """
+    from skinly.models import StockShard
+
+    total = StockShard.objects.filter(product_id=OuterRef(ref)).values("product_id").annotate(
+        total=Sum("quantity")
+    ).values("total")[:1]
+    return Coalesce(Subquery(total), fallback if fallback is not None else F("stock_quantity"))
+
+
+def stock_levels(product_ids):
+    """{product id: stock} in one query, summing the shards of sharded products"""
+    from skinly.models import Product
+
+    return dict(
+        Product.objects.filter(id__in=list(product_ids)).annotate(stock=current_stock()).values_list("id", "stock")
+    )
+
+
+def sharded(product_ids):
+    """The subset of ``product_ids`` that keep their stock in shards"""
+    from skinly.models import StockShard
+
+    return set(
+        StockShard.objects.filter(product_id__in=list(product_ids), shard=0).values_list("product_id", flat=True)
+    )
+
+
+def _split(quantity, shards):
+    return [quantity // shards + (1 if shard < quantity % shards else 0) for shard in range(shards)]
+
+
+def shard_stock(product_ids, shards=None, quantities=None):
+    """
+    Spread the stock of ``product_ids`` (or ``quantities``, {product id:
+    new stock}) evenly over ``shards`` sub-counters each, replacing any
+    shards they had. Their reserved counters are dropped too, as holds of
+    sharded products are summed instead. Returns the number of products
+    sharded.
+    """
+    from skinly.models import Product, StockReservation, StockShard
+
+    shards = shards or shard_count()
+    with transaction.atomic():
+        levels = stock_levels(product_ids)
+        if quantities is not None:
+            levels = {product_id: quantities[product_id] for product_id in levels if product_id in quantities}
+        if not levels:
+            return 0
+        StockShard.objects.filter(product_id__in=list(levels)).delete()
+        StockShard.objects.bulk_create([
+            StockShard(product_id=product_id, shard=shard, quantity=quantity)
+            for product_id, stock in levels.items()
+            for shard, quantity in enumerate(_split(stock, shards))
+        ])
+        Product.objects.filter(id__in=list(levels)).update(stock_quantity=_per_product(levels))
+        StockReservation.objects.filter(product_id__in=list(levels)).delete()
+    for product_id in levels:
+        _shard_counts.pop(product_id, None)
+    return len(levels)
+
+
+def unshard_stock(product_ids):
+    """Move the stock of ``product_ids`` back into their product rows, and their holds into reserved counters"""
+    from skinly.models import Product, StockShard
+
+    from .reservations import recount_reserved
+
+    with transaction.atomic():
+        levels = stock_levels(sharded(product_ids))
+        if levels:
+            Product.objects.filter(id__in=list(levels)).update(stock_quantity=_per_product(levels))
+            StockShard.objects.filter(product_id__in=list(levels)).delete()
+            recount_reserved(list(levels))
+    for product_id in levels:
+        _shard_counts.pop(product_id, None)
+    return len(levels)
+
+
+def sync_sharded_stock():
+    """Copy every sharded product's total into stock_quantity for listings, in one UPDATE"""
+    from skinly.models import Product, StockShard
+
+    return Product.objects.filter(
+        id__in=StockShard.objects.filter(shard=0).values("product_id")
+    ).update(stock_quantity=current_stock())
+
+
+def _plan(shards, wanted, start):
+    """[(shard, units)] taking ``wanted`` units round from ``start``, or None if the shards hold less"""
+    plan = []
+    for offset in range(len(shards)):
+        shard, quantity = shards[(start + offset) % len(shards)]
+        take = min(quantity, wanted)
+        if take:
+            plan.append((shard, take))
+            wanted -= take
+        if not wanted:
+            return plan
+    return None
+
+
+def _take(product_id, plan):
+    from skinly.models import StockShard
+
+    for shard, take in plan:
+        updated = StockShard.objects.filter(
+            product_id=product_id, shard=shard, quantity__gte=take
+        ).update(quantity=F("quantity") - take)
+        if not updated:
+            return False
+    return True
+
+
+def decrement_shards(quantities):
+    """
+    Take ``quantities`` ({product id: quantity}) out of the products'
+    shards. Each product first tries one conditional UPDATE of a random
+    one of its shards, so concurrent sales of a product mostly touch
+    different rows; if that shard is short, the shards are read and the
+    quantity spread over them starting at a random one. Raises _Shortfall
+    when a product's shards hold less in total; call it inside a
+    transaction.
+    """
+    from skinly.models import StockShard
+
+    counts = _shards_of(quantities)
+    for product_id, wanted in quantities.items():
+        if counts[product_id] and _take(product_id, [(random.randrange(counts[product_id]), wanted)]):
+            continue
+        for _ in range(DECREMENT_ATTEMPTS):
+            rows = list(
+                StockShard.objects.filter(product_id=product_id).order_by("shard").values_list("shard", "quantity")
+            )
+            _shard_counts[product_id] = len(rows)
+            plan = _plan(rows, wanted, random.randrange(len(rows))) if rows else None
+            if plan is None:
+                raise _Shortfall
+            try:
+                with transaction.atomic():
+                    if not _take(product_id, plan):
+                        # Another sale emptied a shard first; undo and re-plan
+                        raise _Shortfall
+                break
+            except _Shortfall:
+                continue
+        else:
+            raise _Shortfall
@@ -0,0 +1,40 @@
+"""
+Record stock edits made with Product.save() in the stock ledger
+"""
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from skinly.models import Product, StockMovementReason
+
+from .ledger import record_movements
+from .shards import sharded
+
+# Set on the instance by pre_save: its stock before the save
+STOCK_BEFORE = "_ledger_stock_before"
+
+
+@receiver(pre_save, sender=Product, dispatch_uid="inventory_product_stock_before")
+def product_stock_before(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Sales, update_stock and the supplier sync write stock with
+    # queryset.update() and record their own movements; this catches the
+    # rest, such as an edit in the admin
+    if raw or (update_fields is not None and "stock_quantity" not in update_fields):
+        return
+    if instance._state.adding:
+        setattr(instance, STOCK_BEFORE, 0)
+        return
+    setattr(instance, STOCK_BEFORE, Product.objects.filter(pk=instance.pk).values_list(
+        "stock_quantity", flat=True
+    ).first())
+
+
+@receiver(post_save, sender=Product, dispatch_uid="inventory_product_stock_saved")
+def product_stock_saved(sender, instance, created, **kwargs):
+    before = instance.__dict__.pop(STOCK_BEFORE, None)
+    if before is None or before == instance.stock_quantity:
+        return
+    # A sharded product's stock lives in its shards; stock_quantity is only
+    # a copy, which sync_sharded_stock overwrites
+    if not created and sharded([instance.pk]):
+        return
+    record_movements({instance.pk: instance.stock_quantity - before}, StockMovementReason.ADJUSTMENT)
@@ -0,0 +1,95 @@
+"""
+Set-based stock changes
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+
+class InsufficientStock(Exception):
+    """Raised when a product cannot cover the requested quantity"""
+
+    def __init__(self, shortages):
+        # {product id: (requested, available)}
+        self.shortages = shortages
+        super().__init__(
+            "Not enough stock for product(s) " + ", ".join(str(product_id) for product_id in sorted(shortages))
+        )
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def _per_product(quantities, field="id"):
+    return Case(
+        *[When(**{field: product_id}, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def decrement_stock(quantities):
+    """
+    Take ``quantities`` ({product id: quantity}) out of stock with one
+    conditional UPDATE: stock = stock - q WHERE stock >= q for every product
+    at once. Products with sharded stock are taken from their shards
+    instead (see skinly.inventory.shards). The sales are appended to the
+    stock ledger with one INSERT. Either every product is
+    decremented or none is, and InsufficientStock lists the ones that fell
+    short. Run it inside the caller's transaction so the decrement commits
+    with the order. Returns the products that sold out.
+    """
+    from skinly.models import Product, StockMovementReason
+
+    from .ledger import record_movements
+    from .shards import decrement_shards, sharded, stock_levels
+
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return []
+
+    in_shards = sharded(quantities)
+    in_rows = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in in_shards}
+    try:
+        with transaction.atomic():
+            if in_rows:
+                wanted = _per_product(in_rows)
+                updated = Product.objects.filter(
+                    id__in=list(in_rows), stock_quantity__gte=wanted
+                ).update(stock_quantity=F("stock_quantity") - wanted)
+                if updated != len(in_rows):
+                    # Undo the rows that were decremented
+                    raise _Shortfall
+            if in_shards:
+                decrement_shards({product_id: quantities[product_id] for product_id in in_shards})
+    except _Shortfall:
+        available = stock_levels(quantities)
+        raise InsufficientStock({
+            product_id: (quantity, available.get(product_id, 0))
+            for product_id, quantity in quantities.items()
+            if available.get(product_id, 0) < quantity
+        })
+
+    record_movements({product_id: -quantity for product_id, quantity in quantities.items()}, StockMovementReason.SALE)
+
+    if in_shards:
+        # A sharded product's own row is only written when it sells out
+        emptied = [product_id for product_id, stock in stock_levels(in_shards).items() if stock == 0]
+        if emptied:
+            Product.objects.filter(id__in=emptied).update(stock_quantity=0)
+
+    sold_out = list(
+        Product.objects.filter(id__in=list(quantities), stock_quantity=0).select_related("brand", "color")
+    )
+    if sold_out:
+        transaction.on_commit(lambda: _after_stock_change(sold_out))
+    return sold_out
+
+
+def _after_stock_change(products):
+    # queryset.update() sends no post_save, so do what the Product signals would
+    from skinly.recommendations import notify_stock_out
+    from skinly.search.index import apply_index_change
+
+    if any(product.stock_quantity <= 0 for product in products):
+        notify_stock_out()
+    apply_index_change(lambda index: [index.add_product(product) for product in products])
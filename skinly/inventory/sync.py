@@ -0,0 +1,215 @@
+"""
+Sync stock from a supplier feed: diff it against current stock in memory
+and write only the products whose stock changed
+"""
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+# Changed products written per transaction
+SYNC_CHUNK = 2000
+
+# Accepted feed column names, first match wins
+PRODUCT_COLUMNS = ("product_id", "id")
+QUANTITY_COLUMNS = ("quantity", "stock_quantity", "stock")
+
+# Characters read from a JSON feed at a time
+JSON_READ_SIZE = 1 << 16
+
+
+class InvalidFeed(Exception):
+    """Raised when a feed file cannot be read at all"""
+
+
+def _csv_records(handle):
+    reader = csv.DictReader(handle)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _json_records(handle):
+    """
+    Objects from a JSON array or from JSON Lines, decoded one at a time
+    from a sliding buffer so the whole file is never held in memory
+    """
+    decoder = json.JSONDecoder()
+    buffer = handle.read(JSON_READ_SIZE).lstrip()
+    if buffer.startswith("["):
+        buffer = buffer[1:]
+    position = 0
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer) if buffer else (None, 0)
+        except json.JSONDecodeError:
+            end = None
+        if not end:
+            more = handle.read(JSON_READ_SIZE)
+            if not more:
+                if buffer:
+                    raise InvalidFeed(f"Malformed JSON after record {position}")
+                return
+            buffer += more
+            continue
+        position += 1
+        yield position, record
+        buffer = buffer[end:]
+
+
+def read_feed(path, format=None):
+    """
+    Yield (line or record number, record dict) from a CSV file with a
+    header row, a JSON array of objects or JSON Lines. ``format`` is
+    "csv" or "json", by default taken from the file extension.
+    """
+    path = Path(path)
+    format = format or ("csv" if path.suffix.lower() == ".csv" else "json")
+    with path.open(newline="", encoding="utf-8-sig") as handle:
+        if format == "csv":
+            yield from _csv_records(handle)
+        else:
+            yield from _json_records(handle)
+
+
+def _parse(record):
+    """(product id, quantity) from a feed record; raises ValueError when it has neither"""
+    if not isinstance(record, dict):
+        raise ValueError("not an object")
+    product_id = next((record[column] for column in PRODUCT_COLUMNS if column in record), None)
+    quantity = next((record[column] for column in QUANTITY_COLUMNS if column in record), None)
+    if product_id is None or quantity is None:
+        raise ValueError("missing product id or quantity")
+    product_id, quantity = int(product_id), int(quantity)
+    if quantity < 0:
+        raise ValueError("negative quantity")
+    return product_id, quantity
+
+
+class SyncReport:
+    """What a sync read, changed and skipped"""
+
+    def __init__(self):
+        self.rows = 0
+        self.unchanged = 0
+        # [(product id, old stock, new stock)]
+        self.changed = []
+        self.unknown = []
+        # line or record numbers
+        self.invalid = []
+        self.seconds = 0.0
+
+
+def _current_stock():
+    """({product id: stock}, {product id: shard count}) for the whole catalog in two queries"""
+    from skinly.models import Product, StockShard
+
+    stock = dict(Product.objects.values_list("id", "stock_quantity").iterator(chunk_size=10000))
+    shards = {}
+    for product_id, total, count in StockShard.objects.values("product_id").annotate(
+        total=Sum("quantity"), count=Count("id")
+    ).values_list("product_id", "total", "count"):
+        stock[product_id] = total
+        shards[product_id] = count
+    return stock, shards
+
+
+def _apply_chunk(chunk, shards, report):
+    """Write one chunk of {product id: new stock} in a transaction; returns products that went in or out of stock"""
+    from skinly.models import Product, StockMovementReason
+
+    from .ledger import record_movements
+    from .shards import shard_stock, stock_levels
+
+    with transaction.atomic():
+        # Re-read under lock, so the ledger gets the true change if a sale
+        # happened since the diff was taken
+        products = list(Product.objects.select_for_update().filter(id__in=list(chunk)).only("id", "stock_quantity"))
+        old = stock_levels(chunk) if any(product_id in shards for product_id in chunk) else {
+            product.pk: product.stock_quantity for product in products
+        }
+
+        by_quantity, sharded, movements, flipped = {}, {}, {}, []
+        for product in products:
+            before, after = old[product.pk], chunk[product.pk]
+            if before == after:
+                report.unchanged += 1
+                continue
+            if product.pk in shards:
+                sharded.setdefault(shards[product.pk], {})[product.pk] = after
+            else:
+                by_quantity.setdefault(after, []).append(product.pk)
+            movements[product.pk] = after - before
+            report.changed.append((product.pk, before, after))
+            if (before > 0) != (after > 0):
+                flipped.append(product.pk)
+
+        # Feeds repeat a handful of quantities (0 above all), so one
+        # UPDATE ... WHERE id IN (...) per distinct value is far cheaper
+        # than bulk_update's CASE with a branch per product
+        for quantity, product_ids in by_quantity.items():
+            Product.objects.filter(id__in=product_ids).update(stock_quantity=quantity)
+        for count, quantities in sharded.items():
+            shard_stock(list(quantities), count, quantities=quantities)
+        record_movements(movements, StockMovementReason.SUPPLIER_SYNC)
+    return flipped
+
+
+def sync_inventory(records, chunk_size=SYNC_CHUNK, dry_run=False):
+    """
+    Set stock to the quantities in ``records`` (from read_feed). The feed
+    is diffed against the stock of the whole catalog, read in two queries,
+    and only changed products are written: ``chunk_size`` per transaction,
+    with one UPDATE per distinct new quantity and one ledger INSERT. Later
+    rows for the same product win. Returns a SyncReport.
+    """
+    from skinly.models import Product
+
+    from .stock import _after_stock_change
+
+    started = time.perf_counter()
+    report = SyncReport()
+    feed = {}
+    for position, record in records:
+        report.rows += 1
+        try:
+            product_id, quantity = _parse(record)
+        except (TypeError, ValueError):
+            report.invalid.append(position)
+            continue
+        feed[product_id] = quantity
+
+    stock, shards = _current_stock()
+    changes = {}
+    for product_id, quantity in feed.items():
+        if product_id not in stock:
+            report.unknown.append(product_id)
+        elif stock[product_id] == quantity:
+            report.unchanged += 1
+        else:
+            changes[product_id] = quantity
+
+    if dry_run:
+        report.changed = [(product_id, stock[product_id], quantity) for product_id, quantity in changes.items()]
+    else:
+        product_ids = list(changes)
+        flipped = []
+        for start in range(0, len(product_ids), chunk_size):
+            chunk = {product_id: changes[product_id] for product_id in product_ids[start:start + chunk_size]}
+            flipped += _apply_chunk(chunk, shards, report)
+        # queryset.update() sends no post_save; only a product going in or out
+        # of stock changes what the search index and cached lists show
+        for start in range(0, len(flipped), chunk_size):
+            _after_stock_change(list(
+                Product.objects.filter(id__in=flipped[start:start + chunk_size]).select_related("brand", "color")
+            ))
+
+    report.seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,19 @@
+"""
+Local job queue package for Skinly application
+"""
+
+from .queue import (
+    JOB_HANDLERS,
+    claim,
+    enqueue,
+    run_pending,
+    work,
+)
+
+__all__ = [
+    'JOB_HANDLERS',
+    'claim',
+    'enqueue',
+    'run_pending',
+    'work',
+]
@@ -0,0 +1,42 @@
+"""
+Handlers for the local job queue
+"""
+from django.db.models import Avg
+
+
+def handle_reviews(groups):
+    """
+    Post-review work, keyed by user id: recompute the rating of every
+    reviewed product once, then apply each user's reviews to their taste
+    profile in one pass. Only the latest rating per product counts when a
+    user reviewed the same product several times.
+    """
+    from skinly.models import Product, RecommendationEngine, Review, User
+
+    latest = {
+        int(user_id): {payload["product_id"]: payload["rating"] for payload in payloads}
+        for user_id, payloads in groups.items()
+    }
+    product_ids = {product_id for ratings in latest.values() for product_id in ratings}
+    products = Product.objects.select_related("brand", "color").in_bulk(product_ids)
+
+    averages = dict(
+        Review.objects.filter(product_id__in=product_ids)
+        .values("product_id").annotate(average=Avg("rating")).values_list("product_id", "average")
+    )
+    for product in products.values():
+        product.rating = averages.get(product.pk) or 0
+        product.save(update_fields=["rating"])
+
+    engine = RecommendationEngine.objects.first()
+    if engine is None:
+        return
+    users = User.objects.select_related("taste_profile").in_bulk(list(latest))
+    for user_id, ratings in latest.items():
+        user = users.get(user_id)
+        if user is None:
+            continue
+        engine.update_taste_profile_many(user, [
+            (products[product_id], "positive" if rating >= 4 else "negative")
+            for product_id, rating in ratings.items() if product_id in products
+        ])
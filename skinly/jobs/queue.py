@@ -0,0 +1,149 @@
+"""
+Local job queue stored in the database
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# kind -> dotted path of handler(groups), groups being {key: [payload, ...]}
+# in enqueue order. A handler gets every claimed job of its kind at once so
+# it can coalesce repeated work for the same key.
+JOB_HANDLERS = {
+    "review": "skinly.jobs.handlers.handle_reviews",
+}
+
+# Jobs claimed per round
+BATCH_SIZE = 200
+
+# A claimed job is handed to another worker if not finished within this
+# many seconds (the worker died)
+LEASE_SECONDS = 300
+
+# Failed jobs are retried after RETRY_DELAY * 2 ** (attempts - 1) seconds,
+# and kept with failed=True after MAX_ATTEMPTS
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30
+
+
+def enqueue(kind, key="", **payload):
+    """Queue a job: a single INSERT, safe to call on the request path"""
+    from skinly.models import Job
+
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    return Job.objects.create(kind=kind, key=str(key), payload=payload)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim(worker, batch_size=BATCH_SIZE):
+    """
+    Lease up to ``batch_size`` due jobs, oldest first. The lease is taken
+    with a conditional UPDATE, so concurrent workers never claim the same row.
+    """
+    from skinly.models import Job
+
+    now = timezone.now()
+    free = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    job_ids = list(
+        Job.objects.filter(free, Q(available_at__isnull=True) | Q(available_at__lte=now), failed=False)
+        .order_by("id").values_list("id", flat=True)[:batch_size]
+    )
+    if not job_ids:
+        return []
+    Job.objects.filter(free, id__in=job_ids).update(
+        locked_by=worker, locked_until=now + timedelta(seconds=LEASE_SECONDS)
+    )
+    return list(Job.objects.filter(id__in=job_ids, locked_by=worker).order_by("id"))
+
+
+def _handle(kind, jobs):
+    groups = defaultdict(list)
+    for job in jobs:
+        groups[job.key].append(job.payload)
+    with transaction.atomic():
+        import_string(JOB_HANDLERS[kind])(dict(groups))
+        type(jobs[0]).objects.filter(id__in=[job.pk for job in jobs]).delete()
+
+
+def _fail(jobs, error):
+    now = timezone.now()
+    for job in jobs:
+        job.attempts += 1
+        job.last_error = error
+        job.locked_by = ""
+        job.locked_until = None
+        job.failed = job.attempts >= MAX_ATTEMPTS
+        job.available_at = now + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+    type(jobs[0]).objects.bulk_update(
+        jobs, ["attempts", "last_error", "locked_by", "locked_until", "failed", "available_at"]
+    )
+
+
+def run_pending(worker=None, batch_size=BATCH_SIZE):
+    """
+    Claim one batch and run it. Returns the number of jobs that succeeded
+    and failed; when a kind's batch fails, its keys are retried one by one
+    so a single bad job does not hold back the rest.
+    """
+    worker = worker or worker_name()
+    by_kind = defaultdict(list)
+    for job in claim(worker, batch_size):
+        by_kind[job.kind].append(job)
+
+    done = failed = 0
+    for kind, jobs in by_kind.items():
+        if kind not in JOB_HANDLERS:
+            _fail(jobs, f"No handler for job kind {kind!r}")
+            failed += len(jobs)
+            continue
+        try:
+            _handle(kind, jobs)
+            done += len(jobs)
+            continue
+        except Exception:
+            logger.exception("Job batch %s failed, retrying per key", kind)
+
+        by_key = defaultdict(list)
+        for job in jobs:
+            by_key[job.key].append(job)
+        for key_jobs in by_key.values():
+            try:
+                _handle(kind, key_jobs)
+                done += len(key_jobs)
+            except Exception as error:
+                logger.exception("Job %s %s failed", kind, key_jobs[0].key)
+                _fail(key_jobs, repr(error))
+                failed += len(key_jobs)
+    return done, failed
+
+
+def work(batch_size=BATCH_SIZE, poll_interval=1.0, once=False, on_batch=None):
+    """
+    Run jobs until interrupted, sleeping ``poll_interval`` seconds whenever
+    the queue is empty; with ``once``, stop as soon as it is empty.
+    ``on_batch(done, failed)`` is called after every non-empty batch.
+    """
+    worker = worker_name()
+    while True:
+        done, failed = run_pending(worker, batch_size)
+        if done or failed:
+            if on_batch:
+                on_batch(done, failed)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
@@ -2,8 +2,10 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.db import transaction
 from django.db.models import Q, Avg
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
@@ -14,13 +16,23 @@ import json
 from .models import (
     Product, Brand, Color, User, Cart, CartItem, Order, OrderItem,
     Review, TasteProfile, RecommendationEngine, SearchEngine,
-    InventoryManager, SkinType, SkinTone, ProductType, FinishType
+    InventoryManager, SkinType, SkinTone, ProductType, FinishType, ShippingAddress
 )
+from .catalog import listing_ids
+from .checkout import EmptyCart, order_totals, place_order
 from .forms import SignUpForm
+from .inventory import InsufficientStock, available_to_sell, reserve
+from .jobs import enqueue
+from .pagination import CATALOG_ORDERINGS, CountedPaginator, InvalidCursor, KeysetPaginator, estimate_count
+from .recommendations import (
+    bought_together, recently_viewed_products, record_event, record_view,
+    similar_products as precomputed_similar_products, trending_products,
+)
+from .search import correct_query, get_facet_counts, get_typeahead_index, hydrate_products
 
 def home(request):
     """Home page with featured products and recommendations"""
-    featured_products = Product.objects.filter(stock_quantity__gt=0)[:8]
+    featured_products = trending_products(8)
     
     recommendations = []
     if request.user.is_authenticated:
@@ -31,6 +43,7 @@ def home(request):
     context = {
         'featured_products': featured_products,
         'recommendations': recommendations,
+        'recently_viewed': recently_viewed_products(request, limit=4),
     }
     return render(request, 'skinly/home.html', context)
 
@@ -44,6 +57,7 @@ def product_list(request):
     
     # Filter by query
     query = request.GET.get('q', '')
+    search_engine = None
     if query:
         search_engine = SearchEngine.objects.first()
         if search_engine:
@@ -81,24 +95,90 @@ def product_list(request):
     if max_price:
         products = products.filter(price__lte=Decimal(max_price))
     
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    current_filters = {
+        'brand': brand_filter,
+        'product_type': product_type_filter,
+        'skin_type': skin_type_filter,
+        'min_price': min_price,
+        'max_price': max_price,
+    }
+    
+    # Facet counts for the current result set (one grouped query, cached)
+    facets = get_facet_counts(products, dict(current_filters, q=query))
+    brands = list(brands)
+    for brand in brands:
+        brand.product_count = facets['brand'].get(brand.id, 0)
+    product_types = [
+        (code, name, facets['product_type'].get(code, 0))
+        for code, name in ProductType.choices
+    ]
+    # Products without a skin type are compatible with every skin type
+    universal_count = facets['skin_type'].get(None, 0)
+    skin_types = [
+        (code, name, facets['skin_type'].get(code, 0) + universal_count)
+        for code, name in SkinType.choices
+    ]
+    
+    # The facet counts already total the result set, so no COUNT(*) is needed
+    result_count = sum(facets['brand'].values())
+    sort = request.GET.get('sort', '')
+    ordering = CATALOG_ORDERINGS.get(sort, CATALOG_ORDERINGS[''])
+    
+    # Rank search results by relevance; only ids come back from the database
+    if search_engine:
+        products = search_engine.rank(query, products)
+    else:
+        products = products.select_related('brand').order_by(*ordering)
+    
+    # Pagination: keyset cursors for the plain catalog when enabled, numbered pages otherwise
+    cursor_pagination = not search_engine and (
+        settings.CATALOG_PAGINATION == 'cursor' or 'cursor' in request.GET
+    )
+    previous_url = next_url = None
+    if cursor_pagination:
+        paginator = KeysetPaginator(products, 12, ordering)
+        try:
+            page_obj = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            page_obj = paginator.page()
+        params = request.GET.copy()
+        params.pop('page', None)
+        if page_obj.has_previous():
+            params['cursor'] = page_obj.previous_cursor
+            previous_url = '?' + params.urlencode()
+        if page_obj.has_next():
+            params['cursor'] = page_obj.next_cursor
+            next_url = '?' + params.urlencode()
+    else:
+        page_number = request.GET.get('page')
+        # The plain catalog is paged over ids sorted in the mapped snapshot,
+        # so only the page's rows are read from the database
+        listed = None if query else listing_ids(ordering, **current_filters)
+        if listed is not None:
+            paginator = Paginator(listed, 12)
+            page_obj = paginator.get_page(page_number)
+            page_obj.object_list = hydrate_products(page_obj.object_list.tolist())
+            result_count = paginator.count
+        else:
+            paginator = CountedPaginator(products, 12, count=None if search_engine else result_count)
+            page_obj = paginator.get_page(page_number)
+    
+    # Hydrate just the current page of ranked ids
+    if search_engine:
+        page_obj.object_list = hydrate_products(list(page_obj.object_list))
     
     context = {
         'page_obj': page_obj,
         'brands': brands,
-        'product_types': ProductType.choices,
-        'skin_types': SkinType.choices,
+        'product_types': product_types,
+        'skin_types': skin_types,
+        'facets': facets,
+        'result_count': result_count,
+        'cursor_pagination': cursor_pagination,
+        'previous_url': previous_url,
+        'next_url': next_url,
         'query': query,
-        'current_filters': {
-            'brand': brand_filter,
-            'product_type': product_type_filter,
-            'skin_type': skin_type_filter,
-            'min_price': min_price,
-            'max_price': max_price,
-        }
+        'current_filters': current_filters,
     }
     return render(request, 'skinly/product_list.html', context)
 
@@ -106,6 +186,8 @@ def product_detail(request, product_id):
     """Product detail page"""
     product = get_object_or_404(Product, id=product_id)
     reviews = Review.objects.filter(product=product).order_by('-created_at')
+    record_event(product.id, 'view')
+    record_view(request, product.id)
     
     # Calculate average rating
     avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
@@ -118,11 +200,16 @@ def product_detail(request, product_id):
         except Review.DoesNotExist:
             pass
     
-    # Get similar products
-    similar_products = Product.objects.filter(
-        Q(brand=product.brand) | Q(product_type=product.product_type),
-        stock_quantity__gt=0
-    ).exclude(id=product.id)[:4]
+    # Get similar products from the precomputed neighbour table
+    similar_products = precomputed_similar_products([product.id], limit=4)
+    if not similar_products:
+        similar_products = Product.objects.filter(
+            Q(brand=product.brand) | Q(product_type=product.product_type),
+            stock_quantity__gt=0
+        ).exclude(id=product.id)[:4]
+    
+    # Basket partners from order history
+    bought_with = bought_together([product.id], limit=4)
     
     context = {
         'product': product,
@@ -130,6 +217,7 @@ def product_detail(request, product_id):
         'avg_rating': round(avg_rating, 1),
         'user_review': user_review,
         'similar_products': similar_products,
+        'bought_together': bought_with,
     }
     return render(request, 'skinly/product_detail.html', context)
 
@@ -138,14 +226,15 @@ def add_to_cart(request, product_id):
     """Add product to cart"""
     product = get_object_or_404(Product, id=product_id)
     quantity = int(request.POST.get('quantity', 1))
+    cart, created = Cart.objects.get_or_create(user=request.user)
     
-    if product.stock_quantity < quantity:
+    # Units held by other customers' checkouts are not for sale
+    if available_to_sell([product.id], cart).get(product.id, 0) < quantity:
         messages.error(request, 'Not enough stock available')
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'Not enough stock available'})
         return redirect('skinly:product_detail', product_id=product_id)
     
-    cart, created = Cart.objects.get_or_create(user=request.user)
     cart_item, created = CartItem.objects.get_or_create(
         cart=cart,
         product=product,
@@ -155,6 +244,7 @@ def add_to_cart(request, product_id):
     if not created:
         cart_item.quantity += quantity
         cart_item.save()
+    record_event(product.id, 'cart')
     
     messages.success(request, f'{product.name} added to cart')
     
@@ -168,10 +258,16 @@ def cart_view(request):
     """Shopping cart page"""
     try:
         cart = Cart.objects.get(user=request.user)
-        cart_items = cart.cart_items.all()
+        cart_items = list(cart.cart_items.all())
     except Cart.DoesNotExist:
         cart_items = []
     
+    # What each item can go up to: stock, summed over shards, less other carts' holds
+    if cart_items:
+        available = available_to_sell([item.product_id for item in cart_items], cart)
+        for item in cart_items:
+            item.available = available.get(item.product_id, 0)
+    
     total = sum(item.product.price * item.quantity for item in cart_items)
     
     # Calculate shipping
@@ -189,26 +285,42 @@ def cart_view(request):
     # Get recommended products based on cart items
     recommended_products = []
     if cart_items:
-        # Get brands and product types from cart items
-        cart_brands = set(item.product.brand for item in cart_items)
-        cart_product_types = set(item.product.product_type for item in cart_items)
         cart_product_ids = set(item.product.id for item in cart_items)
-        
-        # Find similar products by brand or product type
-        similar_products = Product.objects.filter(
-            Q(brand__in=cart_brands) | Q(product_type__in=cart_product_types),
-            stock_quantity__gt=0
-        ).exclude(id__in=cart_product_ids)
-        
-        # Get user's skin type for better recommendations
-        if request.user.skin_type:
-            similar_products = similar_products.filter(
-                Q(skin_type_compatibility__isnull=True) | 
-                Q(skin_type_compatibility=request.user.skin_type)
-            )
-        
-        # Order by rating and limit to 4 products
-        recommended_products = similar_products.order_by('-rating', '?')[:4]
+    
+        # Products often ordered with the cart items come first, then
+        # neighbours from the precomputed similarity table
+        recommended_products = bought_together(
+            cart_product_ids, limit=4, skin_type=request.user.skin_type
+        )
+        if len(recommended_products) < 4:
+            shown = cart_product_ids | set(product.id for product in recommended_products)
+            recommended_products += [
+                product for product in precomputed_similar_products(
+                    cart_product_ids, limit=8, skin_type=request.user.skin_type
+                )
+                if product.id not in shown
+            ][:4 - len(recommended_products)]
+    
+        if not recommended_products:
+            # Get brands and product types from cart items
+            cart_brands = set(item.product.brand for item in cart_items)
+            cart_product_types = set(item.product.product_type for item in cart_items)
+            
+            # Find similar products by brand or product type
+            similar_products = Product.objects.filter(
+                Q(brand__in=cart_brands) | Q(product_type__in=cart_product_types),
+                stock_quantity__gt=0
+            ).exclude(id__in=cart_product_ids)
+            
+            # Get user's skin type for better recommendations
+            if request.user.skin_type:
+                similar_products = similar_products.filter(
+                    Q(skin_type_compatibility__isnull=True) | 
+                    Q(skin_type_compatibility=request.user.skin_type)
+                )
+            
+            # Order by rating and limit to 4 products
+            recommended_products = similar_products.order_by('-rating', 'id')[:4]
     
     context = {
         'cart_items': cart_items,
@@ -218,6 +330,9 @@ def cart_view(request):
         'final_total': final_total,
         'free_shipping_needed': free_shipping_needed,
         'recommended_products': recommended_products,
+        'recently_viewed': recently_viewed_products(
+            request, limit=4, exclude={item.product_id for item in cart_items}
+        ),
     }
     return render(request, 'skinly/cart.html', context)
 
@@ -231,7 +346,7 @@ def update_cart_item(request, item_id):
     if quantity <= 0:
         cart_item.delete()
         messages.success(request, 'Item removed from cart')
-    elif quantity <= cart_item.product.stock_quantity:
+    elif quantity <= available_to_sell([cart_item.product_id], cart_item.cart_id).get(cart_item.product_id, 0):
         cart_item.quantity = quantity
         cart_item.save()
         messages.success(request, 'Cart updated')
@@ -253,7 +368,7 @@ def checkout_view(request):
     """Checkout page"""
     try:
         cart = Cart.objects.get(user=request.user)
-        cart_items = cart.cart_items.all()
+        cart_items = list(cart.cart_items.select_related('product'))
     except Cart.DoesNotExist:
         messages.error(request, 'Your cart is empty')
         return redirect('skinly:cart')
@@ -263,10 +378,7 @@ def checkout_view(request):
         return redirect('skinly:cart')
     
     # Calculate totals
-    subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    shipping = 0 if subtotal >= 50 else Decimal('5.99')
-    tax = subtotal * Decimal('0.08')
-    total = subtotal + shipping + tax
+    subtotal, shipping, tax, total = order_totals(cart_items)
     
     # Get user's shipping addresses
     shipping_addresses = request.user.shipping_addresses.all()
@@ -286,35 +398,30 @@ def checkout_view(request):
             messages.error(request, 'Invalid shipping address')
             return redirect('skinly:checkout')
         
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            shipping_address=f"{shipping_address.address_line_1}, {shipping_address.city}, {shipping_address.state} {shipping_address.zip_code}",
-            phone_number=shipping_address.phone_number or '',
-            total_price=total,
-            payment_method=payment_method,
-            status='PENDING'
-        )
-        
-        # Create order items
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-            
-            # Update product stock
-            cart_item.product.stock_quantity -= cart_item.quantity
-            cart_item.product.save()
-        
-        # Clear cart
-        cart_items.delete()
+        # Stock, order, payment, items and cart in one transaction
+        try:
+            order = place_order(request.user, payment_method)
+        except EmptyCart:
+            messages.error(request, 'Your cart is empty')
+            return redirect('skinly:cart')
+        except InsufficientStock as error:
+            names = {item.product_id: item.product.name for item in cart_items}
+            short = ', '.join(names.get(product_id, str(product_id)) for product_id in error.shortages)
+            messages.error(request, f'Not enough stock available for {short}')
+            return redirect('skinly:cart')
         
         messages.success(request, f'Order #{order.id} placed successfully!')
         return redirect('skinly:order_detail', order_id=order.id)
     
+    # Hold the items while the customer fills in the form
+    try:
+        hold_expires_at = reserve(cart, {item.product_id: item.quantity for item in cart_items})
+    except InsufficientStock as error:
+        names = {item.product_id: item.product.name for item in cart_items}
+        short = ', '.join(names.get(product_id, str(product_id)) for product_id in error.shortages)
+        messages.error(request, f'Not enough stock available for {short}')
+        return redirect('skinly:cart')
+    
     context = {
         'cart_items': cart_items,
         'subtotal': subtotal,
@@ -322,6 +429,7 @@ def checkout_view(request):
         'tax': tax,
         'total': total,
         'shipping_addresses': shipping_addresses,
+        'hold_expires_at': hold_expires_at,
     }
     return render(request, 'skinly/checkout.html', context)
 
@@ -431,25 +539,19 @@ def add_review(request, product_id):
     rating = int(request.POST.get('rating', 5))
     comment = request.POST.get('comment', '')
     
-    review, created = Review.objects.update_or_create(
-        user=request.user,
-        product=product,
-        defaults={
-            'rating': rating,
-            'comment': comment,
-        }
-    )
-    
-    # Update product rating
-    avg_rating = Review.objects.filter(product=product).aggregate(Avg('rating'))['rating__avg']
-    product.rating = avg_rating or 0
-    product.save()
+    # The review and its job commit together, so neither is left without the other
+    with transaction.atomic():
+        review, created = Review.objects.update_or_create(
+            user=request.user,
+            product=product,
+            defaults={
+                'rating': rating,
+                'comment': comment,
+            }
+        )
     
-    # Update taste profile with recommendation engine
-    engine = RecommendationEngine.objects.first()
-    if engine:
-        feedback = 'positive' if rating >= 4 else 'negative'
-        engine.update_taste_profile(request.user, product, feedback)
+        # Product rating and taste profile are updated by `manage.py run_jobs`
+        enqueue('review', key=request.user.id, product_id=product.id, rating=rating)
     
     action = 'updated' if not created else 'added'
     messages.success(request, f'Review {action} successfully')
@@ -520,8 +622,8 @@ def profile_view(request):
             preferred_finish_types = request.POST.getlist('preferred_finish_types')
             preferred_colors = request.POST.getlist('preferred_colors')
             
-            taste_profile.preferred_product_types = ','.join(preferred_product_types)
-            taste_profile.preferred_finish_types = ','.join(preferred_finish_types)
+            taste_profile.preferred_product_types = preferred_product_types
+            taste_profile.preferred_finish_types = preferred_finish_types
             taste_profile.save()
             
             # Update preferred colors
@@ -547,10 +649,8 @@ def profile_view(request):
     current_product_types = []
     current_finish_types = []
     if taste_profile:
-        if taste_profile.preferred_product_types:
-            current_product_types = taste_profile.preferred_product_types.split(',')
-        if taste_profile.preferred_finish_types:
-            current_finish_types = taste_profile.preferred_finish_types.split(',')
+        current_product_types = taste_profile.preferred_product_types
+        current_finish_types = taste_profile.preferred_finish_types
     
     context = {
         'skin_tones': SkinTone.choices,
@@ -569,32 +669,20 @@ def profile_view(request):
     return render(request, 'skinly/profile.html', context)
 
 def search_products(request):
-    """AJAX search for products"""
+    """AJAX search for products, answered from the in-memory typeahead index"""
     query = request.GET.get('q', '')
     
     if len(query) < 2:
         return JsonResponse({'products': []})
     
-    search_engine = SearchEngine.objects.first()
-    if search_engine:
-        products = search_engine.search(query)[:10]
-    else:
-        products = Product.objects.filter(
-            Q(name__icontains=query) | Q(brand__name__icontains=query),
-            stock_quantity__gt=0
-        )[:10]
+    typeahead = get_typeahead_index()
+    suggestions = typeahead.suggest(query, limit=10)
+    if not suggestions:
+        corrected = correct_query(query)
+        if corrected:
+            suggestions = typeahead.suggest(corrected, limit=10)
     
-    product_data = []
-    for product in products:
-        product_data.append({
-            'id': product.id,
-            'name': product.name,
-            'brand': product.brand.name,
-            'price': float(product.price),
-            'image_url': '/static/images/placeholder.jpg',  # Add image field to model later
-        })
-    
-    return JsonResponse({'products': product_data})
+    return JsonResponse({'products': suggestions})
 
 def contact_view(request):
     """Contact us page with company information"""
@@ -698,6 +786,34 @@ from django.urls import reverse
 def products_api(request):
     """Devuelve una lista de productos disponibles en formato JSON"""
     products = Product.objects.filter(stock_quantity__gt=0)
+
+    # ?q=... ordena por relevancia (BM25) y ?limit=N devuelve solo el top-N
+    query = request.GET.get('q', '')
+    if query:
+        limit = request.GET.get('limit')
+        if limit:
+            try:
+                limit = min(max(int(limit), 1), 100)
+            except ValueError:
+                return JsonResponse({"error": "Invalid limit"}, status=400)
+        search_engine = SearchEngine.objects.first()
+        if search_engine:
+            ranked = search_engine.rank(query, search_engine.search(query))
+            products = hydrate_products(ranked.top(limit or None))
+
+    # ?cursor=... / ?page_size=N paginan por keyset en lugar de devolver todo
+    page = None
+    if not query and ('cursor' in request.GET or 'page_size' in request.GET):
+        sort = request.GET.get('sort', '')
+        ordering = CATALOG_ORDERINGS.get(sort, CATALOG_ORDERINGS[''])
+        try:
+            page_size = min(max(int(request.GET.get('page_size', 12)), 1), 100)
+            page = KeysetPaginator(products, page_size, ordering).page(request.GET.get('cursor'))
+        except (InvalidCursor, ValueError):
+            return JsonResponse({"error": "Invalid cursor or page_size"}, status=400)
+        count, exact = estimate_count(products)
+        products = page.object_list
+
     data = []
 
     for product in products:
@@ -710,6 +826,14 @@ def products_api(request):
             "detail_url": request.build_absolute_uri(reverse("skinly:product_detail", args=[product.id])),
         })
 
+    if page is not None:
+        return JsonResponse({
+            "products": data,
+            "next_cursor": page.next_cursor,
+            "previous_cursor": page.previous_cursor,
+            "estimated_count": count,
+            "exact_count": exact,
+        })
     return JsonResponse({"products": data})
 
 import requests
@@ -0,0 +1,108 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from skinly.inventory import InsufficientStock, decrement_stock, release, reserve, shard_stock, unshard_stock
+from skinly.inventory.shards import shard_count
+from skinly.models import Brand, Cart, Color, FinishType, Product, ProductType, User
+
+# Username prefix of the throwaway customers, one per thread
+BENCHMARK_USER = "benchmark-stock-"
+
+
+def _checkout_concurrently(product_id, carts, checkouts):
+    """
+    (succeeded, failed, seconds) for ``checkouts`` single-unit checkouts
+    spread over one thread per cart, each doing what place_order does to
+    stock: hold, decrement and release in one transaction
+    """
+    threads = len(carts)
+    shares = [checkouts // threads + (1 if thread < checkouts % threads else 0) for thread in range(threads)]
+    succeeded, failed = [0] * threads, [0] * threads
+    start = threading.Barrier(threads + 1)
+
+    def sell(thread):
+        try:
+            start.wait()
+            for _ in range(shares[thread]):
+                try:
+                    with transaction.atomic():
+                        reserve(carts[thread], {product_id: 1})
+                        decrement_stock({product_id: 1})
+                        release(carts[thread])
+                    succeeded[thread] += 1
+                except (InsufficientStock, OperationalError):
+                    failed[thread] += 1
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=sell, args=(thread,)) for thread in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return sum(succeeded), sum(failed), time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent checkouts of one product with and without sharded counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=16,
+            help="Concurrent checkouts",
+        )
+        parser.add_argument(
+            "--checkouts", type=int, default=2000,
+            help="Single-unit checkouts per run",
+        )
+        parser.add_argument(
+            "--shards", type=int, default=None,
+            help=f"Counter rows in the sharded run (default: settings.STOCK_SHARDS or {shard_count()})",
+        )
+
+    def handle(self, *args, **options):
+        threads, checkouts = options["threads"], options["checkouts"]
+        shards = options["shards"] or shard_count()
+        brand, color = Brand.objects.first(), Color.objects.first()
+        if brand is None or color is None:
+            raise CommandError("The benchmark product needs at least one brand and one color")
+        if connection.vendor == "sqlite":
+            self.stdout.write(self.style.WARNING(
+                "SQLite lets one writer in at a time, so shards cannot help here; run this against PostgreSQL"
+            ))
+
+        # Left behind only if an earlier run was killed
+        User.objects.filter(username__startswith=BENCHMARK_USER).delete()
+        # Sold by throwaway customers, so no real stock, hold or ledger row is touched
+        product = Product.objects.create(
+            name="Stock benchmark (temporary)", brand=brand, color=color, price=0,
+            product_type=ProductType.values[0], finish_type=FinishType.values[0],
+        )
+        try:
+            users = [
+                User.objects.create(username=f"{BENCHMARK_USER}{thread}", email=f"{BENCHMARK_USER}{thread}@invalid")
+                for thread in range(threads)
+            ]
+            carts = [Cart.objects.create(user=user) for user in users]
+            # One unit more than is sold, so the runs never sell the product out
+            stock = {product.pk: checkouts + 1}
+            for label, shard in (("single row", 0), (f"{shards} shards", shards)):
+                unshard_stock([product.pk])
+                if shard:
+                    shard_stock([product.pk], shard, quantities=stock)
+                else:
+                    Product.objects.filter(pk=product.pk).update(stock_quantity=stock[product.pk])
+                succeeded, failed, seconds = _checkout_concurrently(product.pk, carts, checkouts)
+                self.stdout.write(
+                    f"{label:>12}: {succeeded / seconds:8.0f} checkouts/s "
+                    f"({succeeded} sold, {failed} failed, {threads} threads, {seconds:.2f} s)"
+                )
+        finally:
+            # Takes its shards, holds and ledger rows with it
+            product.delete()
+            User.objects.filter(username__startswith=BENCHMARK_USER).delete()
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from skinly.recommendations import update_bought_together
+from skinly.recommendations.cooccurrence import MIN_SUPPORT, SCORING, TOP_PARTNERS
+
+
+class Command(BaseCommand):
+    help = "Update the frequently-bought-together lists from orders placed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Recount the whole order history instead of only new orders",
+        )
+        parser.add_argument(
+            "--top", type=int, default=TOP_PARTNERS,
+            help="Partners stored per product",
+        )
+        parser.add_argument(
+            "--scoring", choices=SCORING, default="lift",
+            help="Association score used to rank partners",
+        )
+        parser.add_argument(
+            "--min-support", type=int, default=MIN_SUPPORT,
+            help="Minimum number of shared orders for a pair to count",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        orders, products = update_bought_together(
+            full=options["full"],
+            top_k=options["top"],
+            scoring=options["scoring"],
+            min_support=options["min_support"],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {orders} new orders touching {products} products in {elapsed:.2f} s"
+        ))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from skinly.catalog import write_snapshot
+from skinly.catalog.snapshot import snapshot_root
+
+
+class Command(BaseCommand):
+    help = "Write the product catalog to a memory-mapped columnar snapshot shared by all workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default=None,
+            help="Snapshot directory (default: settings.CATALOG_SNAPSHOT_DIR)",
+        )
+        parser.add_argument(
+            "--keep", type=int, default=3,
+            help="Number of snapshot versions to keep on disk",
+        )
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Keep running and rebuild every N seconds when the catalog changed",
+        )
+
+    def handle(self, *args, **options):
+        root = options["output"] or snapshot_root()
+        while True:
+            started = time.perf_counter()
+            version = write_snapshot(root, keep=options["keep"])
+            elapsed = (time.perf_counter() - started) * 1000
+            if version:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Catalog snapshot {version} written to {root} in {elapsed:.0f} ms"
+                ))
+            elif options["verbosity"] > 1 or not options["interval"]:
+                self.stdout.write(f"Catalog unchanged, keeping the current snapshot ({elapsed:.0f} ms)")
+
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
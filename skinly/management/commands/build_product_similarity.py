@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from skinly.recommendations import build_similarity_table
+from skinly.recommendations.similarity import TOP_NEIGHBORS
+
+
+class Command(BaseCommand):
+    help = "Recompute the item-item similarity table used for similar-product suggestions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top", type=int, default=TOP_NEIGHBORS,
+            help="Neighbours stored per product",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = build_similarity_table(top_n=options["top"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {rows} similar-product rows in {elapsed:.2f} s"
+        ))
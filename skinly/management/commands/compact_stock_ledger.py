@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from skinly.inventory import compact_ledger, reconcile
+from skinly.inventory.ledger import COMPACT_LAG
+
+
+class Command(BaseCommand):
+    help = "Roll stock ledger movements into per-product snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lag", type=int, default=COMPACT_LAG,
+            help="Leave movements younger than this many seconds for the next run",
+        )
+        parser.add_argument(
+            "--prune-days", type=int, default=0,
+            help="Delete folded movements older than this many days (default: keep them)",
+        )
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Report products whose ledger stock differs from their stock counter",
+        )
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Keep running and compact every N seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            prune_before = None
+            if options["prune_days"]:
+                prune_before = timezone.now() - timedelta(days=options["prune_days"])
+            written, pruned = compact_ledger(lag=options["lag"], prune_before=prune_before)
+            elapsed = (time.perf_counter() - started) * 1000
+            message = f"Wrote {written} stock snapshots in {elapsed:.0f} ms"
+            if pruned:
+                message += f", pruned {pruned} movements"
+            self.stdout.write(self.style.SUCCESS(message))
+
+            if options["check"]:
+                drift = reconcile()
+                for product_id, (ledger, counter) in sorted(drift.items()):
+                    self.stdout.write(self.style.WARNING(
+                        f"Product {product_id}: ledger says {ledger}, counter says {counter}"
+                    ))
+                if not drift:
+                    self.stdout.write("Ledger and stock counters agree")
+
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
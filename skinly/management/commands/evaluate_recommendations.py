@@ -0,0 +1,82 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from skinly.models import RecommendationStrategy
+from skinly.recommendations.evaluation import K, MAX_USERS, MEMORY_USERS, TEST_FRACTION, check_copy, evaluate
+
+
+class Command(BaseCommand):
+    help = "Compare recommendation strategies offline on a time split of reviews and orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", required=True,
+            help="Alias of a copy of the database to rewind; the default database is refused",
+        )
+        parser.add_argument(
+            "--strategy", action="append", choices=RecommendationStrategy.values, dest="strategies",
+            help="Strategy to evaluate; repeat for several (default: all)",
+        )
+        parser.add_argument("-k", type=int, default=K, help="Recommendations per user")
+        parser.add_argument(
+            "--test-fraction", type=float, default=TEST_FRACTION,
+            help="Latest share of the history held out for testing",
+        )
+        parser.add_argument(
+            "--cutoff", default=None,
+            help="Hold out everything from this ISO date or datetime on (overrides --test-fraction)",
+        )
+        parser.add_argument("--max-users", type=int, default=MAX_USERS, help="Test users sampled")
+        parser.add_argument(
+            "--memory-users", type=int, default=MEMORY_USERS,
+            help="Users whose calls are traced for peak memory",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        cutoff = None
+        if options["cutoff"]:
+            try:
+                cutoff = datetime.fromisoformat(options["cutoff"])
+            except ValueError:
+                raise CommandError(f"Invalid --cutoff {options['cutoff']!r}")
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+
+        try:
+            check_copy(options["database"])
+        except ValueError as error:
+            raise CommandError(error)
+
+        cutoff, users, results = evaluate(
+            options["database"],
+            strategies=options["strategies"],
+            k=options["k"],
+            test_fraction=options["test_fraction"],
+            cutoff=cutoff,
+            max_users=options["max_users"],
+            memory_users=options["memory_users"],
+        )
+        if not results:
+            self.stdout.write(self.style.WARNING("No reviews or orders after the cutoff to evaluate against"))
+            return
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"cutoff": cutoff.isoformat(), "users": users, "results": results}, indent=2))
+            return
+
+        k = options["k"]
+        self.stdout.write(f"Held out from {cutoff:%Y-%m-%d %H:%M}, {users} test users, k={k}")
+        self.stdout.write(
+            f"{'strategy':<10} {'precision':>10} {'recall':>8} {'coverage':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'peak KiB':>9}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['strategy']:<10} {result[f'precision@{k}']:>10.4f} {result[f'recall@{k}']:>8.4f} "
+                f"{result['coverage']:>9.1%} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['peak_kib']:>9.1f}"
+            )
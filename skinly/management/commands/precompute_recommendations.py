@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from skinly.models import RecommendationEngine
+from skinly.recommendations.precompute import CHUNK_SIZE, PRECOMPUTE_LIMIT, run_precompute
+
+
+class Command(BaseCommand):
+    help = "Precompute top-N recommendations for every user with a taste profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--engine", type=int, default=None,
+            help="RecommendationEngine id (default: the first engine)",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=PRECOMPUTE_LIMIT,
+            help="Recommendations stored per user",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=CHUNK_SIZE,
+            help="Users per work unit and checkpoint",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Worker processes (default: one per CPU)",
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Start over instead of resuming an unfinished run",
+        )
+
+    def handle(self, *args, **options):
+        if options["engine"]:
+            engine = RecommendationEngine.objects.filter(pk=options["engine"]).first()
+        else:
+            engine = RecommendationEngine.objects.first()
+        if engine is None:
+            raise CommandError("No recommendation engine found")
+
+        started = time.perf_counter()
+
+        def progress(run, total):
+            elapsed = time.perf_counter() - started
+            rate = run.users_done / elapsed if elapsed else 0
+            remaining = (total - run.users_done) / rate if rate else 0
+            self.stdout.write(
+                f"{run.users_done}/{total} users (up to id {run.last_user_id}), "
+                f"{rate:.0f} users/s, ~{remaining:.0f} s left"
+            )
+
+        run = run_precompute(
+            engine,
+            limit=options["limit"],
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            restart=options["restart"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Precomputed recommendations for {run.users_done} users with {engine} "
+            f"in {time.perf_counter() - started:.1f} s"
+        ))
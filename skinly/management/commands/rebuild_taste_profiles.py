@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from skinly.recommendations import rebuild_taste_profiles
+from skinly.recommendations.profiles import HALF_LIFE_DAYS, PREFERENCE_THRESHOLD, USER_BATCH
+
+
+class Command(BaseCommand):
+    help = "Rebuild every taste profile and brand affinity from reviews, wishlists and orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--half-life", type=float, default=HALF_LIFE_DAYS,
+            help="Days after which a review or order counts half",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=PREFERENCE_THRESHOLD,
+            help="Decayed weight a type, finish or color needs to become a preference",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=USER_BATCH,
+            help="Users written per transaction",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(done, total):
+            self.stdout.write(f"{done}/{total} profiles written ({time.perf_counter() - started:.1f} s)")
+
+        profiles, affinities = rebuild_taste_profiles(
+            half_life_days=options["half_life"],
+            threshold=options["threshold"],
+            batch_size=options["batch_size"],
+            progress=progress,
+        )
+        if not profiles:
+            self.stdout.write(self.style.WARNING("No reviews, wishlists or orders to rebuild from"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {profiles} taste profiles and {affinities} brand affinities "
+            f"in {time.perf_counter() - started:.1f} s"
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from skinly.inventory import release_expired
+from skinly.inventory.reservations import SWEEP_BATCH
+
+
+class Command(BaseCommand):
+    help = "Release expired checkout holds on stock in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=SWEEP_BATCH,
+            help="Holds released per transaction",
+        )
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Keep running and sweep every N seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            released = release_expired(batch_size=options["batch_size"])
+            elapsed = (time.perf_counter() - started) * 1000
+            if released or options["verbosity"] > 1 or not options["interval"]:
+                self.stdout.write(self.style.SUCCESS(f"Released {released} expired holds in {elapsed:.0f} ms"))
+
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
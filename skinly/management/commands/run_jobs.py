@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from skinly.jobs import work
+from skinly.jobs.queue import BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (review follow-ups) until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE,
+            help="Jobs claimed per round",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Exit once the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        def on_batch(done, failed):
+            message = f"{done} jobs done"
+            if failed:
+                message += f", {failed} failed"
+            self.stdout.write(message)
+
+        try:
+            work(
+                batch_size=options["batch_size"],
+                poll_interval=options["poll_interval"],
+                once=options["once"],
+                on_batch=on_batch,
+            )
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Job worker stopped"))
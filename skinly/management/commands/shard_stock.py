@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from skinly.inventory import shard_stock, sync_sharded_stock, unshard_stock
+from skinly.inventory.shards import shard_count
+
+
+class Command(BaseCommand):
+    help = "Spread hot products' stock over several counter rows, or move it back"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "product_ids", nargs="*", type=int,
+            help="Products to shard (or unshard with --off)",
+        )
+        parser.add_argument(
+            "--shards", type=int, default=None,
+            help=f"Counter rows per product (default: settings.STOCK_SHARDS or {shard_count()})",
+        )
+        parser.add_argument(
+            "--off", action="store_true",
+            help="Move the products' stock back into their own rows",
+        )
+        parser.add_argument(
+            "--sync", action="store_true",
+            help="Copy every sharded product's total into stock_quantity for listings",
+        )
+
+    def handle(self, *args, **options):
+        if options["sync"]:
+            synced = sync_sharded_stock()
+            self.stdout.write(self.style.SUCCESS(f"Synced stock of {synced} sharded products"))
+            return
+        if not options["product_ids"]:
+            raise CommandError("Give the ids of the products to shard, or --sync")
+
+        if options["off"]:
+            done = unshard_stock(options["product_ids"])
+            self.stdout.write(self.style.SUCCESS(f"Moved stock of {done} products back into their rows"))
+        else:
+            shards = options["shards"] or shard_count()
+            done = shard_stock(options["product_ids"], shards)
+            self.stdout.write(self.style.SUCCESS(f"Spread stock of {done} products over {shards} shards each"))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from skinly.inventory import InvalidFeed, read_feed, sync_inventory
+from skinly.inventory.sync import SYNC_CHUNK
+
+# Unknown products and invalid rows listed before the rest are summarised
+SHOW_AT_MOST = 20
+
+
+class Command(BaseCommand):
+    help = "Set stock from a supplier feed (CSV, JSON array or JSON Lines of product_id and quantity)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "file",
+            help="Feed file; CSV needs a header row with product_id (or id) and quantity (or stock)",
+        )
+        parser.add_argument(
+            "--format", choices=["csv", "json"], default=None,
+            help="Feed format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=SYNC_CHUNK,
+            help="Changed products written per transaction",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Report what would change without writing",
+        )
+
+    def _list(self, label, values):
+        shown = ", ".join(str(value) for value in values[:SHOW_AT_MOST])
+        more = f" and {len(values) - SHOW_AT_MOST} more" if len(values) > SHOW_AT_MOST else ""
+        self.stdout.write(self.style.WARNING(f"{label}: {shown}{more}"))
+
+    def handle(self, *args, **options):
+        try:
+            report = sync_inventory(
+                read_feed(options["file"], options["format"]),
+                chunk_size=options["chunk_size"],
+                dry_run=options["dry_run"],
+            )
+        except (OSError, InvalidFeed) as error:
+            raise CommandError(f"Cannot read {options['file']}: {error}")
+
+        if options["verbosity"] > 1:
+            for product_id, old, new in report.changed:
+                self.stdout.write(f"Product {product_id}: {old} -> {new}")
+        if report.unknown:
+            self._list("Unknown products", report.unknown)
+        if report.invalid:
+            self._list("Invalid rows", report.invalid)
+
+        added = sum(new - old for _, old, new in report.changed if new > old)
+        removed = sum(old - new for _, old, new in report.changed if new < old)
+        sold_out = sum(1 for _, old, new in report.changed if new == 0)
+        verb = "Would change" if options["dry_run"] else "Changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(report.changed)} of {report.rows} rows in {report.seconds:.2f} s "
+            f"(+{added} / -{removed} units, {sold_out} now out of stock); "
+            f"{report.unchanged} unchanged, {len(report.unknown)} unknown, {len(report.invalid)} invalid"
+        ))
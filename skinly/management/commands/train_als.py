@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from skinly.recommendations import train_als
+from skinly.recommendations.als import ALPHA, FACTORS, ITERATIONS, REGULARIZATION
+
+
+class Command(BaseCommand):
+    help = "Train the collaborative-filtering (ALS) model from reviews, wishlists and orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factors", type=int, default=FACTORS, help="Latent factors per user and product")
+        parser.add_argument("--iterations", type=int, default=ITERATIONS, help="Alternating least squares sweeps")
+        parser.add_argument("--regularization", type=float, default=REGULARIZATION, help="L2 penalty on the factors")
+        parser.add_argument("--alpha", type=float, default=ALPHA, help="Confidence scale for interactions")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        model = train_als(
+            factors=options["factors"],
+            iterations=options["iterations"],
+            regularization=options["regularization"],
+            alpha=options["alpha"],
+        )
+        if model is None:
+            self.stdout.write(self.style.WARNING("No reviews, wishlists or orders to train on"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained ALS on {len(model.user_ids)} users x {len(model.item_ids)} products "
+            f"in {time.perf_counter() - started:.1f} s"
+        ))
@@ -0,0 +1,147 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE skinly_product_fts USING fts5(
+        name, brand, product_type, color,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER skinly_product_fts_insert AFTER INSERT ON skinly_product BEGIN
+        INSERT INTO skinly_product_fts (rowid, name, brand, product_type, color)
+        SELECT new.id, new.name, b.name, new.product_type, c.name
+        FROM skinly_brand b, skinly_color c
+        WHERE b.id = new.brand_id AND c.id = new.color_id;
+    END
+    """,
+    """
+    CREATE TRIGGER skinly_product_fts_update
+    AFTER UPDATE OF name, product_type, brand_id, color_id ON skinly_product BEGIN
+        DELETE FROM skinly_product_fts WHERE rowid = old.id;
+        INSERT INTO skinly_product_fts (rowid, name, brand, product_type, color)
+        SELECT new.id, new.name, b.name, new.product_type, c.name
+        FROM skinly_brand b, skinly_color c
+        WHERE b.id = new.brand_id AND c.id = new.color_id;
+    END
+    """,
+    """
+    CREATE TRIGGER skinly_product_fts_delete AFTER DELETE ON skinly_product BEGIN
+        DELETE FROM skinly_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER skinly_brand_fts_update AFTER UPDATE OF name ON skinly_brand BEGIN
+        UPDATE skinly_product_fts SET brand = new.name
+        WHERE rowid IN (SELECT id FROM skinly_product WHERE brand_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER skinly_color_fts_update AFTER UPDATE OF name ON skinly_color BEGIN
+        UPDATE skinly_product_fts SET color = new.name
+        WHERE rowid IN (SELECT id FROM skinly_product WHERE color_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO skinly_product_fts (rowid, name, brand, product_type, color)
+    SELECT p.id, p.name, b.name, p.product_type, c.name
+    FROM skinly_product p
+    JOIN skinly_brand b ON b.id = p.brand_id
+    JOIN skinly_color c ON c.id = p.color_id
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS skinly_color_fts_update",
+    "DROP TRIGGER IF EXISTS skinly_brand_fts_update",
+    "DROP TRIGGER IF EXISTS skinly_product_fts_delete",
+    "DROP TRIGGER IF EXISTS skinly_product_fts_update",
+    "DROP TRIGGER IF EXISTS skinly_product_fts_insert",
+    "DROP TABLE IF EXISTS skinly_product_fts",
+]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE skinly_product ADD COLUMN search_vector tsvector",
+    "CREATE INDEX skinly_product_search_vector_gin ON skinly_product USING gin (search_vector)",
+    """
+    CREATE FUNCTION skinly_product_search_vector_refresh() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(
+                (SELECT name FROM skinly_brand WHERE id = NEW.brand_id), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.product_type, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(
+                (SELECT name FROM skinly_color WHERE id = NEW.color_id), '')), 'D');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER skinly_product_search_vector
+    BEFORE INSERT OR UPDATE OF name, product_type, brand_id, color_id ON skinly_product
+    FOR EACH ROW EXECUTE FUNCTION skinly_product_search_vector_refresh()
+    """,
+    """
+    CREATE FUNCTION skinly_brand_search_vector_refresh() RETURNS trigger AS $$
+    BEGIN
+        UPDATE skinly_product SET name = name WHERE brand_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER skinly_brand_search_vector
+    AFTER UPDATE OF name ON skinly_brand
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION skinly_brand_search_vector_refresh()
+    """,
+    """
+    CREATE FUNCTION skinly_color_search_vector_refresh() RETURNS trigger AS $$
+    BEGIN
+        UPDATE skinly_product SET name = name WHERE color_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER skinly_color_search_vector
+    AFTER UPDATE OF name ON skinly_color
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION skinly_color_search_vector_refresh()
+    """,
+    "UPDATE skinly_product SET name = name",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS skinly_color_search_vector ON skinly_color",
+    "DROP FUNCTION IF EXISTS skinly_color_search_vector_refresh()",
+    "DROP TRIGGER IF EXISTS skinly_brand_search_vector ON skinly_brand",
+    "DROP FUNCTION IF EXISTS skinly_brand_search_vector_refresh()",
+    "DROP TRIGGER IF EXISTS skinly_product_search_vector ON skinly_product",
+    "DROP FUNCTION IF EXISTS skinly_product_search_vector_refresh()",
+    "ALTER TABLE skinly_product DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0004_product_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
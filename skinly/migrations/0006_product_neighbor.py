@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0005_product_full_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('SIMILAR', 'Similar'), ('BOUGHT_TOGETHER', 'Bought Together')], max_length=20)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='skinly.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='skinly.product')),
+            ],
+            options={
+                'verbose_name': 'Product Neighbor',
+                'verbose_name_plural': 'Product Neighbors',
+                'unique_together': {('product', 'kind', 'rank')},
+            },
+        ),
+    ]
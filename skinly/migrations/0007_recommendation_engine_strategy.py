@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0006_product_neighbor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationengine',
+            name='strategy',
+            field=models.CharField(choices=[('FILTER', 'Attribute filters'), ('VECTOR', 'Vector scoring')], default='VECTOR', max_length=20),
+        ),
+    ]
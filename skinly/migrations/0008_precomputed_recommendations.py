@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0007_recommendation_engine_strategy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('engine_version', models.CharField(max_length=20)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('users_done', models.PositiveIntegerField(default=0)),
+                ('engine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='skinly.recommendationengine')),
+            ],
+            options={
+                'verbose_name': 'Recommendation Run',
+                'verbose_name_plural': 'Recommendation Runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('engine_version', models.CharField(max_length=20)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField(default=0.0)),
+                ('engine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed', to='skinly.recommendationengine')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_for', to='skinly.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Recommendation',
+                'verbose_name_plural': 'User Recommendations',
+                'unique_together': {('engine', 'user', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0008_precomputed_recommendations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recommendationengine',
+            name='strategy',
+            field=models.CharField(choices=[('FILTER', 'Attribute filters'), ('VECTOR', 'Vector scoring'), ('ALS', 'Collaborative filtering (ALS)')], default='VECTOR', max_length=20),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0009_recommendation_strategy_als'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(db_index=True, default=0.0)),
+                ('landmark', models.FloatField()),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trend', to='skinly.product')),
+            ],
+            options={
+                'verbose_name': 'Product Trend',
+                'verbose_name_plural': 'Product Trends',
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:08
+
+from django.db import migrations, models
+
+
+# ProductType and FinishType values in declaration order, as of this
+# migration; bit i of a mask is the i-th value
+PRODUCT_TYPES = [
+    'FOUNDATION', 'CONCEALER', 'POWDER', 'BLUSH', 'EYESHADOW',
+    'LIPSTICK', 'MASCARA', 'EYELINER', 'SKINCARE', 'OTHER',
+]
+FINISH_TYPES = ['MATTE', 'DEWY', 'SATIN', 'GLOSSY', 'SHIMMER']
+
+
+def _to_mask(members, text):
+    mask = 0
+    for value in text.split(','):
+        value = value.strip()
+        if value in members:
+            mask |= 1 << members.index(value)
+    return mask
+
+
+def _to_text(members, mask):
+    return ','.join(value for bit, value in enumerate(members) if mask >> bit & 1)
+
+
+def forward(apps, schema_editor):
+    TasteProfile = apps.get_model('skinly', 'TasteProfile')
+    profiles = list(TasteProfile.objects.only('id', 'preferred_product_types', 'preferred_finish_types'))
+    for profile in profiles:
+        profile.product_types_mask = _to_mask(PRODUCT_TYPES, profile.preferred_product_types)
+        profile.finish_types_mask = _to_mask(FINISH_TYPES, profile.preferred_finish_types)
+    TasteProfile.objects.bulk_update(profiles, ['product_types_mask', 'finish_types_mask'], batch_size=1000)
+
+
+def backward(apps, schema_editor):
+    TasteProfile = apps.get_model('skinly', 'TasteProfile')
+    profiles = list(TasteProfile.objects.only('id', 'product_types_mask', 'finish_types_mask'))
+    for profile in profiles:
+        profile.preferred_product_types = _to_text(PRODUCT_TYPES, profile.product_types_mask)
+        profile.preferred_finish_types = _to_text(FINISH_TYPES, profile.finish_types_mask)
+    TasteProfile.objects.bulk_update(profiles, ['preferred_product_types', 'preferred_finish_types'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0010_product_trend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tasteprofile',
+            name='finish_types_mask',
+            field=models.PositiveIntegerField(default=0, help_text='Bitmask of preferred finish types'),
+        ),
+        migrations.AddField(
+            model_name='tasteprofile',
+            name='product_types_mask',
+            field=models.PositiveIntegerField(default=0, help_text='Bitmask of preferred product types'),
+        ),
+        migrations.RunPython(forward, backward),
+        migrations.RemoveField(
+            model_name='tasteprofile',
+            name='preferred_finish_types',
+        ),
+        migrations.RemoveField(
+            model_name='tasteprofile',
+            name='preferred_product_types',
+        ),
+    ]
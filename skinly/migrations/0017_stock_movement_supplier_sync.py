@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0016_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('SALE', 'Sale'), ('ADJUSTMENT', 'Adjustment'), ('SUPPLIER_SYNC', 'Supplier sync')], max_length=20),
+        ),
+    ]
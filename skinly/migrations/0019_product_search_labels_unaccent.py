@@ -0,0 +1,125 @@
+from django.db import migrations
+
+
+# ProductType labels as of this migration; the memory index searches the
+# label next to the code, so the database documents carry both
+PRODUCT_TYPE_LABELS = (
+    ("FOUNDATION", "Foundation"),
+    ("CONCEALER", "Concealer"),
+    ("POWDER", "Powder"),
+    ("BLUSH", "Blush"),
+    ("EYESHADOW", "Eyeshadow"),
+    ("LIPSTICK", "Lipstick"),
+    ("MASCARA", "Mascara"),
+    ("EYELINER", "Eyeliner"),
+    ("SKINCARE", "Skincare"),
+    ("OTHER", "Other"),
+)
+
+
+def _product_type_text(row):
+    """SQL for the product type code followed by its label"""
+    branches = " ".join(f"WHEN '{code}' THEN '{label}'" for code, label in PRODUCT_TYPE_LABELS)
+    return f"coalesce({row}.product_type, '') || ' ' || CASE {row}.product_type {branches} ELSE '' END"
+
+
+def _sqlite_product_triggers(product_type):
+    return [
+        f"""
+        CREATE TRIGGER skinly_product_fts_insert AFTER INSERT ON skinly_product BEGIN
+            INSERT INTO skinly_product_fts (rowid, name, brand, product_type, color)
+            SELECT new.id, new.name, b.name, {product_type}, c.name
+            FROM skinly_brand b, skinly_color c
+            WHERE b.id = new.brand_id AND c.id = new.color_id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER skinly_product_fts_update
+        AFTER UPDATE OF name, product_type, brand_id, color_id ON skinly_product BEGIN
+            DELETE FROM skinly_product_fts WHERE rowid = old.id;
+            INSERT INTO skinly_product_fts (rowid, name, brand, product_type, color)
+            SELECT new.id, new.name, b.name, {product_type}, c.name
+            FROM skinly_brand b, skinly_color c
+            WHERE b.id = new.brand_id AND c.id = new.color_id;
+        END
+        """,
+        "DELETE FROM skinly_product_fts",
+        f"""
+        INSERT INTO skinly_product_fts (rowid, name, brand, product_type, color)
+        SELECT new.id, new.name, b.name, {product_type}, c.name
+        FROM skinly_product new
+        JOIN skinly_brand b ON b.id = new.brand_id
+        JOIN skinly_color c ON c.id = new.color_id
+        """,
+    ]
+
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS skinly_product_fts_update",
+    "DROP TRIGGER IF EXISTS skinly_product_fts_insert",
+]
+
+# FTS5's unicode61 tokenizer already strips accents, as tokenize() does
+SQLITE_FORWARD = SQLITE_DROP + _sqlite_product_triggers(_product_type_text("new"))
+
+SQLITE_BACKWARD = SQLITE_DROP + _sqlite_product_triggers("new.product_type")
+
+
+# tokenize() strips accents from the query, so the document drops them too
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""
+    CREATE OR REPLACE FUNCTION skinly_product_search_vector_refresh() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', unaccent(coalesce(NEW.name, ''))), 'A') ||
+            setweight(to_tsvector('simple', unaccent(coalesce(
+                (SELECT name FROM skinly_brand WHERE id = NEW.brand_id), ''))), 'B') ||
+            setweight(to_tsvector('simple', unaccent({_product_type_text("NEW")})), 'C') ||
+            setweight(to_tsvector('simple', unaccent(coalesce(
+                (SELECT name FROM skinly_color WHERE id = NEW.color_id), ''))), 'D');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "UPDATE skinly_product SET name = name",
+]
+
+POSTGRES_BACKWARD = [
+    """
+    CREATE OR REPLACE FUNCTION skinly_product_search_vector_refresh() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(
+                (SELECT name FROM skinly_brand WHERE id = NEW.brand_id), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.product_type, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(
+                (SELECT name FROM skinly_color WHERE id = NEW.color_id), '')), 'D');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "UPDATE skinly_product SET name = name",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skinly', '0018_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
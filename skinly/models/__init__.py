@@ -10,6 +10,9 @@ from .choices import (
     FinishType,
     OrderStatus,
     PaymentMethodType,
+    NeighborKind,
+    RecommendationStrategy,
+    StockMovementReason,
 )
 
 # Import user and profile models
@@ -43,6 +46,25 @@ from .system import (
     RecommendationEngine,
     SearchEngine,
     InventoryManager,
+    Job,
+)
+
+# Import precomputed recommendation models
+from .recommendation import (
+    ProductNeighbor,
+    UserRecommendation,
+    RecommendationRun,
+    ProductTrend,
+    ProductView,
+)
+
+# Import inventory models
+from .inventory import (
+    StockReservation,
+    StockHold,
+    StockShard,
+    StockMovement,
+    StockSnapshot,
 )
 
 # Import newsletter models
@@ -68,6 +90,9 @@ __all__ = [
     'FinishType',
     'OrderStatus',
     'PaymentMethodType',
+    'NeighborKind',
+    'RecommendationStrategy',
+    'StockMovementReason',
     
     # User and Profile
     'PriceRange',
@@ -93,6 +118,21 @@ __all__ = [
     'RecommendationEngine',
     'SearchEngine',
     'InventoryManager',
+    'Job',
+    
+    # Precomputed recommendations
+    'ProductNeighbor',
+    'UserRecommendation',
+    'RecommendationRun',
+    'ProductTrend',
+    'ProductView',
+    
+    # Inventory
+    'StockReservation',
+    'StockHold',
+    'StockShard',
+    'StockMovement',
+    'StockSnapshot',
     
     # Newsletter
     'NewsletterSubscriber',
@@ -47,4 +47,39 @@ class PaymentMethodType(models.TextChoices):
     CREDIT_CARD = "CREDIT_CARD", "Credit Card"
     PAYPAL = "PAYPAL", "PayPal"
     BANK_TRANSFER = "BANK_TRANSFER", "Bank Transfer"
-    CASH_ON_DELIVERY = "CASH_ON_DELIVERY", "Cash on Delivery"
\ No newline at end of file
+    CASH_ON_DELIVERY = "CASH_ON_DELIVERY", "Cash on Delivery"
+
+
+class NeighborKind(models.TextChoices):
+    SIMILAR = "SIMILAR", "Similar"
+    BOUGHT_TOGETHER = "BOUGHT_TOGETHER", "Bought Together"
+
+
+class RecommendationStrategy(models.TextChoices):
+    FILTER = "FILTER", "Attribute filters"
+    VECTOR = "VECTOR", "Vector scoring"
+    ALS = "ALS", "Collaborative filtering (ALS)"
+
+
+class StockMovementReason(models.TextChoices):
+    SALE = "SALE", "Sale"
+    ADJUSTMENT = "ADJUSTMENT", "Adjustment"
+    SUPPLIER_SYNC = "SUPPLIER_SYNC", "Supplier sync"
+
+
+def choices_to_mask(choices, values):
+    """
+    Bitmask of ``values`` for a choices class: bit i is its i-th member in
+    declaration order, so members may only ever be appended
+    """
+    members = list(choices.values)
+    mask = 0
+    for value in values:
+        if value in members:
+            mask |= 1 << members.index(value)
+    return mask
+
+
+def mask_to_choices(choices, mask):
+    """Values of a choices class set in ``mask``, in declaration order"""
+    return [value for bit, value in enumerate(choices.values) if mask >> bit & 1]
@@ -0,0 +1,102 @@
+"""
+Inventory models: checkout holds, sharded stock counters and the stock ledger
+"""
+from django.db import models
+from .choices import StockMovementReason
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product held by in-progress checkouts: the sum of its
+    StockHold rows not yet released or swept. Available to sell is
+    ``stock_quantity - reserved``; see skinly.inventory.reservations.
+    Sharded products have none, so their checkouts share no row.
+    """
+    product = models.OneToOneField("Product", on_delete=models.CASCADE, primary_key=True, related_name="reservation")
+    reserved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Stock Reservation"
+        verbose_name_plural = "Stock Reservations"
+
+    def __str__(self) -> str:
+        return f"{self.reserved} of {self.product_id} reserved"
+
+
+class StockHold(models.Model):
+    """
+    Units of a product set aside for a cart while it checks out, until
+    ``expires_at``. Expired holds are released in bulk by the sweeper.
+    """
+    cart = models.ForeignKey("Cart", on_delete=models.CASCADE, related_name="stock_holds")
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="stock_holds")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("cart", "product")
+        verbose_name = "Stock Hold"
+        verbose_name_plural = "Stock Holds"
+
+    def __str__(self) -> str:
+        return f"{self.quantity} x {self.product_id} held for cart {self.cart_id}"
+
+
+class StockShard(models.Model):
+    """
+    One of a product's stock sub-counters. A product with shards keeps its
+    stock spread over them so concurrent sales update different rows; its
+    stock is their sum and ``Product.stock_quantity`` is only a copy for
+    listings. See skinly.inventory.shards.
+    """
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="stock_shards")
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("product", "shard")
+        verbose_name = "Stock Shard"
+        verbose_name_plural = "Stock Shards"
+
+    def __str__(self) -> str:
+        return f"{self.quantity} of {self.product_id} in shard {self.shard}"
+
+
+class StockMovement(models.Model):
+    """
+    One change to a product's stock, appended to the ledger and never
+    updated. ``quantity`` is signed: sales are negative.
+    """
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="stock_movements")
+    quantity = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=StockMovementReason.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["product", "id"])]
+        verbose_name = "Stock Movement"
+        verbose_name_plural = "Stock Movements"
+
+    def __str__(self) -> str:
+        return f"{self.quantity:+d} {self.product_id} ({self.reason})"
+
+
+class StockSnapshot(models.Model):
+    """
+    A product's stock as of ledger row ``movement_id``, written by the
+    compaction job. Stock now is the latest snapshot plus the movements
+    after it; see skinly.inventory.ledger.
+    """
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="stock_snapshots")
+    quantity = models.IntegerField()
+    # last StockMovement id folded into ``quantity``
+    movement_id = models.BigIntegerField()
+    taken_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("product", "movement_id")
+        verbose_name = "Stock Snapshot"
+        verbose_name_plural = "Stock Snapshots"
+
+    def __str__(self) -> str:
+        return f"{self.quantity} of {self.product_id} at movement {self.movement_id}"
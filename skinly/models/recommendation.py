@@ -0,0 +1,104 @@
+"""
+Precomputed recommendation models
+"""
+from django.db import models
+from .choices import NeighborKind
+
+
+class ProductNeighbor(models.Model):
+    """
+    One of a product's top-N neighbours, written by an offline job.
+    Reading a product's list is a single index range scan on (product, kind, rank).
+    """
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="neighbors")
+    neighbor = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="neighbor_of")
+    kind = models.CharField(max_length=20, choices=NeighborKind.choices)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ("product", "kind", "rank")
+        verbose_name = "Product Neighbor"
+        verbose_name_plural = "Product Neighbors"
+
+    def __str__(self) -> str:
+        return f"{self.product_id} -> {self.neighbor_id} ({self.kind} #{self.rank})"
+
+
+class UserRecommendation(models.Model):
+    """
+    A user's precomputed recommendation at ``rank``, written in bulk by
+    `manage.py precompute_recommendations` for one engine version.
+    """
+    engine = models.ForeignKey("RecommendationEngine", on_delete=models.CASCADE, related_name="precomputed")
+    engine_version = models.CharField(max_length=20)
+    user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="precomputed_recommendations")
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="precomputed_for")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ("engine", "user", "rank")
+        verbose_name = "User Recommendation"
+        verbose_name_plural = "User Recommendations"
+
+    def __str__(self) -> str:
+        return f"{self.user_id} #{self.rank} -> {self.product_id}"
+
+
+class RecommendationRun(models.Model):
+    """Progress of a precompute run, so a crashed run can resume where it stopped"""
+    engine = models.ForeignKey("RecommendationEngine", on_delete=models.CASCADE, related_name="runs")
+    engine_version = models.CharField(max_length=20)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # every user with an id up to this one has been written
+    last_user_id = models.BigIntegerField(default=0)
+    users_done = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Recommendation Run"
+        verbose_name_plural = "Recommendation Runs"
+
+    def __str__(self) -> str:
+        state = "finished" if self.finished_at else f"at user {self.last_user_id}"
+        return f"{self.engine} v{self.engine_version} ({state})"
+
+
+class ProductTrend(models.Model):
+    """
+    A product's exponentially decayed interaction count, stored with
+    forward decay: events are weighted by how long after ``landmark`` they
+    happened, so ordering by ``score`` ranks products by their decayed
+    count without ever decaying the stored rows. Every row shares the same
+    landmark; see skinly.recommendations.trending.
+    """
+    product = models.OneToOneField("Product", on_delete=models.CASCADE, related_name="trend")
+    score = models.FloatField(default=0.0, db_index=True)
+    # unix time the score is measured from
+    landmark = models.FloatField()
+
+    class Meta:
+        verbose_name = "Product Trend"
+        verbose_name_plural = "Product Trends"
+
+    def __str__(self) -> str:
+        return f"{self.product_id} ({self.score:.3g})"
+
+
+class ProductView(models.Model):
+    """
+    One product page view, written in batches by a background thread
+    (see skinly.recommendations.recent). Anonymous views carry the session key.
+    """
+    user = models.ForeignKey("User", on_delete=models.CASCADE, null=True, blank=True, related_name="product_views")
+    session_key = models.CharField(max_length=40, blank=True)
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="views")
+    viewed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Product View"
+        verbose_name_plural = "Product Views"
+
+    def __str__(self) -> str:
+        return f"{self.user_id or self.session_key} viewed {self.product_id}"
@@ -1,12 +1,16 @@
 """
-System related models (RecommendationEngine, SearchEngine, InventoryManager)
+System related models (RecommendationEngine, SearchEngine, InventoryManager, Job)
 """
 from django.db import models
+from .choices import FinishType, ProductType, RecommendationStrategy, choices_to_mask
 
 
 class RecommendationEngine(models.Model):
     name = models.CharField(max_length=100, default="Main Engine")
     version = models.CharField(max_length=20, default="1.0")
+    strategy = models.CharField(
+        max_length=20, choices=RecommendationStrategy.choices, default=RecommendationStrategy.VECTOR
+    )
     last_updated = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -17,13 +21,51 @@ class RecommendationEngine(models.Model):
         return f"{self.name} v{self.version}"
 
     def generate_recommendations(self, user, limit=10):
+        """
+        Product recommendations for a user, served from the per-user cache
+        until their taste, this engine's version or the stock changes
+        """
+        from skinly.recommendations import recommendation_cache
+        
+        return recommendation_cache.get_or_compute(
+            self, user, limit, lambda: self.compute_recommendations(user, limit)
+        )
+
+    def compute_recommendations(self, user, limit=10):
         """Generate product recommendations for a user based on their taste profile"""
         from django.db.models import Q, Avg
         from .product import Product
         from .user import TasteProfile, TasteBrandAffinity
         
-        if not user.taste_profile:
-            return Product.objects.filter(stock_quantity__gt=0)[:limit]
+        # Collaborative filtering only needs reviews, wishlists or orders
+        if not user.taste_profile and self.strategy != RecommendationStrategy.ALS:
+            from skinly.recommendations import trending_products
+            return trending_products(limit)
+        
+        # Lists written by `manage.py precompute_recommendations`, unless too
+        # many of their products have gone out of stock since
+        precomputed = list(
+            Product.objects.filter(
+                precomputed_for__engine=self,
+                precomputed_for__engine_version=self.version,
+                precomputed_for__user=user,
+                stock_quantity__gt=0,
+            ).select_related('brand', 'color').order_by('precomputed_for__rank')[:limit]
+        )
+        if len(precomputed) == limit:
+            return precomputed
+        
+        # Scored strategies rank the whole catalog instead of filtering it
+        if self.strategy != RecommendationStrategy.FILTER:
+            from skinly.recommendations import get_recommender
+            return get_recommender(self.strategy).recommend(user, limit)
+        
+        return self._filter_recommendations(user, limit)
+
+    def _filter_recommendations(self, user, limit):
+        """The FILTER strategy: in-stock products matching every preference of the taste profile"""
+        from django.db.models import Q
+        from .product import Product
         
         taste = user.taste_profile
         recommended_products = Product.objects.filter(stock_quantity__gt=0)
@@ -36,8 +78,8 @@ class RecommendationEngine(models.Model):
             )
         
         # Filter by preferred product types
-        if taste.preferred_product_types:
-            product_types = taste.preferred_product_types.split(',')
+        product_types = taste.preferred_product_types
+        if product_types:
             recommended_products = recommended_products.filter(
                 product_type__in=product_types
             )
@@ -49,8 +91,8 @@ class RecommendationEngine(models.Model):
             )
         
         # Filter by finish preferences
-        if taste.preferred_finish_types:
-            finish_types = taste.preferred_finish_types.split(',')
+        finish_types = taste.preferred_finish_types
+        if finish_types:
             recommended_products = recommended_products.filter(
                 finish_type__in=finish_types
             )
@@ -72,6 +114,14 @@ class RecommendationEngine(models.Model):
 
     def update_taste_profile(self, user, product, feedback):
         """Update user's taste profile based on product feedback"""
+        self.update_taste_profile_many(user, [(product, feedback)])
+
+    def update_taste_profile_many(self, user, feedback_items):
+        """
+        Apply several (product, feedback) pairs to one user's taste profile,
+        saving the profile once and touching each brand affinity once
+        """
+        from collections import Counter
         from .user import TasteProfile, TasteBrandAffinity
         
         if not user.taste_profile:
@@ -79,34 +129,37 @@ class RecommendationEngine(models.Model):
             user.save()
         
         taste = user.taste_profile
+        liked = [
+            product for product, feedback in feedback_items
+            if feedback.lower() in ['like', 'love', 'positive']
+        ]
+        if not liked:
+            return
         
-        if feedback.lower() in ['like', 'love', 'positive']:
-            # Add product attributes to preferences
-            if product.color and product.color not in taste.preferred_colors.all():
-                taste.preferred_colors.add(product.color)
-            
-            # Add product type if not already in preferences
-            current_types = taste.preferred_product_types.split(',') if taste.preferred_product_types else []
-            if product.product_type and product.product_type not in current_types:
-                current_types.append(product.product_type)
-                taste.preferred_product_types = ','.join(current_types)
-            
-            # Add finish type if not already in preferences
-            current_finishes = taste.preferred_finish_types.split(',') if taste.preferred_finish_types else []
-            if product.finish_type and product.finish_type not in current_finishes:
-                current_finishes.append(product.finish_type)
-                taste.preferred_finish_types = ','.join(current_finishes)
-            
-            taste.save()
-            
-            # Increase brand affinity
-            affinity, created = TasteBrandAffinity.objects.get_or_create(
-                taste_profile=taste,
-                brand=product.brand,
-                defaults={'score': 0.1}
-            )
-            if not created:
-                affinity.score = min(1.0, affinity.score + 0.1)
+        # Add product attributes to preferences (add() skips colors already there)
+        color_ids = {product.color_id for product in liked if product.color_id}
+        if color_ids:
+            taste.preferred_colors.add(*color_ids)
+        
+        # Add product types and finishes to the preference bitmasks
+        taste.product_types_mask |= choices_to_mask(ProductType, [product.product_type for product in liked])
+        taste.finish_types_mask |= choices_to_mask(FinishType, [product.finish_type for product in liked])
+        taste.save()
+        
+        # Increase brand affinity by 0.1 per liked product
+        likes = Counter(product.brand_id for product in liked)
+        existing = {
+            affinity.brand_id: affinity
+            for affinity in TasteBrandAffinity.objects.filter(taste_profile=taste, brand_id__in=likes)
+        }
+        for brand_id, count in likes.items():
+            affinity = existing.get(brand_id)
+            if affinity is None:
+                TasteBrandAffinity.objects.create(
+                    taste_profile=taste, brand_id=brand_id, score=min(1.0, 0.1 * count)
+                )
+            else:
+                affinity.score = min(1.0, affinity.score + 0.1 * count)
                 affinity.save()
 
 
@@ -129,12 +182,7 @@ class SearchEngine(models.Model):
         products = Product.objects.filter(stock_quantity__gt=0)
         
         if query:
-            products = products.filter(
-                Q(name__icontains=query) |
-                Q(brand__name__icontains=query) |
-                Q(product_type__icontains=query) |
-                Q(color__name__icontains=query)
-            )
+            products = products.filter(id__in=list(self.relevance(query)))
         
         if filters:
             if 'brand' in filters:
@@ -160,6 +208,44 @@ class SearchEngine(models.Model):
         
         return products
 
+    def relevance(self, query, fuzzy=True):
+        """
+        {product_id: BM25 score} from the configured search backend.
+        With fuzzy, a query with no hits is retried once with misspelled tokens corrected.
+        """
+        from skinly.search import correct_query, get_search_backend
+        
+        # search() and rank() run the same query within one request
+        cached = getattr(self, '_relevance_cache', None)
+        if cached and cached[0] == (query, fuzzy):
+            return cached[1]
+        
+        backend = get_search_backend()
+        scores = backend.scores(query)
+        if not scores and fuzzy:
+            corrected = correct_query(query)
+            if corrected:
+                scores = backend.scores(corrected)
+        
+        self._relevance_cache = ((query, fuzzy), scores)
+        return scores
+
+    def search_ids(self, query, fuzzy=True, limit=None):
+        """Ranked product ids matching query; top-k is selected with a heap"""
+        from skinly.search import RankedResults
+        
+        return RankedResults(self.relevance(query, fuzzy)).top(limit)
+
+    def rank(self, query, products):
+        """
+        Ids of the products in a (filtered) queryset as a lazily ranked sequence.
+        Slicing it, e.g. through a Paginator, only orders the ids it returns.
+        """
+        from skinly.search import RankedResults
+        
+        matching = set(products.values_list('id', flat=True))
+        return RankedResults(self.relevance(query)).restrict(matching)
+
 
 class InventoryManager(models.Model):
     name = models.CharField(max_length=100, default="Inventory System")
@@ -173,43 +259,110 @@ class InventoryManager(models.Model):
         return self.name
 
     def update_stock(self, product_id, new_quantity):
-        """Update stock quantity for a product"""
+        """Update stock quantity for a product, recording the change in the stock ledger"""
+        from django.db import transaction
+        from skinly.inventory import record_movements, shard_stock, stock_levels
+        from skinly.inventory.stock import _after_stock_change
+        from .choices import StockMovementReason
+        from .inventory import StockShard
         from .product import Product
         
         try:
-            product = Product.objects.get(id=product_id)
-            product.stock_quantity = new_quantity
-            product.save()
+            with transaction.atomic():
+                # Locked so a sale committing meanwhile cannot skew the ledger's change
+                product = Product.objects.select_for_update().get(id=product_id)
+                shards = len(StockShard.objects.select_for_update().filter(product_id=product_id))
+                old_quantity = stock_levels([product_id])[product_id]
+                # No post_save: a change of stock matters to the search index
+                # and cached lists only when the product goes in or out of stock
+                Product.objects.filter(id=product_id).update(stock_quantity=new_quantity)
+                product.stock_quantity = new_quantity
+                if shards:
+                    shard_stock([product_id], shards, quantities={product_id: new_quantity})
+                record_movements({product_id: new_quantity - old_quantity}, StockMovementReason.ADJUSTMENT)
+                if (old_quantity > 0) != (new_quantity > 0):
+                    transaction.on_commit(lambda: _after_stock_change([product]))
             return True
         except Product.DoesNotExist:
             return False
 
     def check_availability(self, product_id):
-        """Check if product is available in stock"""
-        from .product import Product
-        
-        try:
-            product = Product.objects.get(id=product_id)
-            return product.stock_quantity > 0
-        except Product.DoesNotExist:
-            return False
+        """Check if product has stock not held by checkouts"""
+        return self.available_to_sell(product_id) > 0
+
+    def available_to_sell(self, product_id, cart=None):
+        """Stock minus units held by in-progress checkouts (other than ``cart``'s)"""
+        from skinly.inventory import available_to_sell
+
+        return available_to_sell([product_id], cart).get(product_id, 0)
+
+    def reserve(self, cart, quantities=None, seconds=None):
+        """
+        Hold stock for a cart's checkout, by default for its current items;
+        raises InsufficientStock. Returns when the holds expire.
+        """
+        from skinly.inventory import HOLD_SECONDS, reserve
+
+        if quantities is None:
+            quantities = {}
+            for product_id, quantity in cart.cart_items.values_list("product_id", "quantity"):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return reserve(cart, quantities, seconds or HOLD_SECONDS)
+
+    def release(self, cart):
+        """Release every hold of a cart"""
+        from skinly.inventory import release
+
+        return release(cart)
+
+    def release_expired_holds(self):
+        """Release every expired hold in bulk"""
+        from skinly.inventory import release_expired
+
+        return release_expired()
 
     def reduce_stock(self, product_id, quantity):
-        """Reduce stock quantity (for orders)"""
-        from .product import Product
+        """Reduce stock quantity (for orders), from its shards if it has any"""
+        from django.db import transaction
+        from skinly.inventory import InsufficientStock, decrement_stock
         
         try:
-            product = Product.objects.get(id=product_id)
-            if product.stock_quantity >= quantity:
-                product.stock_quantity -= quantity
-                product.save()
-                return True
-            return False
-        except Product.DoesNotExist:
+            with transaction.atomic():
+                decrement_stock({product_id: quantity})
+            return True
+        except InsufficientStock:
             return False
 
     def get_low_stock_products(self, threshold=10):
-        """Get products with low stock"""
+        """Get products with low stock, summing sharded counters"""
+        from skinly.inventory import current_stock
         from .product import Product
         
-        return Product.objects.filter(stock_quantity__lte=threshold)
\ No newline at end of file
+        return Product.objects.alias(current_stock=current_stock()).filter(current_stock__lte=threshold)
+
+
+class Job(models.Model):
+    """
+    A unit of deferred work in the local job queue (see skinly.jobs). Rows
+    are deleted once their handler succeeds; ``locked_until`` is the lease
+    of the worker that claimed the row.
+    """
+    kind = models.CharField(max_length=50)
+    # jobs of one kind with the same key are handled together
+    key = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    failed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["failed", "id"])]
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.key} #{self.pk}"
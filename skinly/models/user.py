@@ -5,7 +5,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 from decimal import Decimal
-from .choices import SkinTone, SkinType
+from .choices import FinishType, ProductType, SkinTone, SkinType, choices_to_mask, mask_to_choices
 
 
 class PriceRange(models.Model):
@@ -26,16 +26,34 @@ class PriceRange(models.Model):
         return f"{self.min_price} – {self.max_price}"
 
 
+class TasteProfileQuerySet(models.QuerySet):
+    def liking(self, product_types=(), finish_types=()):
+        """Profiles that prefer every one of ``product_types`` and ``finish_types``"""
+        queryset = self
+        product_mask = choices_to_mask(ProductType, product_types)
+        if product_mask:
+            queryset = queryset.alias(
+                product_match=models.F("product_types_mask").bitand(product_mask)
+            ).filter(product_match=product_mask)
+        finish_mask = choices_to_mask(FinishType, finish_types)
+        if finish_mask:
+            queryset = queryset.alias(
+                finish_match=models.F("finish_types_mask").bitand(finish_mask)
+            ).filter(finish_match=finish_mask)
+        return queryset
+
+
 class TasteProfile(models.Model):
     # muchos-a-muchos con entidades del catálogo
     preferred_colors = models.ManyToManyField(
         "Color", blank=True, related_name="taste_profiles"
     )
-    preferred_product_types = models.CharField(
-        max_length=500, blank=True, help_text="Comma-separated product types"
+    # bit i = i-th ProductType / FinishType member (see choices_to_mask)
+    product_types_mask = models.PositiveIntegerField(
+        default=0, help_text="Bitmask of preferred product types"
     )
-    preferred_finish_types = models.CharField(
-        max_length=500, blank=True, help_text="Comma-separated finish types"
+    finish_types_mask = models.PositiveIntegerField(
+        default=0, help_text="Bitmask of preferred finish types"
     )
 
     # afinidad por marca (map<Brand,float>) mediante tabla intermedia
@@ -43,6 +61,8 @@ class TasteProfile(models.Model):
         PriceRange, on_delete=models.CASCADE, null=True, blank=True, related_name="taste_profile"
     )
 
+    objects = TasteProfileQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Taste profile"
         verbose_name_plural = "Taste profiles"
@@ -50,6 +70,22 @@ class TasteProfile(models.Model):
     def __str__(self) -> str:
         return f"TasteProfile #{self.pk}"
 
+    @property
+    def preferred_product_types(self):
+        return mask_to_choices(ProductType, self.product_types_mask)
+
+    @preferred_product_types.setter
+    def preferred_product_types(self, values):
+        self.product_types_mask = choices_to_mask(ProductType, values)
+
+    @property
+    def preferred_finish_types(self):
+        return mask_to_choices(FinishType, self.finish_types_mask)
+
+    @preferred_finish_types.setter
+    def preferred_finish_types(self, values):
+        self.finish_types_mask = choices_to_mask(FinishType, values)
+
     # placeholder para futura lógica de feedback
     def update_with_feedback(self, product, feedback: str):
         """
@@ -0,0 +1,207 @@
+"""
+Keyset (cursor) pagination and cheap result counts for the catalog
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Orderings accepted by ?sort=...; the trailing id makes every key unique
+CATALOG_ORDERINGS = {
+    '': ('id',),
+    'newest': ('-id',),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'rating': ('-rating', '-id'),
+    'name': ('name', 'id'),
+}
+
+# Result sets larger than this are not counted exactly
+EXACT_COUNT_LIMIT = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction='next'):
+    payload = json.dumps({'v': values, 'd': direction}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload['v'], payload['d']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'previous') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+class CursorPage:
+    """One keyset page; cursors are opaque strings for the next/previous page"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row's (sort key, id)
+    instead of OFFSET, so deep pages cost the same as the first one and
+    no COUNT(*) is needed.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('id',)):
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering = tuple(ordering) + ('id',)
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+    def page(self, cursor=None):
+        values, direction = decode_cursor(cursor) if cursor else (None, 'next')
+        if values is not None:
+            values = self._parse(values, cursor)
+
+        backwards = direction == 'previous'
+        ordering = [self._reverse(field) for field in self.ordering] if backwards else list(self.ordering)
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(ordering, values))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            if values is not None and not backwards:
+                return CursorPage([], previous_cursor=encode_cursor(values, 'previous'))
+            return CursorPage([])
+
+        first, last = self._key(rows[0]), self._key(rows[-1])
+        if backwards:
+            next_cursor = encode_cursor(last, 'next')
+            previous_cursor = encode_cursor(first, 'previous') if has_more else None
+        else:
+            next_cursor = encode_cursor(last, 'next') if has_more else None
+            previous_cursor = encode_cursor(first, 'previous') if values is not None else None
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def _parse(self, values, cursor):
+        """The cursor's key values converted to the sort fields' types; raises InvalidCursor"""
+        if len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        parsed = []
+        for field, value in zip(self.fields, values):
+            if value is None or isinstance(value, (list, dict, bool)):
+                raise InvalidCursor(cursor)
+            model_field = self.queryset.model._meta.get_field(field)
+            try:
+                parsed.append(model_field.to_python(value))
+            except ValidationError:
+                raise InvalidCursor(cursor)
+        return parsed
+
+    def _key(self, row):
+        return [getattr(row, field) for field in self.fields]
+
+    @staticmethod
+    def _reverse(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _seek(ordering, values):
+        """Rows strictly after ``values`` in ``ordering`` (lexicographic)"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+
+def estimate_count(queryset, limit=EXACT_COUNT_LIMIT):
+    """
+    Row count for ``queryset`` without a full COUNT(*) on large sets.
+    Returns ``(count, exact)``. Postgres reports the planner's estimate once
+    the set is larger than ``limit``; other databases stop counting at
+    ``limit + 1``.
+    """
+    bounded = queryset.order_by().values('pk')[:limit + 1].count()
+    if bounded <= limit:
+        return bounded, True
+
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return max(int(plan[0]['Plan']['Plan Rows']), bounded), False
+    return bounded, False
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator that trusts a count computed elsewhere instead of running
+    COUNT(*). The count may be a cached one that has gone stale, so each
+    page fetches one row more than it shows: if the rows do not add up
+    to what the count promised, the count is dropped and the page is
+    served from a real COUNT(*), clamped to the last page.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._known_count = count
+
+    @cached_property
+    def count(self):
+        if self._known_count is not None:
+            return self._known_count
+        return super().count
+
+    def page(self, number):
+        if self._known_count is None:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        rows = list(self.object_list[bottom:top + 1])
+        if len(rows) == top - bottom + (1 if top < self.count else 0):
+            return self._get_page(rows[:top - bottom], number, self)
+
+        self._known_count = None
+        self.__dict__.pop('count', None)
+        self.__dict__.pop('num_pages', None)
+        return super().page(min(number, self.num_pages))
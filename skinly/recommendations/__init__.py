@@ -0,0 +1,103 @@
+"""
+Recommendations package for Skinly application
+"""
+
+from .als import (
+    ALSModel,
+    ALSRecommender,
+    get_als_model,
+    train_als,
+)
+from .cache import (
+    RecommendationCache,
+    invalidate_all_recommendations,
+    invalidate_user_recommendations,
+    notify_stock_out,
+    recommendation_cache,
+)
+from .cooccurrence import (
+    CooccurrenceCounts,
+    bought_together,
+    update_bought_together,
+)
+from .engines import (
+    RECOMMENDERS,
+    get_recommender,
+)
+from .evaluation import (
+    evaluate,
+    evaluate_strategy,
+)
+from .neighbors import (
+    neighbor_products,
+    store_neighbors,
+)
+from .precompute import (
+    precompute_chunk,
+    run_precompute,
+)
+from .profiles import (
+    ProfileScores,
+    rebuild_taste_profiles,
+)
+from .recent import (
+    RecentlyViewed,
+    record_view,
+    recently_viewed_products,
+)
+from .similarity import (
+    build_similarity_table,
+    compute_similar_products,
+    product_feature_matrix,
+    similar_products,
+)
+from .trending import (
+    rebuild_trends,
+    record_event,
+    trending_product_ids,
+    trending_products,
+)
+from .vector import (
+    CatalogVectors,
+    VectorRecommender,
+    get_catalog_vectors,
+)
+
+__all__ = [
+    'ALSModel',
+    'ALSRecommender',
+    'get_als_model',
+    'train_als',
+    'RecommendationCache',
+    'invalidate_all_recommendations',
+    'invalidate_user_recommendations',
+    'notify_stock_out',
+    'recommendation_cache',
+    'CooccurrenceCounts',
+    'bought_together',
+    'update_bought_together',
+    'RECOMMENDERS',
+    'get_recommender',
+    'evaluate',
+    'evaluate_strategy',
+    'neighbor_products',
+    'store_neighbors',
+    'precompute_chunk',
+    'run_precompute',
+    'ProfileScores',
+    'rebuild_taste_profiles',
+    'RecentlyViewed',
+    'record_view',
+    'recently_viewed_products',
+    'build_similarity_table',
+    'compute_similar_products',
+    'product_feature_matrix',
+    'similar_products',
+    'rebuild_trends',
+    'record_event',
+    'trending_product_ids',
+    'trending_products',
+    'CatalogVectors',
+    'VectorRecommender',
+    'get_catalog_vectors',
+]
@@ -0,0 +1,311 @@
+"""
+Implicit-feedback collaborative filtering (alternating least squares)
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from .cooccurrence import state_root
+
+# Preference added per interaction; a review counts (rating - 2) / 3 of
+# REVIEW, so one and two star reviews add nothing
+INTERACTION_WEIGHTS = {
+    "order": 3.0,
+    "wishlist": 2.0,
+    "review": 1.0,
+}
+
+# Confidence is 1 + ALPHA * preference (Hu, Koren & Volinsky, 2008)
+ALPHA = 10.0
+FACTORS = 32
+REGULARIZATION = 0.1
+ITERATIONS = 10
+
+# Users solved at once in a batched np.linalg.solve
+SOLVE_BATCH = 1024
+
+STATE_DIRECTORY = "als"
+
+
+def _review_weight(rating):
+    return INTERACTION_WEIGHTS["review"] * max(rating - 2, 0) / 3
+
+
+def load_interactions(user_ids=None):
+    """
+    (user ids, product ids, preference) arrays summed over reviews,
+    wishlists and ordered items, optionally for ``user_ids`` only
+    """
+    from skinly.models import OrderItem, Review, User
+
+    reviews = Review.objects.all()
+    wishlists = User.wishlist.through.objects.all()
+    orders = OrderItem.objects.all()
+    if user_ids is not None:
+        reviews = reviews.filter(user_id__in=user_ids)
+        wishlists = wishlists.filter(user_id__in=user_ids)
+        orders = orders.filter(order__user_id__in=user_ids)
+
+    users, products, weights = [], [], []
+    for user_id, product_id, rating in reviews.values_list("user_id", "product_id", "rating").iterator():
+        users.append(user_id)
+        products.append(product_id)
+        weights.append(_review_weight(rating))
+    for user_id, product_id in wishlists.values_list("user_id", "product_id").iterator():
+        users.append(user_id)
+        products.append(product_id)
+        weights.append(INTERACTION_WEIGHTS["wishlist"])
+    for user_id, product_id in orders.values_list("order__user_id", "product_id").iterator():
+        users.append(user_id)
+        products.append(product_id)
+        weights.append(INTERACTION_WEIGHTS["order"])
+
+    weights = np.asarray(weights, dtype=np.float32)
+    keep = weights > 0
+    return (
+        np.asarray(users, dtype=np.int64)[keep],
+        np.asarray(products, dtype=np.int64)[keep],
+        weights[keep],
+    )
+
+
+def _solve(fixed, gram, confidence, regularization):
+    """
+    Least-squares factors for every row of ``confidence`` (CSR, values are
+    ALPHA * preference) against the ``fixed`` factors, whose gram matrix
+    fixed.T @ fixed is ``gram``.
+    """
+    rows, factors = confidence.shape[0], fixed.shape[1]
+    solved = np.zeros((rows, factors), dtype=np.float32)
+    identity = regularization * np.eye(factors, dtype=np.float64)
+
+    for start in range(0, rows, SOLVE_BATCH):
+        stop = min(start + SOLVE_BATCH, rows)
+        lhs = np.empty((stop - start, factors, factors))
+        rhs = np.zeros((stop - start, factors))
+        for offset, row in enumerate(range(start, stop)):
+            begin, end = confidence.indptr[row], confidence.indptr[row + 1]
+            columns, extra = confidence.indices[begin:end], confidence.data[begin:end]
+            local = fixed[columns].astype(np.float64)
+            lhs[offset] = gram + (local.T * extra) @ local + identity
+            rhs[offset] = local.T @ (1.0 + extra)
+        solved[start:stop] = np.linalg.solve(lhs, rhs[..., None])[..., 0]
+    return solved
+
+
+class ALSModel:
+    """
+    User and item factor matrices for the implicit-feedback model. Rows
+    line up with the sorted ``user_ids`` and ``item_ids`` arrays.
+    """
+
+    def __init__(self, user_ids, item_ids, user_factors, item_factors, regularization=REGULARIZATION, alpha=ALPHA):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.regularization = regularization
+        self.alpha = alpha
+        self.item_gram = self.item_factors.T.astype(np.float64) @ self.item_factors
+
+    @classmethod
+    def train(cls, users, products, preferences, factors=FACTORS, iterations=ITERATIONS,
+              regularization=REGULARIZATION, alpha=ALPHA, seed=0):
+        user_ids, user_rows = np.unique(users, return_inverse=True)
+        item_ids, item_rows = np.unique(products, return_inverse=True)
+        confidence = sparse.csr_matrix(
+            (alpha * preferences.astype(np.float64), (user_rows, item_rows)),
+            shape=(len(user_ids), len(item_ids)),
+        )
+        confidence_t = confidence.T.tocsr()
+
+        rng = np.random.default_rng(seed)
+        user_factors = rng.normal(0, 0.01, (len(user_ids), factors)).astype(np.float32)
+        item_factors = rng.normal(0, 0.01, (len(item_ids), factors)).astype(np.float32)
+        for _ in range(iterations):
+            gram = item_factors.T.astype(np.float64) @ item_factors
+            user_factors = _solve(item_factors, gram, confidence, regularization)
+            gram = user_factors.T.astype(np.float64) @ user_factors
+            item_factors = _solve(user_factors, gram, confidence_t, regularization)
+        return cls(user_ids, item_ids, user_factors, item_factors, regularization, alpha)
+
+    def fold_in(self, product_ids, preferences):
+        """
+        Solve one user's factors against the fixed item factors (a single
+        factors x factors system, well under a millisecond). Returns None
+        when none of ``product_ids`` was in training, as the user's
+        factors would then only reflect the regularization.
+        """
+        positions = np.searchsorted(self.item_ids, product_ids)
+        positions = np.clip(positions, 0, max(len(self.item_ids) - 1, 0))
+        known = self.item_ids[positions] == product_ids if len(self.item_ids) else np.zeros(0, bool)
+        if not known.any():
+            return None
+        local = self.item_factors[positions[known]].astype(np.float64)
+        extra = self.alpha * np.asarray(preferences, dtype=np.float64)[known]
+
+        lhs = self.item_gram + (local.T * extra) @ local + self.regularization * np.eye(local.shape[1])
+        return np.linalg.solve(lhs, local.T @ (1.0 + extra)).astype(np.float32)
+
+    def scores(self, factors):
+        """Predicted preference for every item (rows of ``item_ids``)"""
+        return self.item_factors @ factors
+
+    def save(self, root=None):
+        directory = Path(root or state_root()) / STATE_DIRECTORY
+        staging = directory.with_name(f".{STATE_DIRECTORY}.tmp")
+        staging.mkdir(parents=True, exist_ok=True)
+        np.save(staging / "user_ids.npy", self.user_ids)
+        np.save(staging / "item_ids.npy", self.item_ids)
+        np.save(staging / "user_factors.npy", self.user_factors)
+        np.save(staging / "item_factors.npy", self.item_factors)
+        with open(staging / "meta.json", "w") as meta:
+            json.dump({"regularization": self.regularization, "alpha": self.alpha}, meta)
+        if directory.exists():
+            previous = directory.with_name(f".{STATE_DIRECTORY}.old")
+            os.replace(directory, previous)
+            os.replace(staging, directory)
+            for path in previous.iterdir():
+                path.unlink()
+            previous.rmdir()
+        else:
+            os.replace(staging, directory)
+
+    @classmethod
+    def load(cls, root=None):
+        directory = Path(root or state_root()) / STATE_DIRECTORY
+        with open(directory / "meta.json") as meta:
+            meta = json.load(meta)
+        return cls(
+            np.load(directory / "user_ids.npy"),
+            np.load(directory / "item_ids.npy"),
+            np.load(directory / "user_factors.npy", mmap_mode="r"),
+            np.load(directory / "item_factors.npy", mmap_mode="r"),
+            meta["regularization"],
+            meta["alpha"],
+        )
+
+
+def train_als(factors=FACTORS, iterations=ITERATIONS, regularization=REGULARIZATION, alpha=ALPHA, root=None):
+    """Train on the full interaction history and save the model (None without any history)"""
+    users, products, preferences = load_interactions()
+    if not len(users):
+        return None
+    model = ALSModel.train(users, products, preferences, factors, iterations, regularization, alpha)
+    model.save(root)
+    return model
+
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+
+def get_als_model():
+    """The saved model for this process, reloaded when it is retrained"""
+    global _model, _model_mtime
+    path = state_root() / STATE_DIRECTORY / "meta.json"
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _model_lock:
+        if _model is None or _model_mtime != mtime:
+            _model = ALSModel.load()
+            _model_mtime = mtime
+        return _model
+
+
+class ALSRecommender:
+    """
+    Collaborative-filtering recommendations. A user's factors are folded in
+    from their current interactions whenever their list is computed, so a
+    new review or order shows up without retraining; they are not kept.
+    Users with no interactions on products the model was trained on, or
+    no trained model, get the taste-vector ranking.
+    """
+
+    def __init__(self):
+        from .vector import VectorRecommender
+
+        self.fallback = VectorRecommender()
+
+    def _in_stock(self, model):
+        from .vector import get_catalog_vectors
+
+        vectors = get_catalog_vectors()
+        return np.isin(model.item_ids, vectors.ids[vectors.stock > 0])
+
+    def _top(self, model, factors, limit, exclude, in_stock):
+        scores = model.scores(factors)
+        scores[~in_stock] = -np.inf
+        if len(exclude):
+            scores[np.isin(model.item_ids, exclude)] = -np.inf
+        limit = min(limit, int(np.isfinite(scores).sum()))
+        if limit <= 0:
+            return []
+        threshold = -np.partition(-scores, limit - 1)[limit - 1]
+        best = np.flatnonzero(scores >= threshold)
+        best = best[np.lexsort((model.item_ids[best], -scores[best]))][:limit]
+        return list(zip(model.item_ids[best].tolist(), scores[best].tolist()))
+
+    def _scored(self, model, user_interactions, limit, in_stock):
+        results = {}
+        for user_id, (products, preferences, seen) in user_interactions.items():
+            factors = model.fold_in(products, preferences)
+            if factors is not None:
+                results[user_id] = self._top(model, factors, limit, seen, in_stock)
+        return results
+
+    @staticmethod
+    def _group(user_ids):
+        """{user id: (product ids, preferences, products not to recommend)}"""
+        from collections import defaultdict
+
+        from skinly.models import OrderItem, Review
+
+        users, products, preferences = load_interactions(user_ids)
+        positions = defaultdict(list)
+        for position, user_id in enumerate(users.tolist()):
+            positions[user_id].append(position)
+
+        # Reviewed or bought products are not recommended again
+        seen = defaultdict(set)
+        for user_id, product_id in Review.objects.filter(user_id__in=user_ids).values_list("user_id", "product_id"):
+            seen[user_id].add(product_id)
+        for user_id, product_id in OrderItem.objects.filter(
+            order__user_id__in=user_ids
+        ).values_list("order__user_id", "product_id"):
+            seen[user_id].add(product_id)
+
+        return {
+            user_id: (
+                products[rows], preferences[rows],
+                np.fromiter(seen[user_id], dtype=np.int64, count=len(seen[user_id])),
+            )
+            for user_id, rows in positions.items()
+        }
+
+    def recommend_scored_bulk(self, users, limit=10):
+        model = get_als_model()
+        if model is None:
+            return self.fallback.recommend_scored_bulk(users, limit)
+
+        grouped = self._group([user.pk for user in users])
+        results = self._scored(model, grouped, limit, self._in_stock(model))
+        cold = [user for user in users if not results.get(user.pk)]
+        if cold:
+            results.update(self.fallback.recommend_scored_bulk(cold, limit))
+        return results
+
+    def recommend_ids(self, user, limit=10):
+        return [product_id for product_id, _ in self.recommend_scored_bulk([user], limit)[user.pk]]
+
+    def recommend(self, user, limit=10):
+        from .vector import STOCK_SLACK, in_stock
+
+        return in_stock(self.recommend_ids(user, limit + STOCK_SLACK), limit)
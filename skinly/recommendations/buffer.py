@@ -0,0 +1,63 @@
+"""
+Per-process write buffers flushed by a background thread
+"""
+import atexit
+import logging
+import threading
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundBuffer:
+    """
+    Base for buffers that requests add to and a daemon thread writes out.
+    Subclasses add under ``_lock``, then call ``_added``, and implement
+    ``flush``. The thread flushes every ``flush_interval`` seconds, or as
+    soon as ``flush_size`` entries are pending. What is still pending
+    when the process exits is flushed then.
+    """
+
+    # Thread name, and what failed in the log message
+    name = "skinly-buffer"
+    description = "Flushing a write buffer"
+
+    def __init__(self, flush_interval, flush_size):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        atexit.register(self._flush_quietly)
+
+    def flush(self):
+        """Write every pending entry; returns how many were written"""
+        raise NotImplementedError
+
+    def _added(self, pending):
+        """Call with ``_lock`` held once ``pending`` entries are waiting"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("%s failed", self.description)
+            finally:
+                # This thread's connection would otherwise stay open forever
+                connection.close()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            # The database may already be gone at interpreter exit
+            pass
@@ -0,0 +1,122 @@
+"""
+Per-user cache of generated recommendations
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+# Cached lists are dropped after this many seconds even if nothing changed
+RECOMMENDATION_TTL = 600
+
+# Entries kept per process; the least recently used is evicted first
+MAX_CACHED_USERS = 10000
+
+# Shared-cache keys, so every worker sees invalidations. A user's version is
+# bumped when their taste changes, the global version when every profile is
+# rebuilt at once, and the stock-out epoch whenever a product runs out of
+# stock.
+USER_VERSION_KEY = "skinly:reco:user:{}"
+GLOBAL_VERSION_KEY = "skinly:reco:all"
+STOCKOUT_EPOCH_KEY = "skinly:reco:stockout"
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+class RecommendationCache:
+    """
+    LRU of recommendation lists keyed by (engine, engine version, user,
+    limit). An entry is served while the user's version matches and its
+    TTL has not passed. After a stock-out anywhere in the catalog, an entry
+    is re-checked with one query and only recomputed if it lists a
+    product that is no longer in stock.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_USERS, ttl=RECOMMENDATION_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, engine, user, limit, compute):
+        key = (engine.pk, engine.version, engine.strategy, user.pk, limit)
+        user_key = USER_VERSION_KEY.format(user.pk)
+        versions = cache.get_many([user_key, GLOBAL_VERSION_KEY, STOCKOUT_EPOCH_KEY])
+        user_version = (versions.get(user_key, 0), versions.get(GLOBAL_VERSION_KEY, 0))
+        epoch = versions.get(STOCKOUT_EPOCH_KEY, 0)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None:
+            cached_version, cached_epoch, expires, products = entry
+            if cached_version == user_version and expires > time.monotonic():
+                if cached_epoch == epoch or self._all_in_stock(products):
+                    if cached_epoch != epoch:
+                        self._store(key, (user_version, epoch, expires, products))
+                    return list(products)
+
+        products = list(compute())
+        self._store(key, (user_version, epoch, time.monotonic() + self.ttl, products))
+        return list(products)
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _all_in_stock(products):
+        from skinly.models import Product
+
+        product_ids = [product.pk for product in products]
+        in_stock = Product.objects.filter(id__in=product_ids, stock_quantity__gt=0).count()
+        return in_stock == len(product_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+recommendation_cache = RecommendationCache()
+
+
+def invalidate_user_recommendations(user_id):
+    """
+    Drop a user's cached recommendations in every worker, along with any
+    precomputed ones, which no longer reflect their taste
+    """
+    from skinly.models import UserRecommendation
+
+    _bump(USER_VERSION_KEY.format(user_id))
+    UserRecommendation.objects.filter(user_id=user_id).delete()
+
+
+def invalidate_all_recommendations():
+    """
+    Drop every cached and precomputed list, after taste profiles were
+    rewritten in bulk (which sends no per-user signals)
+    """
+    from skinly.models import UserRecommendation
+
+    _bump(GLOBAL_VERSION_KEY)
+    UserRecommendation.objects.all().delete()
+
+
+def notify_stock_out():
+    """Make every worker re-check cached lists against current stock"""
+    _bump(STOCKOUT_EPOCH_KEY)
@@ -0,0 +1,203 @@
+"""
+"Frequently bought together" scores from order history co-occurrence
+"""
+import json
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from scipy import sparse
+
+from ..models.choices import NeighborKind
+from .neighbors import neighbor_products, store_neighbors
+
+# Partners stored per product
+TOP_PARTNERS = 12
+
+# Pairs bought together in fewer orders than this are ignored
+MIN_SUPPORT = 1
+
+SCORING = ("lift", "pmi")
+
+# Orders younger than this are left for the next run: ids are handed out
+# before commit, so a newer order can become visible before an older one,
+# but no checkout transaction stays open this long
+FOLD_LAG = 60
+
+STATE_MATRIX = "cooccurrence.npz"
+STATE_META = "cooccurrence.json"
+
+
+def state_root():
+    return Path(getattr(
+        settings, "RECOMMENDATION_STATE_DIR", Path(settings.BASE_DIR) / "var" / "recommendations"
+    ))
+
+
+class CooccurrenceCounts:
+    """
+    Sparse product x product matrix of how many orders contain both
+    products; the diagonal holds each product's own order count. Columns
+    are product ids, so the shape grows with the largest id seen.
+    """
+
+    def __init__(self, matrix=None, order_count=0, last_order_id=0):
+        self.matrix = matrix if matrix is not None else sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.order_count = order_count
+        self.last_order_id = last_order_id
+
+    @classmethod
+    def load(cls, root=None):
+        root = Path(root or state_root())
+        try:
+            with open(root / STATE_META) as meta_file:
+                meta = json.load(meta_file)
+            matrix = sparse.load_npz(root / STATE_MATRIX).tocsr()
+        except FileNotFoundError:
+            return cls()
+        return cls(matrix, meta["order_count"], meta["last_order_id"])
+
+    def save(self, root=None):
+        root = Path(root or state_root())
+        root.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(root / STATE_MATRIX, self.matrix)
+        with open(root / STATE_META, "w") as meta_file:
+            json.dump({"order_count": self.order_count, "last_order_id": self.last_order_id}, meta_file)
+
+    def add_orders(self, order_ids, product_ids):
+        """
+        Count a batch of (order id, product id) pairs. Returns the ids of
+        the products whose partner lists may have changed.
+        """
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(order_ids):
+            return set()
+
+        orders, rows = np.unique(order_ids, return_inverse=True)
+        size = max(self.matrix.shape[0], int(product_ids.max()) + 1)
+        baskets = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, product_ids)),
+            shape=(len(orders), size),
+        )
+        # An order listing the same product twice still counts once
+        baskets.data[:] = 1
+        delta = (baskets.T @ baskets).tocsr()
+
+        self.matrix = _resize(self.matrix, size) + delta
+        self.order_count += len(orders)
+        self.last_order_id = max(self.last_order_id, int(orders[-1]))
+        return set(np.unique(product_ids).tolist())
+
+    def partners(self, product_ids=None, top_k=TOP_PARTNERS, scoring="lift", min_support=MIN_SUPPORT):
+        """
+        {product id: [(partner id, score), ...]} best first, for
+        ``product_ids`` (all counted products by default). Lift is
+        P(a, b) / (P(a) P(b)); PMI is its logarithm.
+        """
+        if scoring not in SCORING:
+            raise ValueError(f"Unknown scoring {scoring!r}, expected one of {SCORING}")
+
+        counts = self.matrix
+        item_counts = counts.diagonal().astype(np.float64)
+        if product_ids is None:
+            product_ids = np.flatnonzero(item_counts)
+
+        result = {}
+        for product_id in product_ids:
+            product_id = int(product_id)
+            if product_id >= counts.shape[0] or not item_counts[product_id]:
+                result[product_id] = []
+                continue
+
+            start, stop = counts.indptr[product_id], counts.indptr[product_id + 1]
+            partners = counts.indices[start:stop]
+            together = counts.data[start:stop].astype(np.float64)
+            keep = (partners != product_id) & (together >= min_support)
+            partners, together = partners[keep], together[keep]
+
+            scores = together * self.order_count / (item_counts[product_id] * item_counts[partners])
+            if scoring == "pmi":
+                scores = np.log(scores)
+
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                partners, scores, together = partners[best], scores[best], together[best]
+            # Best score first; more shared orders break ties
+            order = np.lexsort((partners, -together, -scores))
+            result[product_id] = [
+                (int(partners[index]), round(float(scores[index]), 6)) for index in order
+            ]
+        return result
+
+
+def _resize(matrix, size):
+    if matrix.shape == (size, size):
+        return matrix
+    matrix = matrix.tocoo()
+    return sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=(size, size))
+
+
+def _fold_upto(lag):
+    """Id of the newest order placed more than ``lag`` seconds ago"""
+    from skinly.models import Order
+
+    return Order.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=lag)
+    ).aggregate(upto=Max("id"))["upto"] or 0
+
+
+def _order_items(after_order_id=0, upto=None):
+    from skinly.models import OrderItem
+
+    items = OrderItem.objects.filter(order_id__gt=after_order_id)
+    if upto is not None:
+        items = items.filter(order_id__lte=upto)
+    rows = np.array(
+        items.order_by("order_id")
+        .values_list("order_id", "product_id"),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
+
+
+def update_bought_together(full=False, top_k=TOP_PARTNERS, scoring="lift", min_support=MIN_SUPPORT, root=None,
+                           lag=FOLD_LAG):
+    """
+    Fold orders placed since the last run, up to ``lag`` seconds ago, into
+    the saved counts and rewrite the partner lists of the products they
+    touched. ``full`` recounts the whole order history and rewrites every
+    list. Returns (orders, products) processed.
+    """
+    counts = CooccurrenceCounts() if full else CooccurrenceCounts.load(root)
+    orders_before = counts.order_count
+    upto = max(_fold_upto(lag), counts.last_order_id)
+    changed = counts.add_orders(*_order_items(counts.last_order_id, upto))
+    # Every order up to ``upto`` is visible by now, even those without items
+    counts.last_order_id = upto
+
+    if full:
+        store_neighbors(NeighborKind.BOUGHT_TOGETHER, counts.partners(
+            top_k=top_k, scoring=scoring, min_support=min_support,
+        ))
+    elif changed:
+        # A new order changes the lift of every partner of its products
+        affected = set(changed)
+        for product_id in changed:
+            start, stop = counts.matrix.indptr[product_id], counts.matrix.indptr[product_id + 1]
+            affected.update(counts.matrix.indices[start:stop].tolist())
+        store_neighbors(
+            NeighborKind.BOUGHT_TOGETHER,
+            counts.partners(sorted(affected), top_k=top_k, scoring=scoring, min_support=min_support),
+            product_ids=affected,
+        )
+    counts.save(root)
+    return counts.order_count - orders_before, len(changed)
+
+
+def bought_together(product_ids, limit=4, skin_type=None):
+    """Precomputed in-stock basket partners of one or more products"""
+    return neighbor_products(product_ids, NeighborKind.BOUGHT_TOGETHER, limit, skin_type)
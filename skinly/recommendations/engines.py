@@ -0,0 +1,20 @@
+"""
+Registry of the recommender implementations a RecommendationEngine can use
+"""
+from django.utils.module_loading import import_string
+
+from ..models.choices import RecommendationStrategy
+
+RECOMMENDERS = {
+    RecommendationStrategy.VECTOR: "skinly.recommendations.vector.VectorRecommender",
+    RecommendationStrategy.ALS: "skinly.recommendations.als.ALSRecommender",
+}
+
+_recommenders = {}
+
+
+def get_recommender(strategy):
+    """Shared recommender instance for a RecommendationStrategy value"""
+    if strategy not in _recommenders:
+        _recommenders[strategy] = import_string(RECOMMENDERS[strategy])()
+    return _recommenders[strategy]
@@ -0,0 +1,220 @@
+"""
+Offline evaluation of the recommendation strategies on a time split of the history
+"""
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import override_settings
+
+from ..models.choices import RecommendationStrategy
+
+# Recommendations requested per user
+K = 10
+
+# Share of the review and order history, by time, held out as the test set
+TEST_FRACTION = 0.2
+
+# Reviews at or above this rating count as relevant test items
+RELEVANT_RATING = 4
+
+# Users scored per strategy; peak memory is traced on the first MEMORY_USERS
+# of them in a second pass, since tracing slows every allocation
+MAX_USERS = 1000
+MEMORY_USERS = 100
+
+
+def split_cutoff(test_fraction=TEST_FRACTION):
+    """Time at which the latest ``test_fraction`` of reviews and orders begins"""
+    from skinly.models import OrderItem, Review
+
+    times = list(Review.objects.values_list("created_at", flat=True))
+    times += list(OrderItem.objects.values_list("order__created_at", flat=True))
+    if not times:
+        return None
+    times.sort()
+    return times[min(int(len(times) * (1 - test_fraction)), len(times) - 1)]
+
+
+def held_out_items(cutoff):
+    """{user id: set of product ids} reviewed well or ordered from ``cutoff`` on"""
+    from skinly.models import OrderItem, Review
+
+    relevant = defaultdict(set)
+    for user_id, product_id in Review.objects.filter(
+        created_at__gte=cutoff, rating__gte=RELEVANT_RATING
+    ).values_list("user_id", "product_id"):
+        relevant[user_id].add(product_id)
+    for user_id, product_id in OrderItem.objects.filter(
+        order__created_at__gte=cutoff
+    ).values_list("order__user_id", "product_id"):
+        relevant[user_id].add(product_id)
+    return relevant
+
+
+def _rewind(cutoff, relevant):
+    """
+    Bring the database back to ``cutoff`` so no strategy sees the test set:
+    drop later reviews, orders and product views, and the wishlist entries
+    of held-out items (``relevant``), as wishlists carry no date. Taste
+    profiles, trending scores and bought-together lists are then rebuilt
+    from what is left and precomputed lists dropped. Only called inside a
+    transaction that is rolled back.
+    """
+    from skinly.models import (
+        Order, ProductView, Review, TasteBrandAffinity, TasteProfile, User, UserRecommendation,
+    )
+
+    from .cooccurrence import update_bought_together
+    from .profiles import rebuild_taste_profiles
+    from .trending import rebuild_trends
+
+    Review.objects.filter(created_at__gte=cutoff).delete()
+    Order.objects.filter(created_at__gte=cutoff).delete()
+    ProductView.objects.filter(viewed_at__gte=cutoff).delete()
+    wishlist = User.wishlist.through.objects
+    wishlist.filter(id__in=[
+        entry_id for entry_id, user_id, product_id in wishlist.filter(
+            user_id__in=list(relevant)
+        ).values_list("id", "user_id", "product_id")
+        if product_id in relevant[user_id]
+    ]).delete()
+    UserRecommendation.objects.all().delete()
+
+    # The rebuild leaves users without history alone, and theirs may all be held out
+    TasteProfile.objects.update(product_types_mask=0, finish_types_mask=0)
+    TasteProfile.preferred_colors.through.objects.all().delete()
+    TasteBrandAffinity.objects.all().delete()
+    rebuild_taste_profiles()
+    rebuild_trends(cutoff)
+    # Nothing else writes to the copy, so every order is already visible
+    update_bought_together(full=True, lag=0)
+
+
+def check_copy(database):
+    """Raise ValueError unless ``database`` is a configured alias other than the default database"""
+    if database not in connections.databases:
+        raise ValueError(f"Unknown database {database!r}")
+    if database == DEFAULT_DB_ALIAS or (
+        connections.databases[database]["NAME"] == connections.databases[DEFAULT_DB_ALIAS]["NAME"]
+    ):
+        raise ValueError("Evaluation rewrites the data it runs on; point it at a copy, not the default database")
+
+
+class _Pinned:
+    """Database router sending every query to one database"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def db_for_read(self, model, **hints):
+        return self.alias
+
+    def db_for_write(self, model, **hints):
+        return self.alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def evaluate_strategy(engine, strategy, users, relevant, k=K, memory_users=MEMORY_USERS):
+    """Quality and cost of one strategy for ``users`` against their ``relevant`` items"""
+    from skinly.models import Product
+
+    engine.strategy = strategy
+    recommend = engine.compute_recommendations
+    # The first call builds per-process state (catalog vectors, model)
+    recommend(users[0], k)
+
+    latencies, hits, precision, recall = [], 0, [], []
+    recommended = set()
+    for user in users:
+        started = time.perf_counter()
+        product_ids = [product.pk for product in recommend(user, k)]
+        latencies.append(time.perf_counter() - started)
+
+        found = len(set(product_ids) & relevant[user.pk])
+        hits += found
+        precision.append(found / k)
+        recall.append(found / len(relevant[user.pk]))
+        recommended.update(product_ids)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for user in users[:memory_users]:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            recommend(user, k)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    catalog = Product.objects.filter(stock_quantity__gt=0).count()
+    return {
+        "strategy": str(strategy),
+        "users": len(users),
+        "hits": hits,
+        f"precision@{k}": float(np.mean(precision)),
+        f"recall@{k}": float(np.mean(recall)),
+        "coverage": len(recommended) / catalog if catalog else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "peak_kib": _percentile(peaks, 50) / 1024,
+        "max_peak_kib": max(peaks, default=0) / 1024,
+    }
+
+
+def evaluate(database, strategies=None, k=K, test_fraction=TEST_FRACTION, cutoff=None,
+             max_users=MAX_USERS, memory_users=MEMORY_USERS, seed=0):
+    """
+    Replay a time split of the review and order history against each
+    strategy (every RecommendationStrategy by default). ``database`` is the
+    alias of a copy of the data, never the default database: the copy is
+    rewound to the cutoff inside one long transaction that is always rolled
+    back. Every query is routed to it, the cache is a private in-memory
+    one and the ALS model and co-occurrence counts are built into a
+    temporary directory. Returns (cutoff, number of test users, [result
+    per strategy]).
+    """
+    from skinly.models import RecommendationEngine, User
+
+    from .als import train_als
+
+    check_copy(database)
+    strategies = list(strategies or RecommendationStrategy.values)
+    results = []
+    with tempfile.TemporaryDirectory() as state_dir, override_settings(
+        RECOMMENDATION_STATE_DIR=state_dir,
+        DATABASE_ROUTERS=[_Pinned(database)],
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "evaluation"}},
+    ):
+        cutoff = cutoff or split_cutoff(test_fraction)
+        if cutoff is None:
+            return None, 0, []
+
+        relevant = held_out_items(cutoff)
+        user_ids = sorted(relevant)
+        if len(user_ids) > max_users:
+            user_ids = sorted(np.random.default_rng(seed).choice(user_ids, max_users, replace=False).tolist())
+
+        with transaction.atomic(using=database):
+            _rewind(cutoff, relevant)
+            if RecommendationStrategy.ALS in strategies:
+                train_als()
+            users = list(User.objects.filter(id__in=user_ids).select_related(
+                "taste_profile__price_range"
+            ).order_by("id"))
+            engine = RecommendationEngine.objects.first() or RecommendationEngine.objects.create()
+            if users:
+                for strategy in strategies:
+                    results.append(evaluate_strategy(engine, strategy, users, relevant, k, memory_users))
+            transaction.set_rollback(True, using=database)
+    return cutoff, len(user_ids), results
@@ -0,0 +1,63 @@
+"""
+Storage and lookup of precomputed product neighbour lists
+"""
+from django.db import transaction
+from django.db.models import Q, Sum
+
+BULK_BATCH_SIZE = 1000
+
+
+def store_neighbors(kind, neighbors, product_ids=None):
+    """
+    Replace the ``kind`` neighbour lists with ``neighbors``, a mapping of
+    product id -> [(neighbor id, score), ...] best first. Only the lists of
+    ``product_ids`` are replaced when given, otherwise all of them.
+    """
+    from skinly.models import Product, ProductNeighbor
+
+    # Lists computed offline may still mention products deleted since
+    live = set(Product.objects.values_list("id", flat=True))
+    rows = [
+        ProductNeighbor(product_id=product_id, neighbor_id=neighbor_id, kind=kind, rank=rank, score=score)
+        for product_id, ranked in neighbors.items() if product_id in live
+        for rank, (neighbor_id, score) in enumerate(
+            pair for pair in ranked if pair[0] in live
+        )
+    ]
+    with transaction.atomic():
+        replaced = ProductNeighbor.objects.filter(kind=kind)
+        if product_ids is not None:
+            replaced = replaced.filter(product_id__in=list(product_ids))
+        replaced.delete()
+        ProductNeighbor.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+    return len(rows)
+
+
+def neighbor_products(product_ids, kind, limit=4, skin_type=None):
+    """
+    In-stock neighbours of ``product_ids`` (excluding those products), best
+    summed score first. One aggregate query on the neighbour table plus one
+    to fetch the winning products.
+    """
+    from skinly.models import ProductNeighbor
+    from skinly.search import hydrate_products
+
+    product_ids = list(product_ids)
+    rows = ProductNeighbor.objects.filter(
+        product_id__in=product_ids,
+        kind=kind,
+        neighbor__stock_quantity__gt=0,
+    ).exclude(neighbor_id__in=product_ids)
+
+    if skin_type:
+        rows = rows.filter(
+            Q(neighbor__skin_type_compatibility__isnull=True) |
+            Q(neighbor__skin_type_compatibility=skin_type)
+        )
+
+    ranked = (
+        rows.values("neighbor_id")
+        .annotate(total=Sum("score"))
+        .order_by("-total", "neighbor_id")[:limit]
+    )
+    return hydrate_products([row["neighbor_id"] for row in ranked])
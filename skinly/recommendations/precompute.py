@@ -0,0 +1,152 @@
+"""
+Batch precompute of every user's recommendations into UserRecommendation
+"""
+import multiprocessing
+import os
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .neighbors import BULK_BATCH_SIZE
+
+# Recommendations stored per user; pages show fewer after dropping
+# products that went out of stock since the run
+PRECOMPUTE_LIMIT = 20
+
+# Users per work unit; also the checkpoint granularity
+CHUNK_SIZE = 1000
+
+
+def user_id_chunks(after_user_id=0, chunk_size=CHUNK_SIZE):
+    """(first id, last id, user count) ranges over users with a taste profile"""
+    from skinly.models import User
+
+    user_ids = (
+        User.objects.filter(taste_profile__isnull=False, id__gt=after_user_id)
+        .order_by("id").values_list("id", flat=True)
+    )
+    chunk = []
+    for user_id in user_ids.iterator(chunk_size=chunk_size * 10):
+        chunk.append(user_id)
+        if len(chunk) == chunk_size:
+            yield chunk[0], chunk[-1], len(chunk)
+            chunk = []
+    if chunk:
+        yield chunk[0], chunk[-1], len(chunk)
+
+
+def score_users(engine, users, limit):
+    """{user id: [(product id, score), ...]} with the engine's strategy"""
+    from skinly.models import RecommendationStrategy
+
+    from .engines import get_recommender
+
+    # Not engine.compute_recommendations: it serves the stored lists this
+    # run is replacing while enough of their products are in stock
+    if engine.strategy == RecommendationStrategy.FILTER:
+        recommend = engine._filter_recommendations
+    else:
+        recommender = get_recommender(engine.strategy)
+        if hasattr(recommender, "recommend_scored_bulk"):
+            return recommender.recommend_scored_bulk(users, limit)
+        recommend = recommender.recommend
+    return {
+        user.pk: [(product.pk, 0.0) for product in recommend(user, limit)]
+        for user in users
+    }
+
+
+def precompute_chunk(engine_id, first_user_id, last_user_id, limit=PRECOMPUTE_LIMIT):
+    """
+    Score one id range of users and replace their stored recommendations.
+    Runs inside pool workers; returns (last user id, users written).
+    """
+    from skinly.models import RecommendationEngine, User, UserRecommendation
+
+    engine = RecommendationEngine.objects.get(pk=engine_id)
+    users = list(
+        User.objects.filter(
+            taste_profile__isnull=False, id__gte=first_user_id, id__lte=last_user_id
+        ).select_related("taste_profile__price_range")
+    )
+    scored = score_users(engine, users, limit)
+
+    rows = [
+        UserRecommendation(
+            engine=engine, engine_version=engine.version, user_id=user_id,
+            product_id=product_id, rank=rank, score=score,
+        )
+        for user_id, ranked in scored.items()
+        for rank, (product_id, score) in enumerate(ranked)
+    ]
+    with transaction.atomic():
+        UserRecommendation.objects.filter(engine=engine, user_id__in=list(scored)).delete()
+        UserRecommendation.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+    return last_user_id, len(scored)
+
+
+def _precompute_chunk(args):
+    return precompute_chunk(*args)
+
+
+def _init_worker():
+    # Spawned (non-fork) workers start without Django configured
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def run_precompute(engine, limit=PRECOMPUTE_LIMIT, chunk_size=CHUNK_SIZE, workers=None,
+                   restart=False, progress=None):
+    """
+    Precompute recommendations for every user with a taste profile.
+    Progress is checkpointed in a RecommendationRun after each chunk, in
+    user id order, so an interrupted run resumes after the last chunk
+    written unless ``restart``. ``progress(run, total)`` is called after
+    every chunk.
+    """
+    from skinly.models import RecommendationRun, User
+
+    run = None
+    if not restart:
+        run = RecommendationRun.objects.filter(
+            engine=engine, engine_version=engine.version, finished_at__isnull=True
+        ).order_by("-started_at").first()
+    if run is None:
+        run = RecommendationRun.objects.create(engine=engine, engine_version=engine.version)
+
+    total = run.users_done + User.objects.filter(
+        taste_profile__isnull=False, id__gt=run.last_user_id
+    ).count()
+    chunks = [
+        (engine.pk, first, last, limit)
+        for first, last, _ in user_id_chunks(run.last_user_id, chunk_size)
+    ]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(chunks) > 1:
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context("fork" if os.name == "posix" else "spawn")
+        with context.Pool(workers, initializer=_init_worker) as pool:
+            # imap keeps chunk order, so the checkpoint never skips a chunk
+            for last_user_id, users in pool.imap(_precompute_chunk, chunks):
+                _checkpoint(run, last_user_id, users, total, progress)
+    else:
+        for chunk in chunks:
+            last_user_id, users = precompute_chunk(*chunk)
+            _checkpoint(run, last_user_id, users, total, progress)
+
+    run.finished_at = timezone.now()
+    run.save(update_fields=["finished_at"])
+    return run
+
+
+def _checkpoint(run, last_user_id, users, total, progress):
+    run.last_user_id = last_user_id
+    run.users_done += users
+    run.save(update_fields=["last_user_id", "users_done"])
+    if progress:
+        progress(run, total)
@@ -0,0 +1,212 @@
+"""
+Rebuild every taste profile from the full review, wishlist and order history
+"""
+import time
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from ..catalog.snapshot import CODES, get_catalog_snapshot, read_catalog_columns, snapshot_columns
+from .neighbors import BULK_BATCH_SIZE
+
+# Weight of one interaction before decay. A review counts (rating - 3) / 2
+# of REVIEW, so one and two star reviews push attributes away.
+INTERACTION_WEIGHTS = {
+    "review": 1.0,
+    "wishlist": 1.0,
+    "order": 1.5,
+}
+
+# Reviews and orders count half as much after this many days; wishlist
+# entries have no date and never decay
+HALF_LIFE_DAYS = 180
+
+# Decayed weight an attribute needs to become a preferred type, finish or color
+PREFERENCE_THRESHOLD = 0.75
+
+# Brand affinity added per unit of weight, as one like adds in
+# RecommendationEngine.update_taste_profile; affinities are clipped to 0..1
+AFFINITY_STEP = 0.1
+
+# Users written per transaction
+USER_BATCH = 5000
+
+
+def _decay(timestamps, now, half_life_days):
+    age_days = np.maximum(now - timestamps, 0) / 86400
+    return np.exp2(-age_days / half_life_days)
+
+
+def load_history(half_life_days=HALF_LIFE_DAYS, now=None):
+    """(user ids, product ids, decayed weights) over every review, wishlist entry and ordered item"""
+    from skinly.models import OrderItem, Review, User
+
+    now = time.time() if now is None else now
+    parts = []
+
+    reviews = list(Review.objects.values_list("user_id", "product_id", "rating", "created_at").iterator(chunk_size=10000))
+    if reviews:
+        user_ids, product_ids, ratings, created = zip(*reviews)
+        timestamps = np.fromiter((value.timestamp() for value in created), dtype=np.float64, count=len(created))
+        weights = INTERACTION_WEIGHTS["review"] * (np.asarray(ratings, dtype=np.float64) - 3) / 2
+        parts.append((user_ids, product_ids, weights * _decay(timestamps, now, half_life_days)))
+
+    wishlist = list(User.wishlist.through.objects.values_list("user_id", "product_id").iterator(chunk_size=10000))
+    if wishlist:
+        user_ids, product_ids = zip(*wishlist)
+        parts.append((user_ids, product_ids, np.full(len(wishlist), INTERACTION_WEIGHTS["wishlist"])))
+
+    orders = list(OrderItem.objects.values_list("order__user_id", "product_id", "order__created_at").iterator(chunk_size=10000))
+    if orders:
+        user_ids, product_ids, created = zip(*orders)
+        timestamps = np.fromiter((value.timestamp() for value in created), dtype=np.float64, count=len(created))
+        parts.append((user_ids, product_ids, INTERACTION_WEIGHTS["order"] * _decay(timestamps, now, half_life_days)))
+
+    if not parts:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float64)
+    return (
+        np.concatenate([np.asarray(part[0], dtype=np.int64) for part in parts]),
+        np.concatenate([np.asarray(part[1], dtype=np.int64) for part in parts]),
+        np.concatenate([np.asarray(part[2], dtype=np.float64) for part in parts]),
+    )
+
+
+def _one_hot(codes, width):
+    count = len(codes)
+    return sparse.csr_matrix(
+        (np.ones(count), (np.arange(count), np.asarray(codes, dtype=np.int64))), shape=(count, width)
+    )
+
+
+def _masks(scores, threshold):
+    """Bitmask per row of a (users x 1 + choices) score matrix; column 0 is 'no value'"""
+    chosen = np.asarray(scores[:, 1:] >= threshold, dtype=np.int64)
+    return chosen @ (1 << np.arange(chosen.shape[1], dtype=np.int64))
+
+
+class ProfileScores:
+    """
+    Per-user attribute scores: the user x product weight matrix multiplied
+    by a one-hot product x attribute matrix for each attribute group
+    """
+
+    def __init__(self, users, products, weights, columns):
+        catalog_ids = np.asarray(columns["id"])
+        positions = np.searchsorted(catalog_ids, products)
+        positions = np.clip(positions, 0, max(len(catalog_ids) - 1, 0))
+        known = catalog_ids[positions] == products if len(catalog_ids) else np.zeros(len(products), bool)
+
+        self.user_ids, rows = np.unique(users[known], return_inverse=True)
+        history = sparse.csr_matrix(
+            (weights[known], (rows, positions[known])), shape=(len(self.user_ids), len(catalog_ids))
+        )
+
+        self.product_types = (history @ _one_hot(columns["product_type"], len(CODES["product_type"]) + 1)).toarray()
+        self.finish_types = (history @ _one_hot(columns["finish_type"], len(CODES["finish_type"]) + 1)).toarray()
+
+        self.color_ids, color_codes = np.unique(np.asarray(columns["color_id"]), return_inverse=True)
+        self.colors = (history @ _one_hot(color_codes, len(self.color_ids))).tocsr()
+        self.brand_ids, brand_codes = np.unique(np.asarray(columns["brand_id"]), return_inverse=True)
+        self.brands = (history @ _one_hot(brand_codes, len(self.brand_ids))).tocsr()
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+def _ensure_profiles(user_ids):
+    """{user id: taste profile id}, creating profiles for users without one"""
+    from skinly.models import TasteProfile, User
+
+    profile_ids = {}
+    missing = []
+    for start in range(0, len(user_ids), BULK_BATCH_SIZE):
+        batch = user_ids[start:start + BULK_BATCH_SIZE].tolist()
+        for user_id, profile_id in User.objects.filter(id__in=batch).values_list("id", "taste_profile_id"):
+            if profile_id is None:
+                missing.append(user_id)
+            else:
+                profile_ids[user_id] = profile_id
+
+    if missing:
+        with transaction.atomic():
+            profiles = TasteProfile.objects.bulk_create([TasteProfile() for _ in missing], batch_size=BULK_BATCH_SIZE)
+            users = [User(id=user_id, taste_profile_id=profile.pk) for user_id, profile in zip(missing, profiles)]
+            User.objects.bulk_update(users, ["taste_profile"], batch_size=BULK_BATCH_SIZE)
+        profile_ids.update((user.pk, user.taste_profile_id) for user in users)
+    return profile_ids
+
+
+def _write_batch(scores, start, stop, profile_ids, threshold):
+    from skinly.models import TasteBrandAffinity, TasteProfile
+
+    color_through = TasteProfile.preferred_colors.through
+    product_masks = _masks(scores.product_types[start:stop], threshold)
+    finish_masks = _masks(scores.finish_types[start:stop], threshold)
+
+    profiles, colors, affinities = [], [], []
+    for offset, user_id in enumerate(scores.user_ids[start:stop].tolist()):
+        row = start + offset
+        profile_id = profile_ids[user_id]
+        profiles.append(TasteProfile(
+            id=profile_id,
+            product_types_mask=int(product_masks[offset]),
+            finish_types_mask=int(finish_masks[offset]),
+        ))
+
+        begin, end = scores.colors.indptr[row], scores.colors.indptr[row + 1]
+        liked = scores.colors.indices[begin:end][scores.colors.data[begin:end] >= threshold]
+        colors.extend(
+            color_through(tasteprofile_id=profile_id, color_id=color_id)
+            for color_id in scores.color_ids[liked].tolist()
+        )
+
+        begin, end = scores.brands.indptr[row], scores.brands.indptr[row + 1]
+        values = np.minimum(scores.brands.data[begin:end] * AFFINITY_STEP, 1.0)
+        liked = values > 0
+        affinities.extend(
+            TasteBrandAffinity(taste_profile_id=profile_id, brand_id=brand_id, score=round(score, 4))
+            for brand_id, score in zip(
+                scores.brand_ids[scores.brands.indices[begin:end][liked]].tolist(), values[liked].tolist()
+            )
+        )
+
+    batch_profile_ids = [profile.pk for profile in profiles]
+    with transaction.atomic():
+        TasteProfile.objects.bulk_update(profiles, ["product_types_mask", "finish_types_mask"], batch_size=BULK_BATCH_SIZE)
+        color_through.objects.filter(tasteprofile_id__in=batch_profile_ids).delete()
+        color_through.objects.bulk_create(colors, batch_size=BULK_BATCH_SIZE)
+        TasteBrandAffinity.objects.filter(taste_profile_id__in=batch_profile_ids).delete()
+        TasteBrandAffinity.objects.bulk_create(affinities, batch_size=BULK_BATCH_SIZE)
+    return len(affinities)
+
+
+def rebuild_taste_profiles(half_life_days=HALF_LIFE_DAYS, threshold=PREFERENCE_THRESHOLD,
+                           batch_size=USER_BATCH, progress=None):
+    """
+    Recompute the preferred product types, finishes, colors and brand
+    affinities of every user with any history, replacing what
+    update_taste_profile accumulated. Users without history keep their
+    profile. Returns (profiles, brand affinities) written; ``progress(done,
+    total)`` is called after each batch.
+    """
+    from .cache import invalidate_all_recommendations
+
+    snapshot = get_catalog_snapshot()
+    # Products added since the snapshot have history too
+    columns = snapshot_columns(snapshot) if snapshot is not None else read_catalog_columns()
+    scores = ProfileScores(*load_history(half_life_days), columns)
+    if not len(scores):
+        return 0, 0
+
+    profile_ids = _ensure_profiles(scores.user_ids)
+    affinities = 0
+    for start in range(0, len(scores), batch_size):
+        stop = min(start + batch_size, len(scores))
+        affinities += _write_batch(scores, start, stop, profile_ids, threshold)
+        if progress:
+            progress(stop, len(scores))
+
+    # Bulk writes send no signals, so cached and precomputed lists are dropped here
+    invalidate_all_recommendations()
+    return len(scores), affinities
@@ -0,0 +1,139 @@
+"""
+Recently viewed products: a small per-visitor LRU plus a batched view log
+"""
+import base64
+from array import array
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .buffer import BackgroundBuffer
+
+# Products remembered per visitor, most recent first
+MAX_RECENT = 12
+
+# Signed-in visitors keep their list in the cache, which every worker
+# shares (see CACHES in settings), so it follows them across sessions and
+# devices; anonymous ones in their session. The keys name the 64-bit
+# packing, so lists packed as 32-bit ints are never misread
+RECENT_CACHE_KEY = "skinly:recent64:{}"
+RECENT_CACHE_TIMEOUT = 30 * 24 * 3600
+RECENT_SESSION_KEY = "skinly_recent64"
+
+# The view log is written every FLUSH_INTERVAL seconds by a background
+# thread, or as soon as FLUSH_SIZE views are waiting
+FLUSH_INTERVAL = 5
+FLUSH_SIZE = 500
+
+
+def pack_ids(product_ids):
+    """Product ids as base64 of unsigned 64-bit ints (about 10.7 bytes per id)"""
+    return base64.b64encode(array("Q", product_ids).tobytes()).decode("ascii")
+
+
+def unpack_ids(packed):
+    if not packed:
+        return []
+    ids = array("Q")
+    try:
+        ids.frombytes(base64.b64decode(packed))
+    except (ValueError, TypeError):
+        return []
+    return ids.tolist()
+
+
+class RecentlyViewed:
+    """A visitor's recently viewed product ids, most recent first"""
+
+    def __init__(self, request, size=MAX_RECENT):
+        self.request = request
+        self.size = size
+        user = getattr(request, "user", None)
+        self.cache_key = RECENT_CACHE_KEY.format(user.pk) if user is not None and user.is_authenticated else None
+
+    def ids(self):
+        if self.cache_key:
+            return unpack_ids(cache.get(self.cache_key))
+        return unpack_ids(self.request.session.get(RECENT_SESSION_KEY))
+
+    def add(self, product_id):
+        ids = self.ids()
+        if ids[:1] == [product_id]:
+            return ids
+        if product_id in ids:
+            ids.remove(product_id)
+        ids = [product_id] + ids[:self.size - 1]
+        if self.cache_key:
+            cache.set(self.cache_key, pack_ids(ids), RECENT_CACHE_TIMEOUT)
+        else:
+            self.request.session[RECENT_SESSION_KEY] = pack_ids(ids)
+        return ids
+
+
+class ViewLog(BackgroundBuffer):
+    """
+    Buffer of product views written to ProductView with one bulk insert per
+    flush, from a daemon thread so no request waits on the write
+    """
+
+    name = "skinly-view-log"
+    description = "Writing the product view log"
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        super().__init__(flush_interval, flush_size)
+        self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id, session_key, product_id):
+        with self._lock:
+            self._pending.append((user_id, session_key or "", product_id, timezone.now()))
+            self._added(len(self._pending))
+
+    def flush(self):
+        """Write every pending view; returns how many were written"""
+        from skinly.models import ProductView
+
+        from .neighbors import BULK_BATCH_SIZE
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        ProductView.objects.bulk_create(
+            [
+                ProductView(user_id=user_id, session_key=session_key, product_id=product_id, viewed_at=viewed_at)
+                for user_id, session_key, product_id, viewed_at in pending
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        return len(pending)
+
+
+view_log = ViewLog()
+
+
+def record_view(request, product_id):
+    """Remember a product page view in the visitor's LRU and the view log"""
+    RecentlyViewed(request).add(product_id)
+    user = getattr(request, "user", None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    session_key = ""
+    if user_id is None:
+        # A first-time visitor's session gets its key when it is first saved
+        if not request.session.session_key:
+            request.session.save()
+        session_key = request.session.session_key
+    view_log.record(user_id, session_key, product_id)
+
+
+def recently_viewed_products(request, limit=4, exclude=()):
+    """The visitor's recently viewed products, most recent first, from one in_bulk query"""
+    from skinly.models import Product
+
+    product_ids = [product_id for product_id in RecentlyViewed(request).ids() if product_id not in exclude][:limit]
+    if not product_ids:
+        return []
+    products = Product.objects.select_related("brand").in_bulk(product_ids)
+    return [products[product_id] for product_id in product_ids if product_id in products]
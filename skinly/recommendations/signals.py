@@ -0,0 +1,87 @@
+"""
+Invalidate cached recommendations when a user's taste or the stock changes,
+and count wishlist adds and orders towards trending
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from skinly.models import OrderItem, PriceRange, Product, Review, TasteBrandAffinity, TasteProfile, User
+
+from .cache import invalidate_user_recommendations, notify_stock_out
+from .trending import record_event
+
+# User fields the recommenders read
+TASTE_FIELDS = {"skin_type", "skin_tone", "taste_profile"}
+
+
+def _invalidate_profile(taste_profile_id):
+    user_id = User.objects.filter(taste_profile_id=taste_profile_id).values_list("id", flat=True).first()
+    if user_id is not None:
+        transaction.on_commit(lambda: invalidate_user_recommendations(user_id))
+
+
+@receiver(post_save, sender=User, dispatch_uid="recommendations_user_saved")
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login only
+    if update_fields is not None and not TASTE_FIELDS & set(update_fields):
+        return
+    transaction.on_commit(lambda: invalidate_user_recommendations(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.preferred_brands.through, dispatch_uid="recommendations_brands_changed")
+def preferred_brands_changed(sender, instance, action, reverse, **kwargs):
+    if action.startswith("post_") and not reverse:
+        transaction.on_commit(lambda: invalidate_user_recommendations(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.wishlist.through, dispatch_uid="recommendations_wishlist_changed")
+def wishlist_changed(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if action.startswith("post_") and not reverse:
+        transaction.on_commit(lambda: invalidate_user_recommendations(instance.pk))
+    if action == "post_add" and not reverse:
+        added = list(pk_set)
+        transaction.on_commit(lambda: [record_event(product_id, "wishlist") for product_id in added])
+
+
+@receiver(post_save, sender=Review, dispatch_uid="recommendations_review_saved")
+@receiver(post_delete, sender=Review, dispatch_uid="recommendations_review_deleted")
+def review_changed(sender, instance, **kwargs):
+    # Collaborative filtering folds the user's factors in again on the next request
+    transaction.on_commit(lambda: invalidate_user_recommendations(instance.user_id))
+
+
+@receiver(post_save, sender=TasteProfile, dispatch_uid="recommendations_taste_saved")
+def taste_profile_saved(sender, instance, **kwargs):
+    _invalidate_profile(instance.pk)
+
+
+@receiver(m2m_changed, sender=TasteProfile.preferred_colors.through, dispatch_uid="recommendations_colors_changed")
+def preferred_colors_changed(sender, instance, action, reverse, **kwargs):
+    if action.startswith("post_") and not reverse:
+        _invalidate_profile(instance.pk)
+
+
+@receiver(post_save, sender=TasteBrandAffinity, dispatch_uid="recommendations_affinity_saved")
+@receiver(post_delete, sender=TasteBrandAffinity, dispatch_uid="recommendations_affinity_deleted")
+def brand_affinity_changed(sender, instance, **kwargs):
+    _invalidate_profile(instance.taste_profile_id)
+
+
+@receiver(post_save, sender=PriceRange, dispatch_uid="recommendations_price_range_saved")
+def price_range_saved(sender, instance, **kwargs):
+    taste_profile_id = TasteProfile.objects.filter(price_range=instance).values_list("id", flat=True).first()
+    if taste_profile_id is not None:
+        _invalidate_profile(taste_profile_id)
+
+
+@receiver(post_save, sender=Product, dispatch_uid="recommendations_product_saved")
+def product_saved(sender, instance, **kwargs):
+    if instance.stock_quantity <= 0:
+        transaction.on_commit(notify_stock_out)
+
+
+@receiver(post_save, sender=OrderItem, dispatch_uid="trending_order_item_saved")
+def order_item_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: record_event(instance.product_id, "order", instance.quantity))
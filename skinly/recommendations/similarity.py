@@ -0,0 +1,142 @@
+"""
+Item-item content similarity from product attributes
+"""
+import numpy as np
+
+from ..catalog.snapshot import CODES, read_catalog_columns
+from ..models.choices import NeighborKind
+from ..search.facets import PRICE_BUCKETS
+from .neighbors import neighbor_products, store_neighbors
+
+# Relative weight of each attribute group in the cosine similarity
+FEATURE_WEIGHTS = {
+    "product_type": 3.0,
+    "brand": 2.0,
+    "finish_type": 1.0,
+    "color": 1.0,
+    "skin_type": 1.0,
+    "price": 1.0,
+}
+
+# Neighbours stored per product; views show fewer after dropping
+# out-of-stock and already-carted products
+TOP_NEIGHBORS = 12
+
+# Rows of the similarity matrix computed at once (bounds memory to
+# BLOCK_SIZE x catalog size floats)
+BLOCK_SIZE = 1024
+
+# Breaks similarity ties in favour of better rated products
+RATING_TIE_BREAK = 1e-4
+
+
+def _one_hot(codes, width):
+    matrix = np.zeros((len(codes), width), dtype=np.float32)
+    matrix[np.arange(len(codes)), codes] = 1.0
+    return matrix
+
+
+def _categorical(values):
+    """One-hot encode arbitrary integer ids"""
+    _, codes = np.unique(values, return_inverse=True)
+    return _one_hot(codes, int(codes.max()) + 1 if len(codes) else 0)
+
+
+def _price_bands(price_cents):
+    bounds = np.array([int(low * 100) for _, low, _ in PRICE_BUCKETS[1:]], dtype=np.int64)
+    return _one_hot(np.searchsorted(bounds, price_cents, side="right"), len(PRICE_BUCKETS))
+
+
+def _skin_types(codes):
+    # Products with no listed skin type suit every skin type equally
+    width = len(CODES["skin_type"])
+    matrix = np.zeros((len(codes), width), dtype=np.float32)
+    listed = codes > 0
+    matrix[np.flatnonzero(listed), codes[listed] - 1] = 1.0
+    matrix[~listed] = 1.0
+    return matrix
+
+
+def product_feature_matrix(columns):
+    """
+    Unit-length feature rows for the catalog ``columns`` (as returned by
+    ``read_catalog_columns``). Each attribute group is normalized on its own
+    and scaled by the square root of its weight, so a dot product between
+    two rows is the weighted share of the attributes they have in common.
+    """
+    groups = {
+        "product_type": _one_hot(columns["product_type"], len(CODES["product_type"]) + 1),
+        "brand": _categorical(columns["brand_id"]),
+        "finish_type": _one_hot(columns["finish_type"], len(CODES["finish_type"]) + 1),
+        "color": _categorical(columns["color_id"]),
+        "skin_type": _skin_types(columns["skin_type"]),
+        "price": _price_bands(columns["price_cents"]),
+    }
+
+    blocks = []
+    for group, matrix in groups.items():
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        blocks.append(matrix / norms * np.sqrt(FEATURE_WEIGHTS[group]))
+    features = np.hstack(blocks).astype(np.float32)
+
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return features / norms
+
+
+def top_neighbors(features, top_n=TOP_NEIGHBORS, bonus=None):
+    """
+    (indices, scores) arrays of shape (rows, top_n) holding every row's most
+    cosine-similar other rows, best first. ``bonus`` is added per column
+    before selection, e.g. to break ties.
+    """
+    count = len(features)
+    top_n = min(top_n, max(count - 1, 0))
+    indices = np.empty((count, top_n), dtype=np.int64)
+    scores = np.empty((count, top_n), dtype=np.float32)
+    if top_n == 0:
+        return indices, scores
+
+    for start in range(0, count, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, count)
+        block = features[start:stop] @ features.T
+        if bonus is not None:
+            block += bonus
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -np.inf
+
+        candidates = np.argpartition(-block, top_n - 1, axis=1)[:, :top_n]
+        candidate_scores = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        indices[start:stop] = np.take_along_axis(candidates, order, axis=1)
+        scores[start:stop] = np.take_along_axis(candidate_scores, order, axis=1)
+    return indices, scores
+
+
+def compute_similar_products(top_n=TOP_NEIGHBORS, columns=None):
+    """{product id: [(neighbour id, similarity), ...]} for the whole catalog"""
+    if columns is None:
+        columns = read_catalog_columns()
+    ids = columns["id"]
+    bonus = (columns["rating"] * RATING_TIE_BREAK).astype(np.float32)
+    indices, scores = top_neighbors(product_feature_matrix(columns), top_n, bonus)
+    scores -= bonus[indices]
+
+    return {
+        int(product_id): [
+            (int(ids[index]), round(float(score), 6))
+            for index, score in zip(indices[row], scores[row])
+        ]
+        for row, product_id in enumerate(ids)
+    }
+
+
+def build_similarity_table(top_n=TOP_NEIGHBORS):
+    """Recompute and store every product's similar-product list"""
+    return store_neighbors(NeighborKind.SIMILAR, compute_similar_products(top_n))
+
+
+def similar_products(product_ids, limit=4, skin_type=None):
+    """Precomputed in-stock neighbours of one or more products"""
+    return neighbor_products(product_ids, NeighborKind.SIMILAR, limit, skin_type)
@@ -0,0 +1,194 @@
+"""
+Trending products from exponentially decayed interaction counters
+"""
+import math
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .buffer import BackgroundBuffer
+from .neighbors import BULK_BATCH_SIZE
+
+# Weight of one event of each kind
+EVENT_WEIGHTS = {
+    "view": 1.0,
+    "cart": 3.0,
+    "wishlist": 4.0,
+    "order": 8.0,
+}
+
+# An event counts half as much after this many seconds
+HALF_LIFE = 3 * 24 * 3600
+DECAY_RATE = math.log(2) / HALF_LIFE
+
+# Stored scores grow as 2 ** (age of the landmark / HALF_LIFE); past this
+# many half-lives every row is scaled down and the landmark moved to now
+REBASE_AFTER = 64
+
+# Buffered events are written by a background thread every this many
+# seconds, or as soon as this many products are pending
+FLUSH_INTERVAL = 10
+FLUSH_SIZE = 500
+
+TRENDING_CACHE_KEY = "skinly:trending:{}"
+# How long the trending id list is served before it is read again
+TRENDING_CACHE_SECONDS = 60
+
+
+def _current_landmark():
+    from skinly.models import ProductTrend
+
+    return ProductTrend.objects.values_list("landmark", flat=True).first()
+
+
+def rebase(now=None):
+    """
+    Scale every stored score to a landmark of ``now`` in one UPDATE, keeping
+    the forward-decayed scores well inside float range. Returns the landmark.
+    """
+    from skinly.models import ProductTrend
+
+    now = time.time() if now is None else now
+    landmark = _current_landmark()
+    if landmark is None:
+        return now
+    factor = math.exp(-DECAY_RATE * (now - landmark))
+    ProductTrend.objects.update(score=F("score") * factor, landmark=now)
+    return now
+
+
+def rebuild_trends(until=None):
+    """
+    Replace every score with one recomputed from the dated history before
+    ``until`` (now by default): product views and ordered items. Cart and
+    wishlist adds carry no date and are left out. Returns the number of
+    products scored.
+    """
+    from django.utils import timezone
+    from skinly.models import OrderItem, ProductTrend, ProductView
+
+    until = until or timezone.now()
+    landmark = until.timestamp()
+    scores = defaultdict(float)
+    for product_id, viewed_at in ProductView.objects.filter(viewed_at__lt=until).values_list(
+        "product_id", "viewed_at"
+    ).iterator(chunk_size=10000):
+        scores[product_id] += EVENT_WEIGHTS["view"] * math.exp(DECAY_RATE * (viewed_at.timestamp() - landmark))
+    for product_id, quantity, ordered_at in OrderItem.objects.filter(order__created_at__lt=until).values_list(
+        "product_id", "quantity", "order__created_at"
+    ).iterator(chunk_size=10000):
+        scores[product_id] += EVENT_WEIGHTS["order"] * quantity * math.exp(DECAY_RATE * (ordered_at.timestamp() - landmark))
+
+    with transaction.atomic():
+        ProductTrend.objects.all().delete()
+        ProductTrend.objects.bulk_create(
+            [ProductTrend(product_id=product_id, score=score, landmark=landmark) for product_id, score in scores.items()],
+            batch_size=BULK_BATCH_SIZE,
+        )
+    return len(scores)
+
+
+class TrendBuffer(BackgroundBuffer):
+    """
+    Per-process accumulator of trending events. ``record`` only touches a
+    dict; a background thread writes the summed weights with one bulk
+    update every ``flush_interval`` seconds, or as soon as ``flush_size``
+    products are pending, so a request never waits on a counter write.
+    """
+
+    name = "skinly-trend-buffer"
+    description = "Writing trending scores"
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        super().__init__(flush_interval, flush_size)
+        self._pending = defaultdict(float)
+        self._origin = time.time()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, product_id, event, count=1, now=None):
+        now = time.time() if now is None else now
+        # Weighted relative to the buffer's origin, and moved onto the
+        # stored landmark when flushed
+        weight = EVENT_WEIGHTS[event] * count * math.exp(DECAY_RATE * (now - self._origin))
+        with self._lock:
+            self._pending[product_id] += weight
+            self._added(len(self._pending))
+
+    def flush(self, now=None):
+        """Write pending weights; returns the number of products updated"""
+        from skinly.models import Product, ProductTrend
+
+        with self._lock:
+            pending, origin = self._pending, self._origin
+            self._pending = defaultdict(float)
+            self._origin = time.time()
+        if not pending:
+            return 0
+
+        now = time.time() if now is None else now
+        landmark = _current_landmark()
+        if landmark is None or now - landmark > REBASE_AFTER * HALF_LIFE:
+            landmark = rebase(now)
+        shift = math.exp(DECAY_RATE * (origin - landmark))
+
+        product_ids = set(Product.objects.filter(id__in=list(pending)).values_list("id", flat=True))
+        ProductTrend.objects.bulk_create(
+            [ProductTrend(product_id=product_id, landmark=landmark) for product_id in product_ids],
+            batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+        )
+        # Increments in SQL, so flushes from several workers add up
+        trends = list(ProductTrend.objects.filter(product_id__in=product_ids).only("id", "product_id"))
+        for trend in trends:
+            trend.score = F("score") + pending[trend.product_id] * shift
+        ProductTrend.objects.bulk_update(trends, ["score"], batch_size=BULK_BATCH_SIZE)
+        return len(trends)
+
+
+trend_buffer = TrendBuffer()
+
+
+def record_event(product_id, event, count=1):
+    """Count a view, cart add, wishlist add or order towards trending"""
+    trend_buffer.record(product_id, event, count)
+
+
+def trending_product_ids(limit):
+    """Ids of the ``limit`` highest trending in-stock products, best first"""
+    key = TRENDING_CACHE_KEY.format(limit)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        from skinly.models import ProductTrend
+
+        product_ids = list(
+            ProductTrend.objects.filter(score__gt=0, product__stock_quantity__gt=0)
+            .order_by("-score", "product_id").values_list("product_id", flat=True)[:limit]
+        )
+        cache.set(key, product_ids, TRENDING_CACHE_SECONDS)
+    return product_ids
+
+
+def trending_products(limit=8):
+    """
+    The ``limit`` most trending in-stock products, topped up with other
+    in-stock products when too few have any activity yet
+    """
+    from skinly.catalog import in_stock_products
+    from skinly.search import hydrate_products
+
+    # A few extra ids cover products sold out since the list was cached
+    products = [
+        product for product in hydrate_products(trending_product_ids(limit + 4))
+        if product.stock_quantity > 0
+    ][:limit]
+    if len(products) < limit:
+        seen = {product.pk for product in products}
+        products += [
+            product for product in in_stock_products(limit + len(seen))
+            if product.pk not in seen
+        ][:limit - len(products)]
+    return products
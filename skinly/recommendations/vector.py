@@ -0,0 +1,297 @@
+"""
+Taste-profile recommendations scored as one sparse dot product over the catalog
+"""
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+from scipy import sparse
+
+from ..catalog.snapshot import CODES, get_catalog_snapshot, read_catalog_columns, snapshot_columns
+from ..search.index import GENERATION_CACHE_KEY
+
+# Score added per matching attribute
+WEIGHTS = {
+    "product_type": 3.0,
+    "preferred_brand": 2.0,
+    # multiplied by the TasteBrandAffinity score (0..1)
+    "brand_affinity": 2.0,
+    "finish_type": 1.0,
+    "color": 1.0,
+    "skin_type": 0.5,
+    "price": 1.0,
+}
+
+# Small rating bonus so equally matching products favour the better rated
+RATING_WEIGHT = 0.01
+
+# Extra candidates ranked to cover products sold out since the catalog
+# vectors were built, as stock is re-checked on the fetched rows
+STOCK_SLACK = 10
+
+
+class CatalogVectors:
+    """
+    The catalog as a sparse one-hot attribute matrix (products x attributes).
+    A user's taste becomes a weight per attribute column, so scoring every
+    product is a single matrix-vector product whatever the number of
+    preferences.
+    """
+
+    def __init__(self, columns):
+        self.ids = np.asarray(columns["id"])
+        self.stock = np.asarray(columns["stock"])
+        self.skin_types = np.asarray(columns["skin_type"])
+        self.prices = np.asarray(columns["price_cents"])
+        self.rating_bonus = np.asarray(columns["rating"], dtype=np.float32) * RATING_WEIGHT
+        self.built_at = time.monotonic()
+
+        brand_ids, brand_codes = np.unique(np.asarray(columns["brand_id"]), return_inverse=True)
+        color_ids, color_codes = np.unique(np.asarray(columns["color_id"]), return_inverse=True)
+
+        # attribute group -> (number of columns, per-product column within the group)
+        groups = {
+            "product_type": (len(CODES["product_type"]) + 1, np.asarray(columns["product_type"])),
+            "finish_type": (len(CODES["finish_type"]) + 1, np.asarray(columns["finish_type"])),
+            "skin_type": (len(CODES["skin_type"]) + 1, self.skin_types),
+            "brand": (len(brand_ids), brand_codes),
+            "color": (len(color_ids), color_codes),
+        }
+        self.offsets = {}
+        column_blocks = []
+        width = 0
+        for group, (size, codes) in groups.items():
+            self.offsets[group] = width
+            column_blocks.append(codes.astype(np.int64) + width)
+            width += size
+        self.width = width
+        self.brand_columns = {
+            brand_id: self.offsets["brand"] + position for position, brand_id in enumerate(brand_ids.tolist())
+        }
+        self.color_columns = {
+            color_id: self.offsets["color"] + position for position, color_id in enumerate(color_ids.tolist())
+        }
+
+        count = len(self.ids)
+        self.matrix = sparse.csr_matrix(
+            (
+                np.ones(count * len(column_blocks), dtype=np.float32),
+                np.column_stack(column_blocks).ravel(),
+                np.arange(0, count * len(column_blocks) + 1, len(column_blocks)),
+            ),
+            shape=(count, width),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _code_column(self, group, value):
+        try:
+            return self.offsets[group] + CODES[group].index(value) + 1
+        except ValueError:
+            return None
+
+    def weights(self, preferences):
+        """Attribute weight vector for a ``load_preferences`` dict"""
+        weights = np.zeros(self.width, dtype=np.float32)
+        for product_type in preferences["product_types"]:
+            column = self._code_column("product_type", product_type)
+            if column is not None:
+                weights[column] += WEIGHTS["product_type"]
+        for finish_type in preferences["finish_types"]:
+            column = self._code_column("finish_type", finish_type)
+            if column is not None:
+                weights[column] += WEIGHTS["finish_type"]
+        for color_id in preferences["colors"]:
+            if color_id in self.color_columns:
+                weights[self.color_columns[color_id]] += WEIGHTS["color"]
+        for brand_id in preferences["brands"]:
+            if brand_id in self.brand_columns:
+                weights[self.brand_columns[brand_id]] += WEIGHTS["preferred_brand"]
+        for brand_id, score in preferences["brand_affinities"].items():
+            if brand_id in self.brand_columns:
+                weights[self.brand_columns[brand_id]] += WEIGHTS["brand_affinity"] * score
+        if preferences["skin_type"]:
+            column = self._code_column("skin_type", preferences["skin_type"])
+            if column is not None:
+                weights[column] += WEIGHTS["skin_type"]
+        return weights
+
+    def scores(self, preferences):
+        """
+        Relevance of every product; out-of-stock and skin-incompatible
+        products score -inf.
+        """
+        scores = self.matrix @ self.weights(preferences) + self.rating_bonus
+
+        price_range = preferences["price_range"]
+        if price_range:
+            low, high = (int(round(float(price) * 100)) for price in price_range)
+            scores += WEIGHTS["price"] * ((self.prices >= low) & (self.prices <= high))
+
+        eligible = self.stock > 0
+        skin_column = self._code_column("skin_type", preferences["skin_type"])
+        if skin_column is not None:
+            skin_code = skin_column - self.offsets["skin_type"]
+            eligible &= (self.skin_types == 0) | (self.skin_types == skin_code)
+        scores[~eligible] = -np.inf
+        return scores
+
+    def top(self, preferences, limit, exclude=(), with_scores=False):
+        """
+        Ids of the ``limit`` best scoring products, best first, or
+        (id, score) pairs ``with_scores``
+        """
+        scores = self.scores(preferences)
+        if exclude:
+            scores[np.isin(self.ids, list(exclude))] = -np.inf
+
+        eligible = int(np.isfinite(scores).sum())
+        limit = min(limit, eligible)
+        if limit <= 0:
+            return []
+        # Everything tied with the limit-th score is a candidate, so ties
+        # are broken by id rather than by argpartition's arbitrary order
+        threshold = -np.partition(-scores, limit - 1)[limit - 1]
+        best = np.flatnonzero(scores >= threshold)
+        best = best[np.lexsort((self.ids[best], -scores[best]))][:limit]
+        if with_scores:
+            return list(zip(self.ids[best].tolist(), scores[best].tolist()))
+        return self.ids[best].tolist()
+
+
+def load_preferences(user):
+    """Everything the vector scorer needs from a user, in three small queries"""
+    taste = user.taste_profile
+    preferences = {
+        "skin_type": user.skin_type,
+        "product_types": [],
+        "finish_types": [],
+        "colors": [],
+        "brands": list(user.preferred_brands.values_list("id", flat=True)),
+        "brand_affinities": {},
+        "price_range": None,
+    }
+    if taste is None:
+        return preferences
+
+    preferences["product_types"] = taste.preferred_product_types
+    preferences["finish_types"] = taste.preferred_finish_types
+    preferences["colors"] = list(taste.preferred_colors.values_list("id", flat=True))
+    preferences["brand_affinities"] = dict(taste.brand_affinities.values_list("brand_id", "score"))
+    if taste.price_range_id:
+        price_range = taste.price_range
+        if price_range.max_price > 0:
+            preferences["price_range"] = (price_range.min_price, price_range.max_price)
+    return preferences
+
+
+def load_preferences_bulk(users):
+    """
+    ``load_preferences`` for many users at once: three queries in total.
+    ``users`` should come with select_related("taste_profile__price_range").
+    """
+    from collections import defaultdict
+
+    from skinly.models import TasteBrandAffinity, TasteProfile, User
+
+    user_ids = [user.pk for user in users]
+    profile_ids = [user.taste_profile_id for user in users if user.taste_profile_id]
+
+    brands = defaultdict(list)
+    for user_id, brand_id in User.preferred_brands.through.objects.filter(
+        user_id__in=user_ids
+    ).values_list("user_id", "brand_id"):
+        brands[user_id].append(brand_id)
+
+    colors = defaultdict(list)
+    for profile_id, color_id in TasteProfile.preferred_colors.through.objects.filter(
+        tasteprofile_id__in=profile_ids
+    ).values_list("tasteprofile_id", "color_id"):
+        colors[profile_id].append(color_id)
+
+    affinities = defaultdict(dict)
+    for profile_id, brand_id, score in TasteBrandAffinity.objects.filter(
+        taste_profile_id__in=profile_ids
+    ).values_list("taste_profile_id", "brand_id", "score"):
+        affinities[profile_id][brand_id] = score
+
+    preferences = {}
+    for user in users:
+        taste = user.taste_profile
+        price_range = None
+        if taste is not None and taste.price_range is not None and taste.price_range.max_price > 0:
+            price_range = (taste.price_range.min_price, taste.price_range.max_price)
+        preferences[user.pk] = {
+            "skin_type": user.skin_type,
+            "product_types": taste.preferred_product_types if taste else [],
+            "finish_types": taste.preferred_finish_types if taste else [],
+            "colors": colors.get(user.taste_profile_id, []),
+            "brands": brands.get(user.pk, []),
+            "brand_affinities": affinities.get(user.taste_profile_id, {}),
+            "price_range": price_range,
+        }
+    return preferences
+
+
+# Catalog vectors built from the database are rebuilt after this many seconds
+# even without a catalog change, since stock updated with queryset.update()
+# does not bump the generation
+MAX_AGE = 300
+
+_vectors = None
+_vectors_key = None
+_vectors_lock = threading.Lock()
+
+
+def get_catalog_vectors():
+    """
+    Process-wide CatalogVectors, built from the mapped catalog snapshot when
+    there is one and from the database otherwise. Vectors built from a
+    snapshot are topped up with the products added since, and rebuilt when
+    the catalog changes; their stock is the snapshot's, so callers re-check
+    it on the products they fetch.
+    """
+    global _vectors, _vectors_key
+    snapshot = get_catalog_snapshot()
+    generation = cache.get(GENERATION_CACHE_KEY, 0)
+    if snapshot is not None:
+        key = ("snapshot", snapshot.version, generation)
+    else:
+        key = ("database", generation)
+
+    with _vectors_lock:
+        expired = (
+            key[0] == "database" and _vectors is not None
+            and time.monotonic() - _vectors.built_at > MAX_AGE
+        )
+        if _vectors is None or _vectors_key != key or expired:
+            _vectors = CatalogVectors(snapshot_columns(snapshot) if snapshot is not None else read_catalog_columns())
+            _vectors_key = key
+        return _vectors
+
+
+class VectorRecommender:
+    """Score the whole in-stock catalog against the user's taste vector"""
+
+    def recommend_ids(self, user, limit=10, exclude=()):
+        return get_catalog_vectors().top(load_preferences(user), limit, exclude)
+
+    def recommend_scored_bulk(self, users, limit=10):
+        """{user id: [(product id, score), ...]} for a batch of users"""
+        vectors = get_catalog_vectors()
+        return {
+            user_id: vectors.top(preferences, limit, with_scores=True)
+            for user_id, preferences in load_preferences_bulk(users).items()
+        }
+
+    def recommend(self, user, limit=10):
+        return in_stock(self.recommend_ids(user, limit + STOCK_SLACK), limit)
+
+
+def in_stock(product_ids, limit):
+    """The first ``limit`` of ``product_ids`` still in stock, fetched in one query"""
+    from skinly.search import hydrate_products
+
+    return [product for product in hydrate_products(product_ids) if product.stock_quantity > 0][:limit]
@@ -0,0 +1,51 @@
+"""
+Search package for Skinly application
+"""
+
+from .backends import (
+    BaseSearchBackend,
+    MemoryBackend,
+    PostgresFullTextBackend,
+    SQLiteFTSBackend,
+    get_search_backend,
+)
+from .facets import (
+    compute_facets,
+    get_facet_counts,
+)
+from .fuzzy import (
+    SymmetricDeleteDictionary,
+    correct_query,
+    get_fuzzy_dictionary,
+)
+from .index import (
+    ProductIndex,
+    get_product_index,
+    hydrate_products,
+    tokenize,
+)
+from .ranking import RankedResults
+from .typeahead import (
+    TypeaheadIndex,
+    get_typeahead_index,
+)
+
+__all__ = [
+    'BaseSearchBackend',
+    'MemoryBackend',
+    'PostgresFullTextBackend',
+    'SQLiteFTSBackend',
+    'get_search_backend',
+    'compute_facets',
+    'get_facet_counts',
+    'SymmetricDeleteDictionary',
+    'correct_query',
+    'get_fuzzy_dictionary',
+    'ProductIndex',
+    'get_product_index',
+    'hydrate_products',
+    'tokenize',
+    'RankedResults',
+    'TypeaheadIndex',
+    'get_typeahead_index',
+]
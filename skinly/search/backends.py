@@ -0,0 +1,107 @@
+"""
+Pluggable product search backends, selected by settings.SEARCH_BACKEND
+"""
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .index import get_product_index, tokenize
+from .ranking import RankedResults
+
+DEFAULT_SEARCH_BACKEND = "skinly.search.backends.MemoryBackend"
+
+
+class BaseSearchBackend:
+    """A backend turns a free-text query into relevance-scored product ids"""
+
+    vendor = None
+
+    def __init__(self):
+        if self.vendor and connection.vendor != self.vendor:
+            raise ImproperlyConfigured(
+                f"{type(self).__name__} requires a {self.vendor} database, "
+                f"not {connection.vendor}."
+            )
+
+    def scores(self, query):
+        """{product_id: relevance} for every product matching ``query``"""
+        raise NotImplementedError
+
+    def search(self, query, limit=None):
+        return RankedResults(self.scores(query)).top(limit)
+
+
+class MemoryBackend(BaseSearchBackend):
+    """Per-process inverted index, kept in sync by model signals"""
+
+    def scores(self, query):
+        return get_product_index().scores(query)
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    FTS5 virtual table ``skinly_product_fts`` (rowid = product id), kept in
+    sync by SQL triggers on the product, brand and color tables.
+    """
+
+    vendor = "sqlite"
+    # bm25() column weights: name, brand, product_type, color
+    COLUMN_WEIGHTS = (3.0, 2.0, 1.5, 1.0)
+
+    def scores(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+
+        match = " AND ".join(f'"{token}"*' for token in tokens)
+        weights = ", ".join(str(weight) for weight in self.COLUMN_WEIGHTS)
+        # bm25() is lower-is-better, so negate it into a relevance score
+        sql = (
+            f"SELECT rowid, -bm25(skinly_product_fts, {weights}) FROM skinly_product_fts "
+            "WHERE skinly_product_fts MATCH %s"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match])
+            return dict(cursor.fetchall())
+
+
+class PostgresFullTextBackend(BaseSearchBackend):
+    """
+    ``skinly_product.search_vector`` tsvector column behind a GIN index,
+    maintained by triggers (name A, brand B, product_type C, color D).
+    """
+
+    vendor = "postgresql"
+
+    def scores(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+
+        tsquery = " & ".join(f"{token}:*" for token in tokens)
+        sql = (
+            "SELECT id, ts_rank(search_vector, to_tsquery('simple', %s)) FROM skinly_product "
+            "WHERE search_vector @@ to_tsquery('simple', %s)"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, tsquery])
+            return dict(cursor.fetchall())
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Instantiate the configured backend once per process"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            path = getattr(settings, "SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND)
+            _backend = import_string(path)()
+        return _backend
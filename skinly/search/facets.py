@@ -0,0 +1,85 @@
+"""
+Facet counts for the catalog filter sidebar
+"""
+import hashlib
+import json
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Value, When
+
+from .index import GENERATION_CACHE_KEY, tokenize
+
+# (label, lower bound inclusive, upper bound exclusive or None)
+PRICE_BUCKETS = (
+    ("0-25", Decimal("0.00"), Decimal("25.00")),
+    ("25-50", Decimal("25.00"), Decimal("50.00")),
+    ("50-100", Decimal("50.00"), Decimal("100.00")),
+    ("100+", Decimal("100.00"), None),
+)
+
+FACET_FIELDS = (
+    ("brand", "brand_id"),
+    ("product_type", "product_type"),
+    ("finish_type", "finish_type"),
+    ("skin_type", "skin_type_compatibility"),
+    ("price", "price_bucket"),
+)
+
+# Stock changes made with queryset.update() do not move the catalog
+# generation, so cached counts also expire after this many seconds
+FACET_CACHE_TIMEOUT = 300
+
+
+def _price_bucket():
+    whens = []
+    for label, low, high in PRICE_BUCKETS:
+        if high is None:
+            whens.append(When(price__gte=low, then=Value(label)))
+        else:
+            whens.append(When(price__gte=low, price__lt=high, then=Value(label)))
+    return Case(*whens, output_field=CharField())
+
+
+def compute_facets(products):
+    """
+    Counts per brand, product type, finish, skin type and price bucket for
+    a product queryset. One GROUP BY over all five columns; the per-facet
+    totals are summed from the (small) set of distinct combinations.
+    """
+    rows = (
+        products.order_by()
+        .annotate(price_bucket=_price_bucket())
+        .values(*(column for _, column in FACET_FIELDS))
+        .annotate(count=Count("id"))
+    )
+
+    facets = {facet: {} for facet, _ in FACET_FIELDS}
+    for row in rows:
+        for facet, column in FACET_FIELDS:
+            counts = facets[facet]
+            counts[row[column]] = counts.get(row[column], 0) + row["count"]
+    return facets
+
+
+def _cache_key(filters):
+    normalized = {
+        key: " ".join(tokenize(value)) if key == "q" else str(value).strip()
+        for key, value in filters.items() if value
+    }
+    digest = hashlib.md5(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+    generation = cache.get(GENERATION_CACHE_KEY, 0)
+    return f"skinly:facets:{generation}:{digest}"
+
+
+def get_facet_counts(products, filters):
+    """
+    ``compute_facets`` cached per normalized filter combination. ``filters``
+    must describe everything that narrowed ``products``.
+    """
+    key = _cache_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(products)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
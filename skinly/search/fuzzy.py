@@ -0,0 +1,180 @@
+"""
+Typo-tolerant query correction with a symmetric-delete dictionary
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+
+from .index import GENERATION_CACHE_KEY, tokenize
+
+
+def edit_distance(source, target, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent
+    transpositions). Returns ``max_distance + 1`` once the bound is exceeded.
+    """
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i, source_char in enumerate(source, 1):
+        current = [i] + [0] * len(target)
+        for j, target_char in enumerate(target, 1):
+            cost = 0 if source_char == target_char else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (
+                previous_previous is not None and i > 1 and j > 1
+                and source_char == target[j - 2] and source[i - 2] == target_char
+            ):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(term, distance):
+    """Every string reachable from ``term`` by removing up to ``distance`` characters"""
+    results = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {
+            word[:i] + word[i + 1:]
+            for word in frontier if len(word) > 1
+            for i in range(len(word))
+        }
+        results |= frontier
+    return results
+
+
+class SymmetricDeleteDictionary:
+    """
+    Maps every catalog term's deletions back to the term, so a misspelled
+    token is corrected by generating its own deletions and looking them up.
+    Lookup cost depends on the token length, not on the catalog size.
+    """
+
+    MAX_DISTANCE = 2
+    # tokens shorter than this only tolerate one edit
+    LONG_TOKEN_LENGTH = 5
+    MIN_TOKEN_LENGTH = 3
+
+    def __init__(self):
+        self._deletes = {}
+        self._counts = {}
+        self._canonical = {}
+        self.generation = None
+
+    def __contains__(self, term):
+        return term in self._counts
+
+    def add(self, term, canonical=None):
+        """Add ``term``; lookups resolving to it return ``canonical`` instead"""
+        if len(term) < self.MIN_TOKEN_LENGTH:
+            return
+        if canonical and canonical != term:
+            self._canonical[term] = canonical
+        if term in self._counts:
+            self._counts[term] += 1
+            return
+        self._counts[term] = 1
+        for deletion in _deletes(term, self.MAX_DISTANCE):
+            self._deletes.setdefault(deletion, set()).add(term)
+
+    def max_distance_for(self, token):
+        return self.MAX_DISTANCE if len(token) >= self.LONG_TOKEN_LENGTH else 1
+
+    def lookup(self, token):
+        """Closest known term to ``token`` (canonical form), or None"""
+        if token in self._counts:
+            return self._canonical.get(token, token)
+        if len(token) < self.MIN_TOKEN_LENGTH:
+            return None
+
+        max_distance = self.max_distance_for(token)
+        candidates = set()
+        for deletion in _deletes(token, max_distance):
+            candidates |= self._deletes.get(deletion, set())
+
+        best = None
+        best_key = None
+        for term in candidates:
+            distance = edit_distance(token, term, max_distance)
+            if distance > max_distance:
+                continue
+            key = (distance, -self._counts[term], term)
+            if best_key is None or key < best_key:
+                best, best_key = term, key
+        if best is None:
+            return None
+        return self._canonical.get(best, best)
+
+    def correct(self, query):
+        """
+        Rewrite ``query`` token by token. Returns the corrected query, or
+        None when nothing could be changed.
+        """
+        tokens = tokenize(query)
+        corrected = []
+        for token in tokens:
+            term = self.lookup(token)
+            if term is None and len(token) < self.MIN_TOKEN_LENGTH:
+                # short unknown words ("de", "y", "of") carry no meaning here
+                continue
+            term = term or token
+            # translated phrases ("sombra de ojos") collapse to one code
+            if term not in corrected:
+                corrected.append(term)
+        if not corrected or corrected == tokens:
+            return None
+        return " ".join(corrected)
+
+    def build(self):
+        """Load catalog terms plus product type labels in every site language"""
+        from skinly.models import Brand, Color, Product, ProductType
+
+        for name in Product.objects.values_list("name", flat=True).iterator():
+            for token in tokenize(name):
+                self.add(token)
+        for name in Brand.objects.values_list("name", flat=True):
+            for token in tokenize(name):
+                self.add(token)
+        for name in Color.objects.values_list("name", flat=True):
+            for token in tokenize(name):
+                self.add(token)
+
+        # Product types are indexed by their English code, so translated
+        # labels ("Labial", "Sombra de ojos") resolve to that code.
+        for product_type in ProductType:
+            canonical = tokenize(product_type.value)[0]
+            self.add(canonical)
+            for language_code, _ in settings.LANGUAGES:
+                with translation.override(language_code):
+                    label = translation.gettext(product_type.label)
+                for token in tokenize(label):
+                    self.add(token, canonical=canonical)
+        return self
+
+
+_dictionary = None
+_dictionary_lock = threading.Lock()
+
+
+def get_fuzzy_dictionary():
+    """Process-wide dictionary, rebuilt when the catalog generation moves"""
+    global _dictionary
+    generation = cache.get(GENERATION_CACHE_KEY, 0)
+    with _dictionary_lock:
+        if _dictionary is None or _dictionary.generation != generation:
+            dictionary = SymmetricDeleteDictionary().build()
+            dictionary.generation = generation
+            _dictionary = dictionary
+        return _dictionary
+
+
+def correct_query(query):
+    """Spelling-corrected form of ``query``, or None if it needs no change"""
+    return get_fuzzy_dictionary().correct(query)
@@ -0,0 +1,291 @@
+"""
+In-memory inverted index over the product catalog
+"""
+import bisect
+import re
+import threading
+import unicodedata
+
+from django.core.cache import cache
+
+from .ranking import B, RankedResults, bm25_idf, bm25_saturate
+
+GENERATION_CACHE_KEY = "skinly:search:generation"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split text into lowercase, accent-free tokens"""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text.lower())
+
+
+class ProductIndex:
+    """
+    Token -> product postings for name, brand, product_type and color text.
+    Query tokens match catalog tokens by prefix, so partial words typed in
+    the search box still hit; results are ranked with BM25F.
+    """
+
+    FIELD_WEIGHTS = {
+        "name": 3.0,
+        "brand": 2.0,
+        "product_type": 1.5,
+        "color": 1.0,
+    }
+    PREFIX_FACTOR = 0.5
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.generation = None
+        self._reset()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _reset(self):
+        # token -> {product_id: {field: term frequency}}
+        self._postings = {}
+        # sorted list of every indexed token, used for prefix lookups
+        self._vocabulary = []
+        # product_id -> {field: [tokens]}
+        self._documents = {}
+        # product_id -> {"name", "product_type", "brand_id", "color_id"}
+        self._products = {}
+        self._brands = {}
+        self._colors = {}
+        # field -> total token count, for BM25 length normalization
+        self._field_lengths = dict.fromkeys(self.FIELD_WEIGHTS, 0)
+
+    def build(self):
+        """Load the whole catalog from the database (three queries)"""
+        from skinly.models import Brand, Color, Product
+
+        with self._lock:
+            self._reset()
+            self._brands = dict(Brand.objects.values_list("id", "name"))
+            self._colors = dict(Color.objects.values_list("id", "name"))
+            rows = Product.objects.values("id", "name", "product_type", "brand_id", "color_id")
+            for row in rows.iterator():
+                self._index_product(row["id"], row)
+        return self
+
+    # ----- incremental maintenance -------------------------------------
+
+    def add_product(self, product):
+        """Index (or re-index) a single Product instance"""
+        with self._lock:
+            if product.brand_id not in self._brands:
+                self._brands[product.brand_id] = product.brand.name
+            if product.color_id not in self._colors:
+                self._colors[product.color_id] = product.color.name
+            self.remove_product(product.pk)
+            self._index_product(product.pk, {
+                "name": product.name,
+                "product_type": product.product_type,
+                "brand_id": product.brand_id,
+                "color_id": product.color_id,
+            })
+
+    def remove_product(self, product_id):
+        with self._lock:
+            document = self._documents.pop(product_id, None)
+            self._products.pop(product_id, None)
+            if not document:
+                return
+            for field, tokens in document.items():
+                self._field_lengths[field] -= len(tokens)
+                for token in set(tokens):
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        continue
+                    postings.pop(product_id, None)
+                    if not postings:
+                        del self._postings[token]
+                        self._discard_vocabulary(token)
+
+    def set_brand(self, brand_id, name):
+        """Rename a brand and re-index the products that carry it"""
+        with self._lock:
+            self._brands[brand_id] = name
+            self._reindex_where("brand_id", brand_id)
+
+    def remove_brand(self, brand_id):
+        with self._lock:
+            self._brands.pop(brand_id, None)
+
+    def set_color(self, color_id, name):
+        """Rename a color and re-index the products that carry it"""
+        with self._lock:
+            self._colors[color_id] = name
+            self._reindex_where("color_id", color_id)
+
+    def remove_color(self, color_id):
+        with self._lock:
+            self._colors.pop(color_id, None)
+
+    # ----- querying ----------------------------------------------------
+
+    def search(self, query, limit=None):
+        """Return product ids matching every query token, best match first"""
+        return RankedResults(self.scores(query)).top(limit)
+
+    def scores(self, query):
+        """
+        BM25F relevance of every product matching all query tokens. Field
+        term frequencies are length-normalized and weighted (name highest)
+        before saturation; prefix-only matches count for PREFIX_FACTOR.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+
+        with self._lock:
+            scores = None
+            for token in tokens:
+                token_scores = self._score_token(token)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        product_id: score + token_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in token_scores
+                    }
+                if not scores:
+                    return {}
+        return scores
+
+    def _score_token(self, token):
+        document_count = len(self._documents)
+        average_lengths = {
+            field: (total / document_count if document_count else 0.0) or 1.0
+            for field, total in self._field_lengths.items()
+        }
+
+        scores = {}
+        for term in self._expand(token):
+            factor = 1.0 if term == token else self.PREFIX_FACTOR
+            postings = self._postings[term]
+            idf = bm25_idf(document_count, len(postings))
+            for product_id, fields in postings.items():
+                document = self._documents[product_id]
+                frequency = sum(
+                    self.FIELD_WEIGHTS[field] * count
+                    / (1 - B + B * len(document[field]) / average_lengths[field])
+                    for field, count in fields.items()
+                )
+                score = factor * idf * bm25_saturate(frequency)
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
+
+    def _expand(self, token):
+        """Vocabulary terms starting with ``token``"""
+        vocabulary = self._vocabulary
+        position = bisect.bisect_left(vocabulary, token)
+        terms = []
+        while position < len(vocabulary) and vocabulary[position].startswith(token):
+            terms.append(vocabulary[position])
+            position += 1
+        return terms
+
+    # ----- internals ---------------------------------------------------
+
+    def _index_product(self, product_id, row):
+        from skinly.models import ProductType
+
+        product_type = row["product_type"] or ""
+        try:
+            product_type_label = ProductType(product_type).label
+        except ValueError:
+            product_type_label = ""
+
+        document = {
+            "name": tokenize(row["name"]),
+            "brand": tokenize(self._brands.get(row["brand_id"], "")),
+            "product_type": sorted(set(tokenize(product_type) + tokenize(product_type_label))),
+            "color": tokenize(self._colors.get(row["color_id"], "")),
+        }
+        self._documents[product_id] = document
+        self._products[product_id] = dict(row)
+
+        for field, tokens in document.items():
+            self._field_lengths[field] += len(tokens)
+            for token in tokens:
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._vocabulary, token)
+                fields = postings.setdefault(product_id, {})
+                fields[field] = fields.get(field, 0) + 1
+
+    def _reindex_where(self, key, value):
+        rows = [
+            (product_id, row) for product_id, row in self._products.items()
+            if row[key] == value
+        ]
+        for product_id, row in rows:
+            self.remove_product(product_id)
+            self._index_product(product_id, row)
+
+    def _discard_vocabulary(self, token):
+        position = bisect.bisect_left(self._vocabulary, token)
+        if position < len(self._vocabulary) and self._vocabulary[position] == token:
+            del self._vocabulary[position]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_product_index(generation=None):
+    """
+    Process-wide index, built on first use. Writes bump a generation
+    counter in the cache so other workers sharing the cache rebuild too.
+    A caller that has just read the generation passes it to save reading
+    it again.
+    """
+    global _index
+    if generation is None:
+        generation = cache.get(GENERATION_CACHE_KEY, 0)
+    with _index_lock:
+        if _index is None or _index.generation != generation:
+            index = ProductIndex().build()
+            index.generation = generation
+            _index = index
+        return _index
+
+
+def apply_index_change(change):
+    """
+    Bump the catalog generation and apply ``change(index)`` to this
+    process' index in place, so it does not need a full rebuild. If
+    another worker bumped the generation in between, its change is not in
+    this index, which is left stale for get_product_index to rebuild.
+    """
+    previous = cache.get(GENERATION_CACHE_KEY, 0)
+    try:
+        current = cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        current = previous + 1
+        cache.set(GENERATION_CACHE_KEY, current, None)
+
+    with _index_lock:
+        # The get and the incr are not atomic (DatabaseCache.incr is a get
+        # and a set), so only a bump of exactly one proves no other change
+        if _index is not None and _index.generation == previous and current == previous + 1:
+            change(_index)
+            _index.generation = current
+
+
+def hydrate_products(product_ids):
+    """Fetch products for ``product_ids`` in one query, keeping their order"""
+    from skinly.models import Product
+
+    products = Product.objects.select_related("brand", "color").in_bulk(product_ids)
+    return [products[product_id] for product_id in product_ids if product_id in products]
@@ -0,0 +1,66 @@
+"""
+Relevance ordering shared by the search backends and views
+"""
+import heapq
+import math
+from collections.abc import Sequence
+
+# BM25 term-frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+
+def bm25_idf(document_count, document_frequency):
+    """Robertson-Sparck Jones idf, floored at zero by the +1"""
+    return math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def bm25_saturate(term_frequency):
+    return term_frequency * (K1 + 1) / (term_frequency + K1)
+
+
+class RankedResults(Sequence):
+    """
+    Product ids ordered by descending score (ties by id), computed lazily.
+    Slicing ``[start:stop]`` only selects the top ``stop`` ids with a heap,
+    so a Paginator over it never sorts the whole result set.
+    """
+
+    def __init__(self, scores):
+        self._scores = scores
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, product_id):
+        return product_id in self._scores
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self.top(stop)[start:stop:step]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ranked results index out of range")
+        return self.top(index + 1)[index]
+
+    def score(self, product_id):
+        return self._scores.get(product_id, 0.0)
+
+    def top(self, limit=None):
+        """The best ``limit`` ids (all of them when limit is None)"""
+        key = self._sort_key
+        if limit is None or limit >= len(self._scores):
+            return sorted(self._scores, key=key)
+        return heapq.nsmallest(limit, self._scores, key=key)
+
+    def restrict(self, product_ids):
+        """Same ranking limited to ``product_ids``"""
+        return RankedResults({
+            product_id: score for product_id, score in self._scores.items()
+            if product_id in product_ids
+        })
+
+    def _sort_key(self, product_id):
+        return (-self._scores[product_id], product_id)
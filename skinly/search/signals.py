@@ -0,0 +1,53 @@
+"""
+Keep the search index in sync with Product, Brand and Color writes
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from skinly.models import Brand, Color, Product
+
+from .index import apply_index_change
+
+
+# Product fields the index, typeahead, vectors and facets read; saves of
+# other fields (a review's rating, say) leave the generation alone
+INDEXED_FIELDS = {"name", "brand", "brand_id", "product_type", "color", "color_id", "stock_quantity"}
+
+
+def _on_commit(change):
+    transaction.on_commit(partial(apply_index_change, change))
+
+
+@receiver(post_save, sender=Product, dispatch_uid="search_index_product_saved")
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_FIELDS & set(update_fields):
+        return
+    _on_commit(lambda index: index.add_product(instance))
+
+
+@receiver(post_delete, sender=Product, dispatch_uid="search_index_product_deleted")
+def product_deleted(sender, instance, **kwargs):
+    _on_commit(lambda index: index.remove_product(instance.pk))
+
+
+@receiver(post_save, sender=Brand, dispatch_uid="search_index_brand_saved")
+def brand_saved(sender, instance, **kwargs):
+    _on_commit(lambda index: index.set_brand(instance.pk, instance.name))
+
+
+@receiver(post_delete, sender=Brand, dispatch_uid="search_index_brand_deleted")
+def brand_deleted(sender, instance, **kwargs):
+    _on_commit(lambda index: index.remove_brand(instance.pk))
+
+
+@receiver(post_save, sender=Color, dispatch_uid="search_index_color_saved")
+def color_saved(sender, instance, **kwargs):
+    _on_commit(lambda index: index.set_color(instance.pk, instance.name))
+
+
+@receiver(post_delete, sender=Color, dispatch_uid="search_index_color_deleted")
+def color_deleted(sender, instance, **kwargs):
+    _on_commit(lambda index: index.remove_color(instance.pk))
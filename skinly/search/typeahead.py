@@ -0,0 +1,139 @@
+"""
+Prefix index with precomputed JSON payloads for the /search/ typeahead
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from .index import GENERATION_CACHE_KEY, get_product_index, tokenize
+from .ranking import RankedResults
+
+PLACEHOLDER_IMAGE_URL = "/static/images/placeholder.jpg"
+
+
+class TypeaheadIndex:
+    """
+    Sorted array of (token, product) keys over in-stock product and brand
+    names. A query's first token selects a contiguous slice with bisect;
+    further tokens must prefix-match one of the product's tokens. Matches
+    are ordered by BM25 and cached per normalized query until the catalog
+    changes.
+    """
+
+    MAX_CACHED_PREFIXES = 2048
+    # Stock changes made with queryset.update() send no signal, so the
+    # index is also rebuilt once it is this old (seconds)
+    MAX_AGE = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._product_ids = []
+        self._payloads = {}
+        self._tokens = {}
+        self._cache = OrderedDict()
+        self.generation = None
+        self.built_at = 0.0
+
+    def build(self):
+        """Load every in-stock product with its brand in one query"""
+        from skinly.models import Product
+
+        products = (
+            Product.objects.filter(stock_quantity__gt=0)
+            .select_related("brand")
+            .only("id", "name", "price", "brand__name")
+        )
+
+        keys = []
+        payloads = {}
+        tokens = {}
+        for product in products.iterator():
+            payloads[product.id] = {
+                "id": product.id,
+                "name": product.name,
+                "brand": product.brand.name,
+                "price": float(product.price),
+                "image_url": PLACEHOLDER_IMAGE_URL,
+            }
+            name_tokens = tokenize(product.name)
+            brand_tokens = tokenize(product.brand.name)
+            tokens[product.id] = frozenset(name_tokens + brand_tokens)
+            for token in tokens[product.id]:
+                keys.append((token, product.id))
+        keys.sort()
+
+        with self._lock:
+            self._keys = [key[0] for key in keys]
+            self._product_ids = [key[1] for key in keys]
+            self._payloads = payloads
+            self._tokens = tokens
+            self._cache.clear()
+            self.built_at = time.monotonic()
+        return self
+
+    def is_stale(self, generation):
+        return (
+            generation != self.generation
+            or time.monotonic() - self.built_at > self.MAX_AGE
+        )
+
+    def suggest(self, query, limit=10):
+        """Payload dicts for the best ``limit`` products matching ``query``"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        cache_key = (" ".join(tokens), limit)
+
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
+
+            first, rest = tokens[0], tokens[1:]
+            position = bisect.bisect_left(self._keys, first)
+            candidates = set()
+            while position < len(self._keys) and self._keys[position].startswith(first):
+                product_id = self._product_ids[position]
+                position += 1
+                if rest and not all(
+                    any(token.startswith(term) for token in self._tokens[product_id])
+                    for term in rest
+                ):
+                    continue
+                candidates.add(product_id)
+
+        # Same BM25 ordering as the catalog search (name hits first), from
+        # the in-memory index whatever backend serves search, so a keystroke
+        # never queries the database; scored outside the lock
+        relevance = get_product_index(self.generation).scores(query)
+        ranked = RankedResults({
+            product_id: relevance.get(product_id, 0.0) for product_id in candidates
+        }).top(limit)
+
+        with self._lock:
+            results = [self._payloads[product_id] for product_id in ranked]
+            self._cache[cache_key] = results
+            if len(self._cache) > self.MAX_CACHED_PREFIXES:
+                self._cache.popitem(last=False)
+        return results
+
+
+_typeahead = None
+_typeahead_lock = threading.Lock()
+
+
+def get_typeahead_index():
+    """Process-wide typeahead index, rebuilt when the catalog generation moves"""
+    global _typeahead
+    generation = cache.get(GENERATION_CACHE_KEY, 0)
+    with _typeahead_lock:
+        if _typeahead is None or _typeahead.is_stale(generation):
+            index = TypeaheadIndex().build()
+            index.generation = generation
+            _typeahead = index
+        return _typeahead
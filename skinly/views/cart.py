@@ -8,7 +8,11 @@ from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_POST
 
+from skinly.inventory import available_to_sell
 from skinly.models import CartItem, Cart, Product
+from skinly.recommendations import (
+    bought_together, recently_viewed_products, record_event, similar_products as precomputed_similar_products,
+)
 
 
 @login_required
@@ -16,14 +20,15 @@ def add_to_cart(request, product_id):
     """Add product to cart"""
     product = get_object_or_404(Product, id=product_id)
     quantity = int(request.POST.get('quantity', 1))
+    cart, created = Cart.objects.get_or_create(user=request.user)
 
-    if product.stock_quantity < quantity:
+    # Units held by other customers' checkouts are not for sale
+    if available_to_sell([product.id], cart).get(product.id, 0) < quantity:
         messages.error(request, 'Not enough stock available')
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'Not enough stock available'})
         return redirect('skinly:product_detail', product_id=product_id)
 
-    cart, created = Cart.objects.get_or_create(user=request.user)
     cart_item, created = CartItem.objects.get_or_create(
         cart=cart,
         product=product,
@@ -33,6 +38,7 @@ def add_to_cart(request, product_id):
     if not created:
         cart_item.quantity += quantity
         cart_item.save()
+    record_event(product.id, 'cart')
 
     messages.success(request, f'{product.name} added to cart')
 
@@ -47,10 +53,16 @@ def cart_view(request):
     """Shopping cart page"""
     try:
         cart = Cart.objects.get(user=request.user)
-        cart_items = cart.cart_items.all()
+        cart_items = list(cart.cart_items.all())
     except Cart.DoesNotExist:
         cart_items = []
 
+    # What each item can go up to: stock, summed over shards, less other carts' holds
+    if cart_items:
+        available = available_to_sell([item.product_id for item in cart_items], cart)
+        for item in cart_items:
+            item.available = available.get(item.product_id, 0)
+
     total = sum(item.product.price * item.quantity for item in cart_items)
 
     # Calculate shipping
@@ -68,26 +80,42 @@ def cart_view(request):
     # Get recommended products based on cart items
     recommended_products = []
     if cart_items:
-        # Get brands and product types from cart items
-        cart_brands = set(item.product.brand for item in cart_items)
-        cart_product_types = set(item.product.product_type for item in cart_items)
         cart_product_ids = set(item.product.id for item in cart_items)
 
-        # Find similar products by brand or product type
-        similar_products = Product.objects.filter(
-            Q(brand__in=cart_brands) | Q(product_type__in=cart_product_types),
-            stock_quantity__gt=0
-        ).exclude(id__in=cart_product_ids)
-
-        # Get user's skin type for better recommendations
-        if request.user.skin_type:
-            similar_products = similar_products.filter(
-                Q(skin_type_compatibility__isnull=True) |
-                Q(skin_type_compatibility=request.user.skin_type)
-            )
-
-        # Order by rating and limit to 4 products
-        recommended_products = similar_products.order_by('-rating', '?')[:4]
+        # Products often ordered with the cart items come first, then
+        # neighbours from the precomputed similarity table
+        recommended_products = bought_together(
+            cart_product_ids, limit=4, skin_type=request.user.skin_type
+        )
+        if len(recommended_products) < 4:
+            shown = cart_product_ids | set(product.id for product in recommended_products)
+            recommended_products += [
+                product for product in precomputed_similar_products(
+                    cart_product_ids, limit=8, skin_type=request.user.skin_type
+                )
+                if product.id not in shown
+            ][:4 - len(recommended_products)]
+
+        if not recommended_products:
+            # Get brands and product types from cart items
+            cart_brands = set(item.product.brand for item in cart_items)
+            cart_product_types = set(item.product.product_type for item in cart_items)
+
+            # Find similar products by brand or product type
+            similar_products = Product.objects.filter(
+                Q(brand__in=cart_brands) | Q(product_type__in=cart_product_types),
+                stock_quantity__gt=0
+            ).exclude(id__in=cart_product_ids)
+
+            # Get user's skin type for better recommendations
+            if request.user.skin_type:
+                similar_products = similar_products.filter(
+                    Q(skin_type_compatibility__isnull=True) |
+                    Q(skin_type_compatibility=request.user.skin_type)
+                )
+
+            # Order by rating and limit to 4 products
+            recommended_products = similar_products.order_by('-rating', 'id')[:4]
 
     context = {
         'cart_items': cart_items,
@@ -97,6 +125,9 @@ def cart_view(request):
         'final_total': final_total,
         'free_shipping_needed': free_shipping_needed,
         'recommended_products': recommended_products,
+        'recently_viewed': recently_viewed_products(
+            request, limit=4, exclude={item.product_id for item in cart_items}
+        ),
     }
     return render(request, 'skinly/cart.html', context)
 
@@ -111,7 +142,7 @@ def update_cart_item(request, item_id):
     if quantity <= 0:
         cart_item.delete()
         messages.success(request, 'Item removed from cart')
-    elif quantity <= cart_item.product.stock_quantity:
+    elif quantity <= available_to_sell([cart_item.product_id], cart_item.cart_id).get(cart_item.product_id, 0):
         cart_item.quantity = quantity
         cart_item.save()
         messages.success(request, 'Cart updated')
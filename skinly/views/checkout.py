@@ -1,8 +1,9 @@
-from decimal import Decimal
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect, render
-from skinly.models import Cart, ShippingAddress, Order, OrderItem, Payment, InventoryManager
+from skinly.checkout import EmptyCart, order_totals, place_order
+from skinly.inventory import InsufficientStock, reserve
+from skinly.models import Cart, ShippingAddress
 
 
 @login_required
@@ -10,7 +11,7 @@ def checkout_view(request):
     """Checkout page"""
     try:
         cart = Cart.objects.get(user=request.user)
-        cart_items = cart.cart_items.all()
+        cart_items = list(cart.cart_items.select_related('product'))
     except Cart.DoesNotExist:
         messages.error(request, 'Your cart is empty')
         return redirect('skinly:cart')
@@ -20,10 +21,7 @@ def checkout_view(request):
         return redirect('skinly:cart')
 
     # Calculate totals
-    subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    shipping = 0 if subtotal >= 50 else Decimal('5.99')
-    tax = subtotal * Decimal('0.08')
-    total = subtotal + shipping + tax
+    subtotal, shipping, tax, total = order_totals(cart_items)
 
     # Get user's shipping addresses
     shipping_addresses = request.user.shipping_addresses.all()
@@ -43,40 +41,30 @@ def checkout_view(request):
             messages.error(request, 'Invalid shipping address')
             return redirect('skinly:checkout')
 
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            total_price=total,
-            status='PENDING'
-        )
-
-        # Create payment record
-        Payment.objects.create(
-            order=order,
-            amount=total,
-            payment_method=payment_method,
-            status='PENDING'
-        )
-
-        # Create order items
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-
-            # Update product stock
-            cart_item.product.stock_quantity -= cart_item.quantity
-            cart_item.product.save()
-
-        # Clear cart
-        cart_items.delete()
+        # Stock, order, payment, items and cart in one transaction
+        try:
+            order = place_order(request.user, payment_method)
+        except EmptyCart:
+            messages.error(request, 'Your cart is empty')
+            return redirect('skinly:cart')
+        except InsufficientStock as error:
+            names = {item.product_id: item.product.name for item in cart_items}
+            short = ', '.join(names.get(product_id, str(product_id)) for product_id in error.shortages)
+            messages.error(request, f'Not enough stock available for {short}')
+            return redirect('skinly:cart')
 
         messages.success(request, f'Order #{order.id} placed successfully!')
         return redirect('skinly:order_detail', order_id=order.id)
 
+    # Hold the items while the customer fills in the form
+    try:
+        hold_expires_at = reserve(cart, {item.product_id: item.quantity for item in cart_items})
+    except InsufficientStock as error:
+        names = {item.product_id: item.product.name for item in cart_items}
+        short = ', '.join(names.get(product_id, str(product_id)) for product_id in error.shortages)
+        messages.error(request, f'Not enough stock available for {short}')
+        return redirect('skinly:cart')
+
     context = {
         'cart_items': cart_items,
         'subtotal': subtotal,
@@ -84,5 +72,6 @@ def checkout_view(request):
         'tax': tax,
         'total': total,
         'shipping_addresses': shipping_addresses,
+        'hold_expires_at': hold_expires_at,
     }
     return render(request, 'skinly/checkout.html', context)
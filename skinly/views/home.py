@@ -1,10 +1,11 @@
 from django.shortcuts import render, redirect
-from skinly.models import Product, RecommendationEngine
+from skinly.models import RecommendationEngine
+from skinly.recommendations import recently_viewed_products, trending_products
 
 
 def home(request):
     """Home page with featured products and recommendations"""
-    featured_products = Product.objects.filter(stock_quantity__gt=0)[:8]
+    featured_products = trending_products(8)
 
     recommendations = []
     if request.user.is_authenticated:
@@ -15,6 +16,7 @@ def home(request):
     context = {
         'featured_products': featured_products,
         'recommendations': recommendations,
+        'recently_viewed': recently_viewed_products(request, limit=4),
     }
     return render(request, 'skinly/home.html', context)
 
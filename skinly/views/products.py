@@ -1,11 +1,16 @@
 from decimal import Decimal
 
+from django.conf import settings
 from django.core.paginator import Paginator
 from django.db.models import Avg, Q
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
 
+from skinly.catalog import listing_ids
 from skinly.models import Product, Review, SkinType, ProductType, SearchEngine, Brand
+from skinly.pagination import CATALOG_ORDERINGS, CountedPaginator, InvalidCursor, KeysetPaginator
+from skinly.recommendations import bought_together, record_event, record_view, similar_products as precomputed_similar_products
+from skinly.search import correct_query, get_facet_counts, get_typeahead_index, hydrate_products
 
 
 def product_list(request):
@@ -15,6 +20,7 @@ def product_list(request):
 
     # Filter by query
     query = request.GET.get('q', '')
+    search_engine = None
     if query:
         search_engine = SearchEngine.objects.first()
         if search_engine:
@@ -52,24 +58,90 @@ def product_list(request):
     if max_price:
         products = products.filter(price__lte=Decimal(max_price))
 
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    current_filters = {
+        'brand': brand_filter,
+        'product_type': product_type_filter,
+        'skin_type': skin_type_filter,
+        'min_price': min_price,
+        'max_price': max_price,
+    }
+
+    # Facet counts for the current result set (one grouped query, cached)
+    facets = get_facet_counts(products, dict(current_filters, q=query))
+    brands = list(brands)
+    for brand in brands:
+        brand.product_count = facets['brand'].get(brand.id, 0)
+    product_types = [
+        (code, name, facets['product_type'].get(code, 0))
+        for code, name in ProductType.choices
+    ]
+    # Products without a skin type are compatible with every skin type
+    universal_count = facets['skin_type'].get(None, 0)
+    skin_types = [
+        (code, name, facets['skin_type'].get(code, 0) + universal_count)
+        for code, name in SkinType.choices
+    ]
+
+    # The facet counts already total the result set, so no COUNT(*) is needed
+    result_count = sum(facets['brand'].values())
+    sort = request.GET.get('sort', '')
+    ordering = CATALOG_ORDERINGS.get(sort, CATALOG_ORDERINGS[''])
+
+    # Rank search results by relevance; only ids come back from the database
+    if search_engine:
+        products = search_engine.rank(query, products)
+    else:
+        products = products.select_related('brand').order_by(*ordering)
+
+    # Pagination: keyset cursors for the plain catalog when enabled, numbered pages otherwise
+    cursor_pagination = not search_engine and (
+        settings.CATALOG_PAGINATION == 'cursor' or 'cursor' in request.GET
+    )
+    previous_url = next_url = None
+    if cursor_pagination:
+        paginator = KeysetPaginator(products, 12, ordering)
+        try:
+            page_obj = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            page_obj = paginator.page()
+        params = request.GET.copy()
+        params.pop('page', None)
+        if page_obj.has_previous():
+            params['cursor'] = page_obj.previous_cursor
+            previous_url = '?' + params.urlencode()
+        if page_obj.has_next():
+            params['cursor'] = page_obj.next_cursor
+            next_url = '?' + params.urlencode()
+    else:
+        page_number = request.GET.get('page')
+        # The plain catalog is paged over ids sorted in the mapped snapshot,
+        # so only the page's rows are read from the database
+        listed = None if query else listing_ids(ordering, **current_filters)
+        if listed is not None:
+            paginator = Paginator(listed, 12)
+            page_obj = paginator.get_page(page_number)
+            page_obj.object_list = hydrate_products(page_obj.object_list.tolist())
+            result_count = paginator.count
+        else:
+            paginator = CountedPaginator(products, 12, count=None if search_engine else result_count)
+            page_obj = paginator.get_page(page_number)
+
+    # Hydrate just the current page of ranked ids
+    if search_engine:
+        page_obj.object_list = hydrate_products(list(page_obj.object_list))
 
     context = {
         'page_obj': page_obj,
         'brands': brands,
-        'product_types': ProductType.choices,
-        'skin_types': SkinType.choices,
+        'product_types': product_types,
+        'skin_types': skin_types,
+        'facets': facets,
+        'result_count': result_count,
+        'cursor_pagination': cursor_pagination,
+        'previous_url': previous_url,
+        'next_url': next_url,
         'query': query,
-        'current_filters': {
-            'brand': brand_filter,
-            'product_type': product_type_filter,
-            'skin_type': skin_type_filter,
-            'min_price': min_price,
-            'max_price': max_price,
-        }
+        'current_filters': current_filters,
     }
     return render(request, 'skinly/product_list.html', context)
 
@@ -78,6 +150,8 @@ def product_detail(request, product_id):
     """Product detail page"""
     product = get_object_or_404(Product, id=product_id)
     reviews = Review.objects.filter(product=product).order_by('-created_at')
+    record_event(product.id, 'view')
+    record_view(request, product.id)
 
     # Calculate average rating
     avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
@@ -90,11 +164,16 @@ def product_detail(request, product_id):
         except Review.DoesNotExist:
             pass
 
-    # Get similar products
-    similar_products = Product.objects.filter(
-        Q(brand=product.brand) | Q(product_type=product.product_type),
-        stock_quantity__gt=0
-    ).exclude(id=product.id)[:4]
+    # Get similar products from the precomputed neighbour table
+    similar_products = precomputed_similar_products([product.id], limit=4)
+    if not similar_products:
+        similar_products = Product.objects.filter(
+            Q(brand=product.brand) | Q(product_type=product.product_type),
+            stock_quantity__gt=0
+        ).exclude(id=product.id)[:4]
+
+    # Basket partners from order history
+    bought_with = bought_together([product.id], limit=4)
 
     context = {
         'product': product,
@@ -102,34 +181,23 @@ def product_detail(request, product_id):
         'avg_rating': round(avg_rating, 1),
         'user_review': user_review,
         'similar_products': similar_products,
+        'bought_together': bought_with,
     }
     return render(request, 'skinly/product_detail.html', context)
 
 
 def search_products(request):
-    """AJAX search for products"""
+    """AJAX search for products, answered from the in-memory typeahead index"""
     query = request.GET.get('q', '')
 
     if len(query) < 2:
         return JsonResponse({'products': []})
 
-    search_engine = SearchEngine.objects.first()
-    if search_engine:
-        products = search_engine.search(query)[:10]
-    else:
-        products = Product.objects.filter(
-            Q(name__icontains=query) | Q(brand__name__icontains=query),
-            stock_quantity__gt=0
-        )[:10]
-
-    product_data = []
-    for product in products:
-        product_data.append({
-            'id': product.id,
-            'name': product.name,
-            'brand': product.brand.name,
-            'price': float(product.price),
-            'image_url': '/static/images/placeholder.jpg',  # Add image field to model later
-        })
-
-    return JsonResponse({'products': product_data})
+    typeahead = get_typeahead_index()
+    suggestions = typeahead.suggest(query, limit=10)
+    if not suggestions:
+        corrected = correct_query(query)
+        if corrected:
+            suggestions = typeahead.suggest(corrected, limit=10)
+
+    return JsonResponse({'products': suggestions})
@@ -1,11 +1,12 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
-from django.db.models import Avg
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect
 from django.views.decorators.http import require_POST
 
-from skinly.models import Product, Review, RecommendationEngine
+from skinly.jobs import enqueue
+from skinly.models import Product, Review
 
 
 @login_required
@@ -16,25 +17,19 @@ def add_review(request, product_id):
     rating = int(request.POST.get('rating', 5))
     comment = request.POST.get('comment', '')
 
-    review, created = Review.objects.update_or_create(
-        user=request.user,
-        product=product,
-        defaults={
-            'rating': rating,
-            'comment': comment,
-        }
-    )
-
-    # Update product rating
-    avg_rating = Review.objects.filter(product=product).aggregate(Avg('rating'))['rating__avg']
-    product.rating = avg_rating or 0
-    product.save()
-
-    # Update taste profile with recommendation engine
-    engine = RecommendationEngine.objects.first()
-    if engine:
-        feedback = 'positive' if rating >= 4 else 'negative'
-        engine.update_taste_profile(request.user, product, feedback)
+    # The review and its job commit together, so neither is left without the other
+    with transaction.atomic():
+        review, created = Review.objects.update_or_create(
+            user=request.user,
+            product=product,
+            defaults={
+                'rating': rating,
+                'comment': comment,
+            }
+        )
+
+        # Product rating and taste profile are updated by `manage.py run_jobs`
+        enqueue('review', key=request.user.id, product_id=product.id, rating=rating)
 
     action = 'updated' if not created else 'added'
     messages.success(request, f'Review {action} successfully')
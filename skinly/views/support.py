@@ -89,8 +89,8 @@ def profile_view(request):
         preferred_finish_types = request.POST.getlist('preferred_finish_types')
         preferred_colors = request.POST.getlist('preferred_colors')
         
-        taste_profile.preferred_product_types = ','.join(preferred_product_types)
-        taste_profile.preferred_finish_types = ','.join(preferred_finish_types)
+        taste_profile.preferred_product_types = preferred_product_types
+        taste_profile.preferred_finish_types = preferred_finish_types
         taste_profile.save()
         
         # Update preferred colors
@@ -117,10 +117,8 @@ def profile_view(request):
     current_product_types = []
     current_finish_types = []
     if taste_profile:
-        if taste_profile.preferred_product_types:
-            current_product_types = taste_profile.preferred_product_types.split(',')
-        if taste_profile.preferred_finish_types:
-            current_finish_types = taste_profile.preferred_finish_types.split(',')
+        current_product_types = taste_profile.preferred_product_types
+        current_finish_types = taste_profile.preferred_finish_types
     
     context = {
         'skin_tones': SkinTone.choices,
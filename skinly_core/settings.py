@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 
@@ -86,6 +87,15 @@ DATABASES = {
     }
 }
 
+# A copy of the data for `manage.py evaluate_recommendations --database
+# evaluation`, which rewinds the database it runs on, e.g.
+# EVALUATION_DATABASE=evaluation.sqlite3 after `cp db.sqlite3 evaluation.sqlite3`
+if os.environ.get("EVALUATION_DATABASE"):
+    DATABASES["evaluation"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["EVALUATION_DATABASE"],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -138,6 +148,53 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Product search backend:
+#   skinly.search.backends.MemoryBackend           in-process inverted index
+#   skinly.search.backends.SQLiteFTSBackend        FTS5 table (SQLite only)
+#   skinly.search.backends.PostgresFullTextBackend tsvector + GIN (Postgres only)
+SEARCH_BACKEND = "skinly.search.backends.MemoryBackend"
+
+# Catalog pagination: "offset" for numbered pages, "cursor" for keyset
+# (previous/next) pages that stay fast however deep the shopper goes.
+# A ?cursor= parameter switches a single request to cursor mode.
+CATALOG_PAGINATION = "offset"
+
+# Columnar catalog snapshot written by `manage.py build_catalog_snapshot`
+# and memory-mapped read-only by every worker
+CATALOG_SNAPSHOT_DIR = BASE_DIR / "var" / "catalog"
+
+# Saved state of the offline recommendation jobs (order co-occurrence counts)
+RECOMMENDATION_STATE_DIR = BASE_DIR / "var" / "recommendations"
+
+# Shared cache. Recommendation versions, the search index generation,
+# facet counts and signed-in visitors' recently viewed products are kept
+# here, so every web worker, the job worker and the management commands
+# must see the same cache: a per-process LocMemCache would keep their
+# invalidations to themselves. Set REDIS_URL to use Redis (needs the
+# `redis` package); otherwise the `skinly_cache` table, created by
+# `manage.py migrate` (or `manage.py createcachetable`). Entries never
+# expire by default, as the version counters must not; every other key is
+# set with its own timeout.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "TIMEOUT": None,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "skinly_cache",
+            "TIMEOUT": None,
+            # The default of 300 entries would cull version counters along
+            # with everything else once there are a few hundred visitors
+            "OPTIONS": {"MAX_ENTRIES": 1000000},
+        }
+    }
+
 # Login/Logout URLs
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'